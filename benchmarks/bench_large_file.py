@@ -0,0 +1,100 @@
+"""
+Peak memory check for the large-file (disk-backed) unlock path.
+
+Builds an encrypted PDF made of a few big streams, then unlocks it in a
+fresh subprocess with both the in-memory path (unlock_pdf) and the
+disk-backed path (unlock_pdf_file), reporting peak RSS growth as a
+multiple of the largest single stream. Exits non-zero if the disk-backed
+path goes over --max-ratio, so it can be used as a regression check:
+
+    python benchmarks/bench_large_file.py --streams 8 --stream-mb 16
+
+tests/test_large_file.py runs a smaller disk-backed check with the test suite.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = r"""
+import io, resource, sys
+sys.path.insert(0, {root!r})
+import unlocker
+# unlocker defers these imports to the first unlock; loading them here keeps
+# their fixed cost out of the measured growth
+import pypdf, optimize, triage
+
+def peak_mb():
+    # VmHWM resets on exec; ru_maxrss can carry over the parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+before = peak_mb()
+if {mode!r} == "memory":
+    with open({src!r}, "rb") as f:
+        data = f.read()
+    out, ok, msg = unlocker.unlock_pdf(io.BytesIO(data), "secret")
+else:
+    ok, msg = unlocker.unlock_pdf_file({src!r}, {dst!r}, "secret")
+assert ok, msg
+print(peak_mb() - before)
+"""
+
+def make_large_pdf(path: str, streams: int, stream_mb: int) -> None:
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, NameObject
+
+    writer = PdfWriter()
+    for i in range(streams):
+        page = writer.add_blank_page(612, 792)
+        content = DecodedStreamObject()
+        # Incompressible data, like a scanned image
+        content.set_data(os.urandom(stream_mb * 1024 * 1024))
+        page[NameObject("/Contents")] = writer._add_object(content)
+    writer.encrypt("secret", algorithm="AES-256")
+    with open(path, "wb") as f:
+        writer.write(f)
+
+def measure(mode: str, src: str, dst: str) -> float:
+    code = CHILD.format(root=ROOT, mode=mode, src=src, dst=dst)
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=8)
+    parser.add_argument("--stream-mb", type=int, default=16)
+    parser.add_argument("--max-ratio", type=float, default=5.0,
+                        help="Allowed peak RSS growth for the disk-backed path, in multiples of the largest stream")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "large.pdf")
+        dst = os.path.join(tmp, "unlocked.pdf")
+        make_large_pdf(src, args.streams, args.stream_mb)
+        file_mb = os.path.getsize(src) / 1024 / 1024
+        print(f"input: {file_mb:.0f} MB, largest stream: {args.stream_mb} MB")
+
+        ratio = None
+        for mode in ("memory", "disk"):
+            growth = measure(mode, src, dst)
+            ratio = growth / args.stream_mb
+            print(f"{mode:>6}: peak RSS +{growth:.0f} MB ({ratio:.1f}x largest stream)")
+
+    if ratio > args.max_ratio:
+        print(f"FAIL: disk-backed path used {ratio:.1f}x the largest stream (limit {args.max_ratio}x)")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
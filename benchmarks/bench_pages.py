@@ -0,0 +1,69 @@
+"""
+Time unlocking a few pages of a long document against unlocking all of it,
+and splitting it into parts with one and with several workers.
+
+    python benchmarks/bench_pages.py --pages 3000 --select 1-10 --split-every 100 --jobs 4
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_unlock_modes import make_encrypted_pdf
+from pages import format_page_ranges
+from unlocker import split_parts, unlock_files, unlock_pdf
+
+def best_of(repeat: int, fn) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=3000, help="Pages in the generated document")
+    parser.add_argument("--select", default="1-10", help="Page selection to unlock")
+    parser.add_argument("--split-every", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--algorithm", default="AES-256")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_encrypted_pdf(args.pages, args.algorithm)
+    print(f"{args.pages} pages, {len(data) / 1e6:.1f} MB, {args.algorithm}")
+
+    def unlock(pages=None):
+        out, success, message = unlock_pdf(io.BytesIO(data), "secret", pages=pages)
+        if not success:
+            raise SystemExit(f"unlock failed: {message}")
+
+    whole = best_of(args.repeat, unlock)
+    selected = best_of(args.repeat, lambda: unlock(args.select))
+    print(f"{'whole document':>30} {whole:>8.3f}s")
+    print(f"{'pages ' + args.select:>30} {selected:>8.3f}s  ({whole / selected:.0f}x faster)")
+
+    tmp = tempfile.mkdtemp(prefix="bench_pages_")
+    try:
+        src = os.path.join(tmp, "in.pdf")
+        with open(src, "wb") as f:
+            f.write(data)
+        parts = split_parts(src, "secret", args.split_every)
+        jobs = [(src, os.path.join(tmp, f"part_{index}.pdf"), "secret") for index in range(len(parts))]
+        pages = [format_page_ranges(part) for part in parts]
+        for workers in sorted({1, args.jobs}):
+            elapsed = best_of(args.repeat, lambda: unlock_files(jobs, max_workers=workers, pages=pages))
+            label = f"split {len(parts)} parts, {workers} worker(s)"
+            print(f"{label:>30} {elapsed:>8.3f}s")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Time unlocking and re-encrypting a document in one pass (pipeline stages)
+against unlocking it and then re-encrypting the unlocked copy with a second
+pypdf read and write, and merging several documents with the stages.
+
+    python benchmarks/bench_pipeline.py --pages 2000 --files 4
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_unlock_modes import make_encrypted_pdf
+from pipeline import Pipeline, merge_pdfs
+from unlocker import unlock_pdf
+
+def best_of(repeat: int, fn) -> float:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=2000, help="Pages in the generated document")
+    parser.add_argument("--files", type=int, default=4, help="Documents to merge")
+    parser.add_argument("--algorithm", default="AES-256")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from pypdf import PdfReader, PdfWriter
+
+    data = make_encrypted_pdf(args.pages, args.algorithm)
+    pipeline = Pipeline(metadata={"Title": "Benchmark"}, password="company")
+    print(f"{args.pages} pages, {len(data) / 1e6:.1f} MB, {args.algorithm}")
+
+    def single_pass():
+        out, success, message = unlock_pdf(io.BytesIO(data), "secret", pipeline=pipeline)
+        if not success:
+            raise SystemExit(f"unlock failed: {message}")
+
+    def two_passes():
+        out, success, message = unlock_pdf(io.BytesIO(data), "secret")
+        if not success:
+            raise SystemExit(f"unlock failed: {message}")
+        writer = PdfWriter(clone_from=PdfReader(io.BytesIO(out)))
+        writer.add_metadata({"/Title": "Benchmark"})
+        writer.encrypt("company", algorithm="AES-256")
+        writer.write(io.BytesIO())
+
+    one = best_of(args.repeat, single_pass)
+    two = best_of(args.repeat, two_passes)
+    print(f"{'unlock + stages, one pass':>30} {one:>8.3f}s")
+    print(f"{'unlock, then re-encrypt':>30} {two:>8.3f}s  ({two / one:.1f}x slower)")
+
+    def merge():
+        sources = [(f"doc{index}.pdf", io.BytesIO(data), "secret", None) for index in range(args.files)]
+        success, message = merge_pdfs(sources, io.BytesIO(), pipeline=pipeline)
+        if not success:
+            raise SystemExit(f"merge failed: {message}")
+
+    label = f"merge {args.files} docs + stages"
+    print(f"{label:>30} {best_of(args.repeat, merge):>8.3f}s")
+
+if __name__ == "__main__":
+    main()
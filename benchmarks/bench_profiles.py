@@ -0,0 +1,46 @@
+"""
+Compare output size and time of the "fast" and "compact" output profiles
+over the synthetic corpus, at several compression levels.
+
+    python benchmarks/bench_profiles.py --levels 1 6 9 --workers 1 4
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import PASSWORD, build_pdf, default_corpus
+from metrics import FileMetrics
+from unlocker import DEFAULT_LEVEL, unlock_pdf
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=("quick", "full"), default="quick")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    args = parser.parse_args()
+
+    runs = [("fast", None, 1)] + [("compact", level, workers) for level in args.levels for workers in args.workers]
+    print(f"{'file':32} {'profile':>8} {'lvl':>3} {'wrk':>3} {'in KB':>8} {'out KB':>8} {'ratio':>6} {'opt ms':>8} {'total ms':>8}")
+    for spec in default_corpus(args.size):
+        data = build_pdf(spec)
+        for profile, level, workers in runs:
+            metrics = FileMetrics()
+            started = time.perf_counter()
+            out, success, message = unlock_pdf(
+                io.BytesIO(data), PASSWORD, metrics=metrics, profile=profile, level=level or DEFAULT_LEVEL, workers=workers
+            )
+            elapsed = time.perf_counter() - started
+            if not success:
+                raise SystemExit(f"{spec.name} failed with {profile}: {message}")
+            print(
+                f"{spec.name:32} {profile:>8} {level or '-':>3} {workers:>3} {len(data) / 1024:>8.1f} "
+                f"{len(out) / 1024:>8.1f} {len(out) / len(data):>6.2f} "
+                f"{metrics.stages.get('optimize', 0.0) * 1000:>8.1f} {elapsed * 1000:>8.1f}"
+            )
+
+if __name__ == "__main__":
+    main()
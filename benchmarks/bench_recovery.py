@@ -0,0 +1,41 @@
+"""
+Candidates per second of password recovery per encryption algorithm, with
+one worker and with several. The password is never in the keyspace, so every
+candidate is checked.
+
+    python benchmarks/bench_recovery.py --mask "?d?d?d?d" --jobs 1 4
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_unlock_modes import make_encrypted_pdf
+from recovery import build_keyspace, recover_password
+from triage import triage_pdf
+
+ALGORITHMS = ("RC4-40", "RC4-128", "AES-128", "AES-256")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mask", default="?d?d?d?d")
+    parser.add_argument("--algorithms", nargs="+", default=list(ALGORITHMS))
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    keyspace = build_keyspace(mask=args.mask)
+    print(f"{keyspace.size:,} candidates per run")
+    print(f"{'algorithm':>10} {'workers':>8} {'seconds':>8} {'cand/s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for algorithm in args.algorithms:
+            params = triage_pdf(io.BytesIO(make_encrypted_pdf(1, algorithm, "not-in-keyspace"))).params
+            for workers in args.jobs:
+                state_path = os.path.join(tmp, f"{algorithm}-{workers}.json")
+                result = recover_password(params, keyspace, max_workers=workers, state_path=state_path, resume=False)
+                print(f"{algorithm:>10} {workers:>8} {result.seconds:>8.2f} {result.checked / result.seconds:>10,.0f}")
+
+if __name__ == "__main__":
+    main()
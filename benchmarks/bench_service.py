@@ -0,0 +1,95 @@
+"""
+Load test for the HTTP unlock API (cli.py serve).
+
+Sends single-file unlock requests from concurrent clients for a fixed time
+and reports completed requests/sec, p50/p99 latency and how many requests
+were turned away with 429. Clients that get a 429 wait for Retry-After
+(capped by --max-backoff) before trying again, like a well-behaved caller.
+
+    python cli.py serve --port 8080 --jobs 4 -q &
+    python benchmarks/bench_service.py --url http://127.0.0.1:8080 --clients 1 8 32
+"""
+import argparse
+import http.client
+import os
+import sys
+import threading
+import time
+from typing import List
+from urllib.parse import urlparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench_suite import percentile
+from corpus import PASSWORD, CorpusSpec, build_pdf
+
+def run_clients(url: str, data: bytes, clients: int, seconds: float, max_backoff: float) -> dict:
+    target = urlparse(url)
+    deadline = time.monotonic() + seconds
+    latencies: List[float] = []
+    counts = {"ok": 0, "busy": 0, "error": 0}
+    lock = threading.Lock()
+
+    def client() -> None:
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=120)
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request("POST", "/unlock", body=data, headers={"X-PDF-Password": PASSWORD})
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=120)
+                with lock:
+                    counts["error"] += 1
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.status == 200:
+                    counts["ok"] += 1
+                    latencies.append(elapsed)
+                elif response.status == 429:
+                    counts["busy"] += 1
+                else:
+                    counts["error"] += 1
+            if response.status == 429:
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=120)
+                time.sleep(min(max_backoff, float(response.getheader("Retry-After") or 1)))
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    return {
+        "clients": clients,
+        "requests_per_sec": round(counts["ok"] / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        **counts,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--algorithm", default="AES-256")
+    parser.add_argument("--max-backoff", type=float, default=1.0, help="Longest wait after a 429 (default: 1)")
+    args = parser.parse_args()
+
+    data = build_pdf(CorpusSpec("service", args.algorithm, args.pages, "text", 4, False))
+    print(f"{'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'ok':>6} {'429':>6} {'errors':>6}")
+    for clients in args.clients:
+        r = run_clients(args.url, data, clients, args.seconds, args.max_backoff)
+        print(f"{r['clients']:>7} {r['requests_per_sec']:>8} {r['p50_ms']:>8} {r['p99_ms']:>8} {r['ok']:>6} {r['busy']:>6} {r['error']:>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Time to first paint and per-rerun overhead of the Streamlit app.
+
+Each sample runs main.py with Streamlit's AppTest in a fresh subprocess, so
+the app's imports are cold as they are after a server restart (Streamlit's
+own import is not counted). For each sample it reports:
+
+- first run: the app's imports plus one full script run with nothing
+  uploaded, i.e. the work before the first page is complete
+- rerun p50/p99: later runs in the same session, the overhead every widget
+  interaction pays
+- inline KB: markdown/HTML the script sends per run; images embedded as
+  base64 show up here
+
+To see a change's effect, compare with an older revision. The revision is
+exported with git archive into a temporary directory:
+
+    python benchmarks/bench_startup.py --rev HEAD~1 --samples 5 --reruns 20
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from bench_suite import percentile
+
+def run_child(app_dir: str, reruns: int) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    app = AppTest.from_file(os.path.join(app_dir, "main.py"), default_timeout=120)
+    started = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - started
+    if app.exception:
+        raise SystemExit(f"{app_dir}/main.py raised: {app.exception[0].message}")
+    inline = sum(len(element.value) for element in app.markdown)
+
+    times = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        times.append(time.perf_counter() - started)
+    return {"first_run": first, "reruns": times, "inline_bytes": inline}
+
+def measure(app_dir: str, samples: int, reruns: int) -> dict:
+    firsts, times, inline = [], [], 0
+    for _ in range(samples):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", app_dir, "--reruns", str(reruns)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        firsts.append(result["first_run"])
+        times.extend(result["reruns"])
+        inline = result["inline_bytes"]
+    return {
+        "first_run_ms": round(statistics.median(firsts) * 1000, 1),
+        "rerun_p50_ms": round(percentile(times, 50) * 1000, 1),
+        "rerun_p99_ms": round(percentile(times, 99) * 1000, 1),
+        "inline_kb": round(inline / 1024, 1),
+    }
+
+def export_revision(rev: str, directory: str) -> str:
+    archive = subprocess.run(["git", "-C", ROOT, "archive", rev], check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+    return directory
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rev", help="Also measure this git revision, e.g. HEAD~1")
+    parser.add_argument("--samples", type=int, default=3, help="Cold starts per version (default: 3)")
+    parser.add_argument("--reruns", type=int, default=10, help="Reruns per cold start (default: 10)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.reruns)))
+        return
+
+    print(f"{'version':12} {'first run ms':>12} {'rerun p50 ms':>12} {'rerun p99 ms':>12} {'inline KB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        versions = [("working tree", ROOT)]
+        if args.rev:
+            versions.insert(0, (args.rev, export_revision(args.rev, tmp)))
+        for name, app_dir in versions:
+            r = measure(app_dir, args.samples, args.reruns)
+            print(f"{name:12} {r['first_run_ms']:>12} {r['rerun_p50_ms']:>12} {r['rerun_p99_ms']:>12} {r['inline_kb']:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Throughput benchmark for unlock_pdf and create_zip_file.
+
+Runs each target in a fresh subprocess over the synthetic corpus from
+corpus.py and reports files/sec, MB/sec, p50/p99 latency and peak memory,
+overall and per encryption algorithm. Results can be saved as a baseline
+and later runs compared against it, e.g. before and after a pypdf upgrade:
+
+    python benchmarks/bench_suite.py --save-baseline
+    pip install -U pypdf
+    python benchmarks/bench_suite.py          # exits 1 on a regression
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+TARGETS = ("unlock_pdf", "create_zip_file")
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+
+# Metric -> True if bigger is better
+METRICS = {
+    "files_per_sec": True,
+    "mb_per_sec": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_mb": False,
+}
+
+def peak_rss_mb() -> float:
+    # VmHWM resets on exec; ru_maxrss can carry over the parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(name: str, latencies: List[float], total_bytes: int, peak: float) -> dict:
+    total = sum(latencies)
+    return {
+        "name": name,
+        "files": len(latencies),
+        "mb": round(total_bytes / 1e6, 3),
+        "files_per_sec": round(len(latencies) / total, 2) if total else 0.0,
+        "mb_per_sec": round(total_bytes / 1e6 / total, 2) if total else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "peak_rss_mb": round(peak, 1),
+    }
+
+def run_child(target: str, corpus_dir: str, repeat: int) -> List[dict]:
+    from unlocker import create_zip_file, unlock_pdf
+
+    with open(os.path.join(corpus_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    inputs = []
+    for entry in manifest:
+        with open(os.path.join(corpus_dir, entry["file"]), "rb") as f:
+            inputs.append((entry, f.read()))
+
+    base = peak_rss_mb()
+    results = []
+    if target == "unlock_pdf":
+        by_algorithm: Dict[str, list] = {}
+        all_latencies, all_bytes = [], 0
+        for entry, data in inputs:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                _, success, message = unlock_pdf(io.BytesIO(data), entry["password"])
+                elapsed = time.perf_counter() - started
+                if not success:
+                    raise SystemExit(f"{entry['name']}: {message}")
+                latencies, nbytes = by_algorithm.setdefault(entry["algorithm"], [[], 0])
+                latencies.append(elapsed)
+                by_algorithm[entry["algorithm"]][1] = nbytes + len(data)
+                all_latencies.append(elapsed)
+                all_bytes += len(data)
+        peak = peak_rss_mb() - base
+        results.append(summarize("unlock_pdf", all_latencies, all_bytes, peak))
+        for algorithm, (latencies, nbytes) in sorted(by_algorithm.items()):
+            results.append(summarize(f"unlock_pdf[{algorithm}]", latencies, nbytes, peak))
+    else:
+        unlocked = []
+        for entry, data in inputs:
+            pdf_bytes, success, message = unlock_pdf(io.BytesIO(data), entry["password"])
+            if not success:
+                raise SystemExit(f"{entry['name']}: {message}")
+            unlocked.append((f"unlocked_{entry['file']}", pdf_bytes))
+        total_bytes = sum(len(pdf_bytes) for _, pdf_bytes in unlocked)
+        base = peak_rss_mb()
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            create_zip_file(unlocked)
+            latencies.append(time.perf_counter() - started)
+        # One "file" per archive built
+        results.append(summarize("create_zip_file", latencies, total_bytes * repeat, peak_rss_mb() - base))
+    return results
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """
+    Returns: one message per metric that got worse by more than tolerance
+    """
+    previous = {row["name"]: row for row in baseline}
+    regressions = []
+    for row in results:
+        old = previous.get(row["name"])
+        if old is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            before, after = old.get(metric), row.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"{row['name']} {metric}: {before} -> {after} ({change:+.0%})")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-dir", help="Where to keep the generated corpus (default: a temporary directory)")
+    parser.add_argument("--size", choices=("quick", "full"), default="quick")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--target", choices=TARGETS, action="append", help="Only run these targets")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Save this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before failing (default: 0.25)")
+    parser.add_argument("--output", help="Also write this run's results as JSON")
+    parser.add_argument("--child", choices=TARGETS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        json.dump(run_child(args.child, args.corpus_dir, args.repeat), sys.stdout)
+        return 0
+
+    from pypdf import __version__ as pypdf_version
+    from corpus import default_corpus, generate_corpus
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus_dir or tmp
+        manifest = generate_corpus(corpus_dir, default_corpus(args.size))
+        print(f"corpus: {len(manifest)} files, {sum(e['bytes'] for e in manifest) / 1e6:.1f} MB in {corpus_dir}")
+
+        results = []
+        for target in args.target or TARGETS:
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", target, "--corpus-dir", corpus_dir, "--repeat", str(args.repeat)],
+                check=True, capture_output=True, text=True,
+            )
+            results.extend(json.loads(out.stdout))
+
+    print(f"{'target':28} {'files/s':>9} {'MB/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>8}")
+    for row in results:
+        print(f"{row['name']:28} {row['files_per_sec']:>9} {row['mb_per_sec']:>8} "
+              f"{row['p50_ms']:>9} {row['p99_ms']:>9} {row['peak_rss_mb']:>8}")
+
+    run = {
+        "pypdf": pypdf_version,
+        "python": platform.python_version(),
+        "size": args.size,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+
+    status = 0
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("size") != args.size:
+            print(f"baseline was recorded with --size {baseline.get('size')}; not comparing")
+        else:
+            regressions = compare(results, baseline["results"], args.tolerance)
+            print(f"compared with baseline (pypdf {baseline.get('pypdf')} -> {pypdf_version})")
+            for message in regressions:
+                print(f"REGRESSION {message}")
+            status = 1 if regressions else 0
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Compare the "fast" and "rebuild" unlock modes on large page counts.
+
+    python benchmarks/bench_unlock_modes.py --pages 500 2000 --repeat 3
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, NameObject
+
+from unlocker import UNLOCK_MODES, unlock_pdf
+
+def make_encrypted_pdf(pages: int, algorithm: str, password: str = "secret") -> bytes:
+    writer = PdfWriter()
+    for i in range(pages):
+        page = writer.add_blank_page(612, 792)
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 72 720 Td (Page {i}) Tj ET\n".encode() * 20)
+        page[NameObject("/Contents")] = writer._add_object(content)
+        if i % 50 == 0:
+            writer.add_outline_item(f"Page {i}", i)
+    writer.encrypt(password, algorithm=algorithm)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 1000, 2000])
+    parser.add_argument("--algorithm", default="AES-256")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'mode':>8} {'best s':>8} {'pages/s':>9} {'out MB':>7}")
+    for pages in args.pages:
+        data = make_encrypted_pdf(pages, args.algorithm)
+        for mode in UNLOCK_MODES:
+            best = None
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                out, success, message = unlock_pdf(io.BytesIO(data), "secret", mode=mode)
+                elapsed = time.perf_counter() - started
+                if not success:
+                    raise SystemExit(f"{mode} failed on {pages} pages: {message}")
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{pages:>6} {mode:>8} {best:>8.3f} {pages / best:>9.0f} {len(out) / 1e6:>7.2f}")
+
+if __name__ == "__main__":
+    main()
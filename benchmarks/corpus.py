@@ -0,0 +1,227 @@
+"""
+Synthetic encrypted-PDF corpus for benchmarks.
+
+Generates PDFs with pypdf across the main encryption algorithms, page
+counts, stream sizes, text-heavy or image-heavy content, and with or
+without object streams:
+
+    python benchmarks/corpus.py benchmarks/corpus --size full
+"""
+import argparse
+import io
+import json
+import os
+import random
+import zlib
+from dataclasses import asdict, dataclass
+from typing import List
+
+from pypdf import PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
+
+ALGORITHMS = ("RC4-40", "RC4-128", "AES-128", "AES-256")
+PASSWORD = "benchmark"
+
+@dataclass
+class CorpusSpec:
+    name: str
+    algorithm: str
+    pages: int
+    content: str          # "text" or "image"
+    stream_kb: int        # size of each page's main stream before compression
+    object_streams: bool
+
+def default_corpus(size: str = "quick") -> List[CorpusSpec]:
+    """
+    "quick" runs in seconds; "full" adds 1,000 and 5,000 page documents
+    and larger image streams.
+    """
+    page_counts = [1, 10, 100] if size == "quick" else [1, 10, 100, 1000, 5000]
+    specs = []
+    for algorithm in ALGORITHMS:
+        for pages in page_counts:
+            specs.append(CorpusSpec(f"{algorithm}-text-{pages}p", algorithm, pages, "text", 4, False))
+        specs.append(CorpusSpec(f"{algorithm}-text-{page_counts[-1]}p-objstm", algorithm, page_counts[-1], "text", 4, True))
+        image_kb = [64] if size == "quick" else [64, 1024]
+        for kb in image_kb:
+            specs.append(CorpusSpec(f"{algorithm}-image-10p-{kb}k", algorithm, 10, "image", kb, False))
+    return specs
+
+def _text_content(rng: random.Random, size: int) -> bytes:
+    words = [b"statement", b"balance", b"account", b"total", b"payment", b"interest", b"period"]
+    lines = []
+    total = 0
+    y = 760
+    while total < size:
+        line = b"BT /F1 10 Tf 40 %d Td (%s) Tj ET\n" % (y, b" ".join(rng.choice(words) for _ in range(8)))
+        lines.append(line)
+        total += len(line)
+        y = 760 if y < 40 else y - 12
+    return b"".join(lines)
+
+def _flate(data: bytes, extra: dict = None) -> StreamObject:
+    stream = StreamObject()
+    stream._data = zlib.compress(data)
+    stream[NameObject("/Filter")] = NameObject("/FlateDecode")
+    for key, value in (extra or {}).items():
+        stream[NameObject(key)] = value
+    return stream
+
+def build_writer(spec: CorpusSpec, seed: int = 0) -> PdfWriter:
+    rng = random.Random(seed)
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for i in range(spec.pages):
+        page = writer.add_blank_page(612, 792)
+        resources = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+        if spec.content == "image":
+            side = max(1, int((spec.stream_kb * 1024 / 3) ** 0.5))
+            # Incompressible pixels, like a scanned page
+            image = StreamObject()
+            image._data = rng.randbytes(side * side * 3)
+            image.update({
+                NameObject("/Type"): NameObject("/XObject"),
+                NameObject("/Subtype"): NameObject("/Image"),
+                NameObject("/Width"): NumberObject(side),
+                NameObject("/Height"): NumberObject(side),
+                NameObject("/ColorSpace"): NameObject("/DeviceRGB"),
+                NameObject("/BitsPerComponent"): NumberObject(8),
+            })
+            resources[NameObject("/XObject")] = DictionaryObject({NameObject("/Im0"): writer._add_object(image)})
+            data = b"q 572 0 0 752 20 20 cm /Im0 Do Q\n" + _text_content(rng, 256)
+        else:
+            data = _text_content(rng, spec.stream_kb * 1024)
+        page[NameObject("/Resources")] = resources
+        page[NameObject("/Contents")] = writer._add_object(_flate(data))
+        if i % 100 == 0:
+            writer.add_outline_item(f"Page {i + 1}", i)
+    writer.add_metadata({"/Title": spec.name, "/Producer": "benchmarks/corpus.py"})
+    writer.encrypt(PASSWORD, algorithm=spec.algorithm)
+    return writer
+
+def _write_with_object_streams(writer: PdfWriter, out) -> None:
+    """
+    Serialize an encrypted writer with every non-stream object packed into
+    one object stream and a cross-reference stream instead of an xref table,
+    which pypdf's own writer does not produce.
+    """
+    encryption = writer._encryption
+    out.write(writer.pdf_header.encode() + b"\n%\xe2\xe3\xcf\xd3\n")
+
+    packed = []
+    entries = {}  # idnum -> (type, field2, field3)
+    for idnum, obj in enumerate(writer._objects, start=1):
+        if obj is None:
+            continue
+        if isinstance(obj, StreamObject) or obj is writer._encrypt_entry:
+            if obj is not writer._encrypt_entry:
+                obj = encryption.encrypt_object(obj, idnum, 0)
+            entries[idnum] = (1, out.tell(), 0)
+            out.write(f"{idnum} 0 obj\n".encode())
+            obj.write_to_stream(out)
+            out.write(b"\nendobj\n")
+        else:
+            packed.append((idnum, obj))
+
+    objstm_id = len(writer._objects) + 1
+    header = []
+    body = io.BytesIO()
+    for index, (idnum, obj) in enumerate(packed):
+        header.append(f"{idnum} {body.tell()}")
+        obj.write_to_stream(body)
+        body.write(b"\n")
+        entries[idnum] = (2, objstm_id, index)
+    first = " ".join(header).encode() + b"\n"
+    objstm = _flate(first + body.getvalue(), {
+        "/Type": NameObject("/ObjStm"),
+        "/N": NumberObject(len(packed)),
+        "/First": NumberObject(len(first)),
+    })
+    entries[objstm_id] = (1, out.tell(), 0)
+    out.write(f"{objstm_id} 0 obj\n".encode())
+    encryption.encrypt_object(objstm, objstm_id, 0).write_to_stream(out)
+    out.write(b"\nendobj\n")
+
+    xref_id = objstm_id + 1
+    xref_offset = out.tell()
+    entries[xref_id] = (1, xref_offset, 0)
+    rows = [b"\x00\x00\x00\x00\x00\xff\xff"]
+    for idnum in range(1, xref_id + 1):
+        kind, field2, field3 = entries.get(idnum, (0, 0, 0))
+        rows.append(bytes([kind]) + field2.to_bytes(4, "big") + field3.to_bytes(2, "big"))
+    # Cross-reference streams are never encrypted
+    xref = _flate(b"".join(rows), {
+        "/Type": NameObject("/XRef"),
+        "/Size": NumberObject(xref_id + 1),
+        "/W": ArrayObject([NumberObject(1), NumberObject(4), NumberObject(2)]),
+        "/Root": writer.root_object.indirect_reference,
+        "/Info": writer._info.indirect_reference,
+        "/ID": writer._ID,
+        "/Encrypt": writer._encrypt_entry.indirect_reference,
+    })
+    out.write(f"{xref_id} 0 obj\n".encode())
+    xref.write_to_stream(out)
+    out.write(f"\nendobj\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+def build_pdf(spec: CorpusSpec, seed: int = 0) -> bytes:
+    writer = build_writer(spec, seed)
+    buffer = io.BytesIO()
+    if spec.object_streams:
+        # pypdf sets up the ID and encryption keys as part of a normal write
+        writer.write(io.BytesIO())
+        _write_with_object_streams(writer, buffer)
+    else:
+        writer.write(buffer)
+    return buffer.getvalue()
+
+def generate_corpus(out_dir: str, specs: List[CorpusSpec]) -> List[dict]:
+    """
+    Write each spec to out_dir (skipping files already generated from the
+    same spec) and a manifest.json describing them.
+    Returns: the manifest entries
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous = {entry["name"]: entry for entry in json.load(f)}
+
+    manifest = []
+    for spec in specs:
+        path = os.path.join(out_dir, f"{spec.name}.pdf")
+        entry = dict(asdict(spec), file=os.path.basename(path), password=PASSWORD)
+        old = previous.get(spec.name)
+        if old is None or {k: old.get(k) for k in entry} != entry or not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(build_pdf(spec))
+        entry["bytes"] = os.path.getsize(path)
+        manifest.append(entry)
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir")
+    parser.add_argument("--size", choices=("quick", "full"), default="quick")
+    args = parser.parse_args()
+    for entry in generate_corpus(args.out_dir, default_corpus(args.size)):
+        print(f"{entry['file']:40} {entry['bytes'] / 1024:10.0f} KB")
+
+if __name__ == "__main__":
+    main()
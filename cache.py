@@ -0,0 +1,183 @@
+import hashlib
+import hmac
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from unlocker import UnlockResult
+
+SALT_FILENAME = "salt"
+
+class ResultCache:
+    """
+    Cache of unlocked PDFs keyed by file content and password.
+
+    Keys are the SHA-256 of the uploaded file plus an HMAC of the password
+    under a random salt, so plaintext passwords are never stored or used as
+    dictionary keys. Only successful unlocks are cached.
+
+    The in-memory tier holds up to max_bytes of output and evicts the least
+    recently used entries first. If cache_dir is given, entries are also
+    written there (bounded by disk_max_bytes) and survive app restarts; the
+    salt is kept alongside them so keys stay stable.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024 * 1024,
+        cache_dir: Optional[str] = None,
+        disk_max_bytes: int = 2 * 1024 * 1024 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._disk_size: Optional[int] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._salt = self._load_salt(os.path.join(cache_dir, SALT_FILENAME))
+        else:
+            self._salt = os.urandom(32)
+
+    @staticmethod
+    def _load_salt(path: str) -> bytes:
+        try:
+            with open(path, "rb") as f:
+                salt = f.read()
+            if len(salt) == 32:
+                return salt
+        except FileNotFoundError:
+            pass
+        salt = os.urandom(32)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(salt)
+        os.replace(tmp_path, path)
+        return salt
+
+    def key(self, pdf_bytes: bytes, password: str, options: str = "") -> str:
+        """
+        Cache key for unlocking pdf_bytes with password.
+        options distinguishes results produced with different unlock settings.
+        """
+        content_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        password_hash = hmac.new(self._salt, password.encode("utf-8"), hashlib.sha256).hexdigest()
+        key = f"{content_hash}-{password_hash[:32]}"
+        if options:
+            key += "-" + hashlib.sha256(options.encode("utf-8")).hexdigest()[:16]
+        return key
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    def get(self, key: str) -> Optional[UnlockResult]:
+        """
+        Returns: the cached (unlocked_pdf_bytes, True, "Success") or None
+        """
+        with self._lock:
+            pdf_bytes = self._entries.get(key)
+            if pdf_bytes is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pdf_bytes, True, "Success"
+
+        if self.cache_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f:
+                    pdf_bytes = f.read()
+                os.utime(path)
+            except FileNotFoundError:
+                pdf_bytes = None
+            if pdf_bytes is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._remember(key, pdf_bytes)
+                return pdf_bytes, True, "Success"
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, result: UnlockResult) -> None:
+        """
+        Store a result returned by unlock_pdf. Failures are not cached.
+        """
+        pdf_bytes, success, _ = result
+        if not success:
+            return
+        with self._lock:
+            self._remember(key, pdf_bytes)
+        if self.cache_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf_bytes)
+            os.replace(tmp_path, path)
+            with self._lock:
+                if self._disk_size is not None:
+                    self._disk_size += len(pdf_bytes)
+                over_budget = self._disk_size is None or self._disk_size > self.disk_max_bytes
+            if over_budget:
+                self._trim_disk()
+
+    def _remember(self, key: str, pdf_bytes: bytes) -> None:
+        # Caller holds self._lock
+        if len(pdf_bytes) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = pdf_bytes
+        self._size += len(pdf_bytes)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _trim_disk(self) -> None:
+        # Least recently used first; get() refreshes mtime on every disk hit.
+        # Only runs on the first write and then whenever the running total of
+        # bytes written goes over budget.
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".pdf"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total > self.disk_max_bytes:
+            for _, size, path in sorted(files):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.disk_max_bytes:
+                    break
+        with self._lock:
+            self._disk_size = total
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
@@ -0,0 +1,552 @@
+"""
+Command-line interface for the PDF unlocker.
+
+Runs the same unlocking core as the Streamlit app without importing
+Streamlit, so it can be used from cron jobs and batch scripts:
+
+    python cli.py unlock statements/ -o unlocked/ --password-file passwords.csv --jobs 8
+    python cli.py unlock audit.pdf -o parts/ --password secret --pages 1-100 --split-every 10
+    python cli.py unlock q3/*.pdf -o out/ --password secret --merge q3.pdf --new-password company --set-meta Title="Q3"
+    python cli.py watch inbox/ -o unlocked/ --password-file passwords.csv
+    python cli.py queue work /shared/queue --jobs 8
+    python cli.py serve --port 8080 --jobs 8
+    python cli.py recover archive.pdf -o unlocked/ --mask "?{DD}?{MM}?{YYYY}" --owner
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import signal
+import sys
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+def _has_magic(pattern: str) -> bool:
+    return any(ch in pattern for ch in "*?[")
+
+def find_pdfs(inputs: List[str]) -> List[Tuple[str, str]]:
+    """
+    Expand directories (recursively) and globs into PDF files.
+    Returns: sorted (path, relative_path) pairs; relative_path decides where
+    the output is written inside the output directory.
+    """
+    found = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in files:
+                    if name.lower().endswith(".pdf"):
+                        path = os.path.join(root, name)
+                        found[path] = os.path.relpath(path, item)
+        elif _has_magic(item):
+            for path in glob.glob(item, recursive=True):
+                if os.path.isfile(path):
+                    found[path] = os.path.basename(path)
+        elif os.path.isfile(item):
+            found[item] = os.path.basename(item)
+        else:
+            raise FileNotFoundError(f"No such file or directory: {item}")
+    return sorted(found.items(), key=lambda pair: pair[1])
+
+def _read_password(args) -> Tuple[Optional[str], dict]:
+    from passwords import load_password_map
+
+    mapping = load_password_map(args.password_file) if args.password_file else {}
+    if args.password_stdin:
+        return sys.stdin.readline().rstrip("\r\n"), mapping
+    return args.password, mapping
+
+def _pipeline(args):
+    from pipeline import Pipeline
+
+    metadata = {}
+    for item in args.set_meta or []:
+        key, sep, value = item.partition("=")
+        if not sep or not key.strip():
+            raise ValueError(f"--set-meta expects KEY=VALUE, got '{item}'")
+        metadata[key.strip()] = value
+    pipeline = Pipeline(
+        metadata=metadata,
+        clear_metadata=args.clear_meta,
+        password=args.new_password,
+        owner_password=args.new_owner_password,
+    )
+    return pipeline if pipeline.active else None
+
+def cmd_unlock(args) -> int:
+    from metrics import FileMetrics, MetricsRecorder
+    from passwords import password_for
+    from pages import format_page_ranges
+    from pipeline import merge_pdf_files
+    from unlocker import default_workers, part_filename, split_parts, unlock_files
+
+    common_password, mapping = _read_password(args)
+    if common_password is None and not mapping:
+        print("error: give --password, --password-stdin or --password-file", file=sys.stderr)
+        return 2
+    if args.merge and args.split_every:
+        print("error: --merge and --split-every can't be combined", file=sys.stderr)
+        return 2
+    try:
+        pipeline = _pipeline(args)
+    except ValueError as e:
+        print(f"error: {str(e)}", file=sys.stderr)
+        return 2
+
+    started = time.perf_counter()
+    entries = []
+    jobs = []
+    for path, rel_path in find_pdfs(args.inputs):
+        password = password_for(rel_path, mapping) if mapping else None
+        if password is None:
+            password = common_password
+        output = os.path.join(args.output_dir, rel_path)
+        entry = {"input": path, "output": None, "status": "skipped", "message": "No password provided"}
+        if args.pages:
+            entry["pages"] = args.pages
+        if password is None or not args.split_every:
+            entries.append(entry)
+            if password is not None:
+                jobs.append((entry, (path, output, password), args.pages))
+            continue
+        # One entry and one job per part; parts of all files share the pool
+        try:
+            parts = split_parts(path, password, args.split_every, args.pages)
+        except (OSError, ValueError) as e:
+            entries.append(dict(entry, status="failed", message=str(e)))
+            if not args.quiet:
+                print(f"FAIL {path}: {str(e)}", file=sys.stderr)
+            continue
+        for part in parts:
+            part_pages = format_page_ranges(part)
+            part_output = os.path.join(os.path.dirname(output), part_filename(output, part))
+            part_entry = dict(entry, pages=part_pages)
+            entries.append(part_entry)
+            jobs.append((part_entry, (path, part_output, password), part_pages))
+
+    recorder = MetricsRecorder(args.metrics_jsonl, args.metrics_prom)
+
+    def on_metrics(index, metrics):
+        metrics.filename = jobs[index][0]["input"]
+        jobs[index][0]["seconds"] = round(metrics.total_seconds, 4)
+        jobs[index][0]["input_bytes"] = metrics.input_bytes
+        jobs[index][0]["output_bytes"] = metrics.output_bytes
+        if "optimize" in metrics.stages:
+            jobs[index][0]["optimize_seconds"] = round(metrics.stages["optimize"], 4)
+        recorder.record(metrics)
+
+    def on_result(index, result):
+        entry = jobs[index][0]
+        success, message = result
+        entry["status"] = "success" if success else "failed"
+        entry["message"] = message
+        if success:
+            entry["output"] = jobs[index][1][1]
+            if args.profile != "fast":
+                message += (
+                    f" ({entry['input_bytes']:,} -> {entry['output_bytes']:,} bytes,"
+                    f" {entry.get('optimize_seconds', 0.0)}s optimizing)"
+                )
+        if not args.quiet:
+            pages = f" (pages {entry['pages']})" if "pages" in entry else ""
+            print(f"{'OK  ' if success else 'FAIL'} {entry['input']}{pages}: {message}", file=sys.stderr)
+
+    if args.merge:
+        # Every input is read once and its pages go straight into the merged file
+        merged = os.path.join(args.output_dir, args.merge)
+        metrics = FileMetrics(filename=merged)
+        success, message = merge_pdf_files(
+            [(entry["input"], path, password, pages) for entry, (path, _, password), pages in jobs], merged,
+            pipeline=pipeline, profile=args.profile, level=args.level, workers=args.jobs or default_workers(),
+            metrics=metrics,
+        )
+        recorder.record(metrics)
+        if success:
+            message = f"Merged into {merged}"
+        for entry, _, _ in jobs:
+            entry.update(status="success" if success else "failed", message=message, output=merged if success else None)
+        if not args.quiet:
+            print(f"{'OK  ' if success else 'FAIL'} {merged}: {f'{len(jobs)} file(s) merged' if success else message}",
+                  file=sys.stderr)
+    else:
+        unlock_files(
+            [job for _, job, _ in jobs], max_workers=args.jobs, on_result=on_result, on_metrics=on_metrics,
+            mode=args.mode, profile=args.profile, level=args.level, pages=[pages for _, _, pages in jobs],
+            pipeline=pipeline,
+        )
+
+    summary = {
+        "total": len(entries),
+        "succeeded": sum(1 for e in entries if e["status"] == "success"),
+        "failed": sum(1 for e in entries if e["status"] == "failed"),
+        "skipped": sum(1 for e in entries if e["status"] == "skipped"),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "files": entries,
+    }
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    elif not args.quiet:
+        print(
+            f"{summary['succeeded']} unlocked, {summary['failed']} failed, "
+            f"{summary['skipped']} skipped in {summary['elapsed_seconds']}s",
+            file=sys.stderr,
+        )
+    return 1 if summary["failed"] else 0
+
+def cmd_watch(args) -> int:
+    from metrics import MetricsRecorder
+    from passwords import password_for
+    from watcher import Manifest, Watcher
+
+    common_password, mapping = _read_password(args)
+    if common_password is None and not mapping:
+        print("error: give --password, --password-stdin or --password-file", file=sys.stderr)
+        return 2
+    if not os.path.isdir(args.directory):
+        raise FileNotFoundError(f"No such directory: {args.directory}")
+
+    def lookup(rel_path):
+        password = password_for(rel_path, mapping) if mapping else None
+        return common_password if password is None else password
+
+    def on_result(rel_path, status, message):
+        if not args.quiet or status == "failed":
+            print(f"{status.upper():7} {rel_path}: {message}", file=sys.stderr)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest = Manifest(args.manifest or os.path.join(args.output_dir, ".unlock-manifest.sqlite"))
+    recorder = MetricsRecorder(args.metrics_jsonl, args.metrics_prom)
+    watcher = Watcher(
+        args.directory,
+        args.output_dir,
+        manifest,
+        lookup,
+        max_workers=args.jobs,
+        mode=args.mode,
+        settle=args.settle,
+        retry_failed=args.retry_failed,
+        on_result=on_result,
+        on_metrics=recorder.record,
+    )
+    # Stop cleanly (committing the manifest) under service managers too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        if args.once:
+            watcher.scan(full=args.full_scan)
+        else:
+            watcher.run(poll_interval=args.poll, use_inotify=not args.no_inotify, full_scan=args.full_scan)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        counts = manifest.counts()
+        manifest.close()
+    if not args.quiet:
+        print(", ".join(f"{n} {status}" for status, n in sorted(counts.items())) or "no files", file=sys.stderr)
+    return 0
+
+def cmd_queue_add(args) -> int:
+    from workqueue import QueueJob, SpoolQueue
+
+    refs = [ref for ref in (
+        f"env:{args.password_env}" if args.password_env else None,
+        f"file:{os.path.abspath(args.password_path)}" if args.password_path else None,
+        f"map:{os.path.abspath(args.password_file)}" if args.password_file else None,
+    ) if ref]
+    if len(refs) != 1:
+        print("error: give exactly one of --password-env, --password-path or --password-file", file=sys.stderr)
+        return 2
+
+    jobs = [
+        QueueJob(
+            input=os.path.abspath(path),
+            output=os.path.abspath(os.path.join(args.output_dir, rel_path)),
+            password_ref=refs[0],
+            rel_path=rel_path.replace(os.sep, "/"),
+        )
+        for path, rel_path in find_pdfs(args.inputs)
+    ]
+    count = SpoolQueue(args.queue_dir).enqueue(jobs)
+    if not args.quiet:
+        print(f"queued {count} file(s) in {args.queue_dir}", file=sys.stderr)
+    return 0
+
+def cmd_queue_work(args) -> int:
+    from workqueue import run_workers
+
+    run_workers(
+        args.queue_dir,
+        args.jobs or 1,
+        lease_seconds=args.lease,
+        max_attempts=args.max_attempts,
+        mode=args.mode,
+        poll_seconds=args.poll,
+        exit_when_empty=args.exit_when_empty,
+    )
+    return 0
+
+def cmd_queue_stats(args) -> int:
+    from workqueue import SpoolQueue
+
+    queue = SpoolQueue(args.queue_dir)
+    stats = queue.stats()
+    stats["recent_failures"] = [
+        {"input": job.input, "attempts": job.attempts, "error": job.error} for job in queue.failures(args.failures)
+    ]
+    if args.json:
+        json.dump(stats, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 0
+
+    print(f"pending {stats['pending']}  in flight {stats['claimed']}  done {stats['done']}  failed {stats['failed']}")
+    if stats["workers"]:
+        now = time.time()
+        print(f"{'worker':32} {'done':>7} {'failed':>7} {'errors':>7} {'lost':>7} {'files/s':>8} {'MB/s':>7} {'idle s':>7}")
+        for w in stats["workers"]:
+            elapsed = max(w["last_seen"] - w["started"], 1e-9)
+            print(f"{w['worker']:32} {w['done']:>7} {w['failed']:>7} {w['errors']:>7} {w.get('lost', 0):>7} "
+                  f"{w['done'] / elapsed:>8.2f} {w['bytes_in'] / 1e6 / elapsed:>7.2f} {now - w['last_seen']:>7.0f}")
+    for failure in stats["recent_failures"]:
+        print(f"FAIL {failure['input']} (attempts {failure['attempts']}): {failure['error']}")
+    return 0
+
+def _year_range(text: str) -> Tuple[int, int]:
+    first, _, last = text.partition("-")
+    try:
+        return int(first), int(last or first)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a year range like 1950-2010, got {text!r}") from None
+
+def _save_secret(path: str, text: str) -> None:
+    # Created readable by the owner only, and swapped in whole so an
+    # existing file with wider permissions is replaced rather than reused
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def cmd_recover(args) -> int:
+    from threading import Event
+
+    from recovery import build_keyspace, format_duration, recover_password
+    from triage import triage_pdf
+    from unlocker import unlock_pdf_file
+
+    if not args.owner:
+        print("error: recovery is only for files you own or are authorized to unlock; confirm with --owner", file=sys.stderr)
+        return 2
+    with open(args.pdf, "rb") as f:
+        info = triage_pdf(f)
+    if not info.needs_password:
+        print(f"error: {args.pdf}: {info.label}", file=sys.stderr)
+        return 2
+    words = []
+    for path in args.wordlist or []:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            words.extend(f.read().splitlines())
+    keyspace = build_keyspace(words, args.mask, args.years)
+    if not args.quiet:
+        print(f"{args.pdf}: {info.algorithm}, {keyspace.size:,} candidate(s)", file=sys.stderr)
+
+    def on_progress(progress):
+        if not args.quiet:
+            print(
+                f"\r{progress.checked:,}/{progress.total:,} ({progress.fraction:.1%}) · {progress.rate:,.0f}/s · "
+                f"ETA {format_duration(progress.eta_seconds)}   ",
+                end="", file=sys.stderr, flush=True,
+            )
+
+    # Ctrl+C and SIGTERM stop the search with its progress saved
+    cancel = Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: cancel.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: cancel.set())
+    result = recover_password(
+        info.params, keyspace, max_workers=args.jobs, on_progress=on_progress, cancel=cancel,
+        state_path=args.state, resume=not args.restart,
+    )
+    if not args.quiet:
+        print(file=sys.stderr)
+    if result.password is None:
+        if result.exhausted:
+            print(f"No candidate matched ({result.total:,} checked)", file=sys.stderr)
+        else:
+            print(f"Stopped at {result.checked:,} of {result.total:,}; run the same command again to resume", file=sys.stderr)
+        return 1
+
+    # The password goes to stdout only when asked for; otherwise to a file
+    # only its owner can read
+    if args.print_password:
+        print(result.password)
+    else:
+        secret_path = args.save_password or os.path.join(args.output_dir, os.path.basename(args.pdf) + ".password")
+        _save_secret(secret_path, result.password)
+        if not args.quiet:
+            print(f"Password saved to {secret_path} (readable by you only)", file=sys.stderr)
+    output = os.path.join(args.output_dir, os.path.basename(args.pdf))
+    success, message = unlock_pdf_file(
+        args.pdf, output, result.password, mode=args.mode, profile=args.profile, level=args.level
+    )
+    if not args.quiet or not success:
+        print(f"{'OK  ' if success else 'FAIL'} {args.pdf}: {message}", file=sys.stderr)
+    return 0 if success else 1
+
+def cmd_serve(args) -> int:
+    from metrics import MetricsRecorder
+    from service import UnlockService, serve
+
+    service = UnlockService(
+        workers=args.jobs,
+        queue_depth=args.queue_depth,
+        max_upload_bytes=args.max_upload_mb * 1024 * 1024,
+        mode=args.mode,
+        profile=args.profile,
+        level=args.level,
+        recorder=MetricsRecorder(args.metrics_jsonl, args.metrics_prom),
+        log_requests=not args.quiet,
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(args.host, args.port, service)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Remove passwords from PDF files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    unlock = sub.add_parser("unlock", help="Unlock PDFs from files, directories or globs")
+    unlock.add_argument("inputs", nargs="+", help="PDF files, directories (searched recursively) or glob patterns")
+    unlock.add_argument("-o", "--output-dir", required=True, help="Directory to write unlocked PDFs to")
+    pw = unlock.add_mutually_exclusive_group()
+    pw.add_argument("-p", "--password", help="Password for every file")
+    pw.add_argument("--password-stdin", action="store_true", help="Read the password for every file from the first line of stdin")
+    unlock.add_argument("--password-file", help="JSON or CSV mapping of file name/glob to password; overrides the common password")
+    unlock.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: number of CPUs)")
+    unlock.add_argument("--mode", choices=("fast", "rebuild"), default="fast", help="fast rewrites objects in place keeping outlines/forms/metadata; rebuild copies pages into a new document (default: fast)")
+    unlock.add_argument("--profile", choices=("fast", "compact"), default="fast", help="fast copies streams unchanged; compact merges duplicate objects, packs object streams and recompresses streams (default: fast)")
+    unlock.add_argument("--level", type=int, choices=range(1, 10), default=6, metavar="1-9", help="zlib level for --profile compact (default: 6)")
+    unlock.add_argument("--pages", help='Only unlock these pages of each file, e.g. "1-10, 15, 20-"')
+    unlock.add_argument("--split-every", type=int, default=0, metavar="N", help="Write every N pages of each file as a separate PDF, named like report_p0001-0010.pdf")
+    unlock.add_argument("--merge", metavar="NAME.pdf", help="Write the pages of all inputs, in order, to OUTPUT_DIR/NAME.pdf instead of one PDF per input")
+    unlock.add_argument("--new-password", help="Re-encrypt every output with this password (AES-256) in the same pass")
+    unlock.add_argument("--new-owner-password", help="Owner password for --new-password (default: the same password)")
+    unlock.add_argument("--set-meta", action="append", metavar="KEY=VALUE", help="Set a document information entry, e.g. Title=Report; an empty value removes it (repeatable)")
+    unlock.add_argument("--clear-meta", action="store_true", help="Remove all document information entries not set with --set-meta")
+    unlock.add_argument("--summary", help="Write a JSON summary to this file")
+    unlock.add_argument("--json", action="store_true", help="Print the JSON summary to stdout")
+    unlock.add_argument("--metrics-jsonl", help="Append per-file stage timings to this JSON lines file")
+    unlock.add_argument("--metrics-prom", help="Write totals to this file in Prometheus text format")
+    unlock.add_argument("-q", "--quiet", action="store_true", help="Only print errors")
+    unlock.set_defaults(func=cmd_unlock)
+
+    watch = sub.add_parser("watch", help="Keep unlocking PDFs dropped into a directory")
+    watch.add_argument("directory", help="Directory to watch (recursively)")
+    watch.add_argument("-o", "--output-dir", required=True, help="Directory to write unlocked PDFs to, keeping relative paths")
+    pw = watch.add_mutually_exclusive_group()
+    pw.add_argument("-p", "--password", help="Password for files not in --password-file")
+    pw.add_argument("--password-stdin", action="store_true", help="Read that password from the first line of stdin")
+    watch.add_argument("--password-file", help="JSON or CSV mapping of file name/glob to password")
+    watch.add_argument("--manifest", help="SQLite manifest of processed files (default: OUTPUT_DIR/.unlock-manifest.sqlite)")
+    watch.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: number of CPUs)")
+    watch.add_argument("--mode", choices=("fast", "rebuild"), default="fast", help="Unlock mode (default: fast)")
+    watch.add_argument("--poll", type=float, default=5.0, help="Polling interval in seconds when inotify is unavailable (default: 5)")
+    watch.add_argument("--settle", type=float, default=2.0, help="When polling, wait until a file is this many seconds old (default: 2)")
+    watch.add_argument("--no-inotify", action="store_true", help="Always poll")
+    watch.add_argument("--full-scan", action="store_true", help="Stat every file on startup, even in unchanged directories")
+    watch.add_argument("--retry-failed", action="store_true", help="Retry files that failed before, e.g. after fixing the password file")
+    watch.add_argument("--once", action="store_true", help="Scan once and exit")
+    watch.add_argument("--metrics-jsonl", help="Append per-file stage timings to this JSON lines file")
+    watch.add_argument("--metrics-prom", help="Write totals to this file in Prometheus text format")
+    watch.add_argument("-q", "--quiet", action="store_true", help="Only print failures")
+    watch.set_defaults(func=cmd_watch)
+
+    queue = sub.add_parser("queue", help="Shared work queue for unlocking across processes and hosts")
+    queue_sub = queue.add_subparsers(dest="queue_command", required=True)
+
+    add = queue_sub.add_parser("add", help="Queue PDFs for workers")
+    add.add_argument("queue_dir", help="Queue directory, shared by all workers")
+    add.add_argument("inputs", nargs="+", help="PDF files, directories (searched recursively) or glob patterns")
+    add.add_argument("-o", "--output-dir", required=True, help="Directory workers write unlocked PDFs to")
+    add.add_argument("--password-env", help="Workers read the password from this environment variable")
+    add.add_argument("--password-path", help="Workers read the password from the first line of this file")
+    add.add_argument("--password-file", help="Workers look passwords up in this JSON or CSV mapping file")
+    add.add_argument("-q", "--quiet", action="store_true", help="Only print errors")
+    add.set_defaults(func=cmd_queue_add)
+
+    work = queue_sub.add_parser("work", help="Claim and unlock queued PDFs")
+    work.add_argument("queue_dir", help="Queue directory, shared by all workers")
+    work.add_argument("-j", "--jobs", type=int, default=1, help="Worker processes on this host (default: 1)")
+    work.add_argument("--lease", type=float, default=60.0, help="Seconds before a silent worker's job is retried elsewhere (default: 60)")
+    work.add_argument("--max-attempts", type=int, default=3, help="Tries per job before it is marked failed (default: 3)")
+    work.add_argument("--mode", choices=("fast", "rebuild"), default="fast", help="Unlock mode (default: fast)")
+    work.add_argument("--poll", type=float, default=1.0, help="Seconds to wait when the queue is empty (default: 1)")
+    work.add_argument("--exit-when-empty", action="store_true", help="Exit once nothing is pending or in flight")
+    work.set_defaults(func=cmd_queue_work)
+
+    stats = queue_sub.add_parser("stats", help="Show queue depth, per-worker throughput and failures")
+    stats.add_argument("queue_dir", help="Queue directory")
+    stats.add_argument("--failures", type=int, default=10, help="Recent failures to list (default: 10)")
+    stats.add_argument("--json", action="store_true", help="Print as JSON")
+    stats.set_defaults(func=cmd_queue_stats)
+
+    recover = sub.add_parser("recover", help="Recover the forgotten password of a PDF you own, then unlock it")
+    recover.add_argument("pdf", help="The encrypted PDF")
+    recover.add_argument("-o", "--output-dir", required=True, help="Directory to write the unlocked PDF to")
+    recover.add_argument("--owner", action="store_true", help="Confirm you own the file or are authorized to remove its password (required)")
+    recover.add_argument("-w", "--wordlist", action="append", help="File of candidate words, one per line (repeatable)")
+    recover.add_argument("-m", "--mask", help="Candidate mask, e.g. ?{DD}?{MM}?{YYYY} or CUST?d?d?d?d?d?d (see recovery.py); appended to each word when used with --wordlist")
+    recover.add_argument("--years", type=_year_range, default=None, help="Years for the ?{DD} ?{MM} ?{YY} ?{YYYY} date placeholders, e.g. 1950-2010 (default: 1940-this year)")
+    recover.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: number of CPUs)")
+    recover.add_argument("--state", help="Progress file for resuming (default: one per search in the temp directory)")
+    recover.add_argument("--restart", action="store_true", help="Ignore saved progress and start from the first candidate")
+    recover.add_argument("--mode", choices=("fast", "rebuild"), default="fast", help="Unlock mode (default: fast)")
+    recover.add_argument("--profile", choices=("fast", "compact"), default="fast", help="Output profile (default: fast)")
+    recover.add_argument("--level", type=int, choices=range(1, 10), default=6, metavar="1-9", help="zlib level for --profile compact (default: 6)")
+    reveal = recover.add_mutually_exclusive_group()
+    reveal.add_argument("--save-password", metavar="PATH", help="File the recovered password is written to, readable by you only (default: OUTPUT_DIR/NAME.pdf.password)")
+    reveal.add_argument("--print", dest="print_password", action="store_true", help="Print the recovered password to stdout instead of saving it to a file")
+    recover.add_argument("-q", "--quiet", action="store_true", help="Only print errors (and the password with --print)")
+    recover.set_defaults(func=cmd_recover)
+
+    serve = sub.add_parser("serve", help="Run the HTTP unlock API")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    serve.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes shared by all requests (default: number of CPUs)")
+    serve.add_argument("--queue-depth", type=int, default=4, help="Files allowed to wait per worker before requests get 429 (default: 4)")
+    serve.add_argument("--max-upload-mb", type=int, default=512, help="Largest accepted request body (default: 512)")
+    serve.add_argument("--mode", choices=("fast", "rebuild"), default="fast", help="Default unlock mode (default: fast)")
+    serve.add_argument("--profile", choices=("fast", "compact"), default="fast", help="Default output profile (default: fast)")
+    serve.add_argument("--level", type=int, choices=range(1, 10), default=6, metavar="1-9", help="Default zlib level for the compact profile (default: 6)")
+    serve.add_argument("--metrics-jsonl", help="Append per-file stage timings to this JSON lines file")
+    serve.add_argument("--metrics-prom", help="Write totals to this file in Prometheus text format")
+    serve.add_argument("-q", "--quiet", action="store_true", help="Don't log requests")
+    serve.set_defaults(func=cmd_serve)
+
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    # pypdf logs a warning for every damaged file it reads; the per-file
+    # status lines already report failures
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+    try:
+        return args.func(args)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
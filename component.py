@@ -1,36 +1,74 @@
 # component.py
 import streamlit as st
-from PIL import Image
 import base64
+import io
+import mimetypes
 import os
 
+# Page images live in static/ next to main.py. With server.enableStaticServing
+# (see .streamlit/config.toml) Streamlit serves them at app/static/<name>, so
+# the browser fetches and caches each one once instead of every rerun
+# carrying them inline.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = "app/static"
+
+# Tab icon size; the logo file itself is a few megabytes
+ICON_SIZE = 64
+
 def get_base64_of_bin_file(bin_file):
     """Encode a local file (image or gif) to a base64 string."""
     with open(bin_file, "rb") as f:
         data = f.read()
     return base64.b64encode(data).decode()
 
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _load_asset(path, mtime_ns, kind):
+    """
+    Load and encode an asset once per process. mtime_ns is part of the
+    cache key, so an edited file is loaded again.
+    Returns: PNG bytes for kind "icon", a data URI for kind "data"
+    """
+    if kind == "icon":
+        from PIL import Image
+
+        with Image.open(path) as image:
+            image.thumbnail((ICON_SIZE, ICON_SIZE))
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+        return buffer.getvalue()
+    mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return f"data:{mime};base64,{get_base64_of_bin_file(path)}"
+
+def load_asset(name, kind="data"):
+    """Cached contents of static/<name>; see _load_asset."""
+    path = os.path.join(STATIC_DIR, name)
+    return _load_asset(path, os.stat(path).st_mtime_ns, kind)
+
+def asset_url(name):
+    """
+    URL for an image in static/: the static file route when static serving
+    is on, otherwise an inline data URI (encoded once per process).
+    """
+    if not os.path.exists(os.path.join(STATIC_DIR, name)):
+        raise FileNotFoundError(os.path.join(STATIC_DIR, name))
+    if st.get_option("server.enableStaticServing"):
+        return f"{STATIC_URL}/{name}"
+    return load_asset(name)
+
 def page_style():
     # === Page configuration ===
-    icon_path = "assets/logo.png"
-    if not os.path.exists(icon_path):
-        icon_path = "./assets/logo.png"
     try:
-        icon = Image.open(icon_path)
-        st.set_page_config(page_title="PDF Password Remover", page_icon=icon, layout="wide")
+        st.set_page_config(page_title="PDF Password Remover", page_icon=load_asset("logo.png", "icon"), layout="wide")
     except Exception as e:
         st.warning(f"Failed to load page icon: {e}")
         st.set_page_config(page_title="PDF Password Remover", layout="wide")
 
     # === Sidebar background image ===
-    sidebar_image_path = "assets/background.jpg"
-    if not os.path.exists(sidebar_image_path):
-        sidebar_image_path = "./assets/background.jpg"
     try:
-        sidebar_image_base64 = get_base64_of_bin_file(sidebar_image_path)
-    except FileNotFoundError:
-        st.warning(f"Sidebar background image not found at {sidebar_image_path}")
-        sidebar_image_base64 = ""
+        sidebar_image_url = asset_url("background.jpg")
+    except FileNotFoundError as e:
+        st.warning(f"Sidebar background image not found at {e}")
+        sidebar_image_url = ""
 
     custom_style = f"""
         <style>
@@ -41,7 +79,7 @@ def page_style():
             [data-testid="stSidebar"] > div:first-child {{
                 background-color: #111;
                 background-image: linear-gradient(rgba(0, 0, 0, 0.85), rgba(0, 0, 0, 0.85)),
-                                 url("data:image/jpg;base64,{sidebar_image_base64}");
+                                 url("{sidebar_image_url}");
                 background-size: cover;
                 background-position: center;
                 background-repeat: no-repeat;
@@ -68,19 +106,18 @@ def page_style():
     st.markdown(custom_style, unsafe_allow_html=True)
 
     # === Main banner image ===
-    main_bg_path = "assets/Mainpdf_Background.png"
-    if not os.path.exists(main_bg_path):
-        main_bg_path = "./assets/Mainpdf_Background.png"
     try:
-        main_bg = Image.open(main_bg_path)
-        st.image(main_bg, use_container_width=True)
+        st.markdown(f'<img src="{asset_url("Mainpdf_Background.png")}" style="width:100%;" alt="">', unsafe_allow_html=True)
     except Exception as e:
         st.warning(f"Failed to load main background image: {e}")
 
     # === Sidebar content ===
     with st.sidebar:
         # Logo
-        st.image("assets/logo.png", width=80)
+        try:
+            st.markdown(f'<img src="{asset_url("logo.png")}" width="80" alt="Logo">', unsafe_allow_html=True)
+        except FileNotFoundError:
+            pass
         # Title Card
         st.markdown('<div class="cert-card"><h2>🔓 PDF Password Remover</h2><p>Effortlessly remove passwords from your encrypted PDF files.</p></div>', unsafe_allow_html=True)
 
@@ -112,12 +149,8 @@ def page_style():
         )
 
         # Developer Credit with photo inside the card
-        profile_img_path = "photos/Round_Profile_Photo.png"
-        if not os.path.exists(profile_img_path):
-            profile_img_path = "./photos/Round_Profile_Photo.png"
         try:
-            profile_img_base64 = get_base64_of_bin_file(profile_img_path)
-            profile_img_html = f'<img src="data:image/png;base64,{profile_img_base64}" width="80" style="border-radius:50%;margin-bottom:10px;" />'
+            profile_img_html = f'<img src="{asset_url("Round_Profile_Photo.png")}" width="80" style="border-radius:50%;margin-bottom:10px;" />'
         except Exception:
             profile_img_html = ""
 
@@ -128,4 +161,19 @@ def page_style():
                 <p><a href="https://github.com/fahmizainal17/pdf-password-remover" style="color:white;">View on GitHub</a></p>
             </div>''',
             unsafe_allow_html=True
-        )
\ No newline at end of file
+        )
+
+def server_load(stats):
+    """Sidebar card with the shared server's current load (Scheduler.stats())."""
+    mb = 1024 * 1024
+    with st.sidebar:
+        st.markdown(
+            '<div class="cert-card"><h4>🖥️ Server Load</h4>' +
+            '<ul>' +
+            f'<li>Workers: {stats["cpu_used"]} / {stats["cpu_slots"]} in use</li>' +
+            f'<li>Memory: {stats["memory_used"] / mb:.0f} / {stats["memory_bytes"] / mb:.0f} MB reserved '
+            f'({stats["memory_retained"] / mb:.0f} MB held by results)</li>' +
+            f'<li>Batches: {stats["running"]} running, {stats["queued"]} queued</li>' +
+            '</ul></div>',
+            unsafe_allow_html=True
+        )
@@ -0,0 +1,181 @@
+"""
+Download section for a finished job.
+
+st.download_button takes the file's bytes up front and registers them with
+Streamlit's media store on every rerun, so one button per file re-sends the
+whole batch each time the page reruns. Here files are listed by name only;
+a file (or ZIP) is read and handed to a download button only after its
+"Prepare" button is clicked, and only one prepared download is kept per
+session. Its bytes are read once, when it is prepared, not on every rerun.
+
+A download button needs the whole file in memory, so downloads larger than
+PREPARED_MAX_BYTES can't be prepared here; such results stay on disk and
+should be fetched with the command line or the HTTP service instead.
+"""
+import os
+
+import streamlit as st
+
+from export import ZipExporter
+
+# Individual downloads listed per page
+PAGE_SIZE = 20
+# Largest download that can be prepared in the app
+PREPARED_MAX_BYTES = 256 * 1024 * 1024
+
+def download_size(unlocked) -> int:
+    return os.path.getsize(unlocked) if isinstance(unlocked, str) else len(unlocked)
+
+def download_data(unlocked, limit: int = PREPARED_MAX_BYTES) -> bytes:
+    """
+    Bytes for a download button; in large-file mode results are file paths
+    Raises: ValueError if the result is larger than limit bytes
+    """
+    size = download_size(unlocked)
+    if size > limit:
+        raise ValueError(f"{_format_size(size)} is over the {_format_size(limit)} download limit")
+    if isinstance(unlocked, str):
+        with open(unlocked, "rb") as f:
+            return f.read()
+    return unlocked
+
+def build_zip(unlocked_files, compression: str = "stored") -> ZipExporter:
+    """
+    ZIP of (filename, bytes or path) pairs, e.g. a selection from a job
+    Returns: the finished archive
+    """
+    zip_export = ZipExporter(compression)
+    for fname, unlocked in unlocked_files:
+        if isinstance(unlocked, str):
+            zip_export.add_file(fname, unlocked)
+        else:
+            zip_export.add(fname, unlocked)
+    return zip_export.finish()
+
+def _prepared(job, handle):
+    """
+    Returns: the prepared bytes for handle, or None
+    """
+    prepared = st.session_state.get("prepared_download")
+    if prepared is not None and prepared[:2] == (job.id, handle):
+        return prepared[2]
+    return None
+
+def _prepare(job, handle, read) -> None:
+    """
+    Read a download once and keep it as the session's prepared download.
+    read() returns its bytes, raising ValueError if it can't be prepared.
+    """
+    # Drop the previous download first so that two are never held at once
+    st.session_state.prepared_download = None
+    try:
+        st.session_state.prepared_download = (job.id, handle, read())
+    except ValueError as e:
+        st.session_state.prepare_error = str(e)
+    st.rerun()
+
+def _read_selected(chosen, compression: str) -> bytes:
+    zip_export = build_zip(chosen, compression)
+    try:
+        return zip_export.read(PREPARED_MAX_BYTES)
+    finally:
+        zip_export.close()
+
+def _toggle_selected(job, fname) -> None:
+    selected = st.session_state.download_selection.setdefault(job.id, set())
+    if st.session_state[f"select_{job.id}_{fname}"]:
+        selected.add(fname)
+    else:
+        selected.discard(fname)
+
+def _format_size(num_bytes: int) -> str:
+    if num_bytes >= 1024 * 1024:
+        return f"{num_bytes / (1024 * 1024):.1f} MB"
+    return f"{num_bytes / 1024:.0f} KB"
+
+def download_section(job) -> None:
+    """
+    Render the downloads for a finished job
+    """
+    if 'download_selection' not in st.session_state:
+        st.session_state.download_selection = {}
+
+    st.header("⬇️ Download Unlocked PDFs")
+    error = st.session_state.pop("prepare_error", None)
+    if error:
+        st.error(f"Can't prepare this download: {error}. Use the command line or HTTP service for files this large.")
+
+    if len(job.unlocked_files) == 1:
+        fname, unlocked = job.unlocked_files[0]
+        data = _prepared(job, fname)
+        if data is not None:
+            st.download_button(
+                label=f"Download {fname}",
+                data=data,
+                file_name=fname,
+                mime="application/pdf",
+                key=f"download_{job.id}_{fname}"
+            )
+        elif st.button(f"Prepare {fname} ({_format_size(download_size(unlocked))})", key=f"prepare_{job.id}_{fname}"):
+            _prepare(job, fname, lambda: download_data(unlocked))
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        data = _prepared(job, "zip")
+        if data is not None:
+            st.download_button(
+                label="Download All as ZIP",
+                data=data,
+                file_name="unlocked_pdfs.zip",
+                mime="application/zip",
+                key=f"download_zip_{job.id}"
+            )
+        elif st.button(f"Prepare ZIP of all files ({_format_size(job.zip_export.size)})", key=f"prepare_zip_{job.id}"):
+            _prepare(job, "zip", lambda: job.zip_export.read(PREPARED_MAX_BYTES))
+
+        selected = st.session_state.download_selection.get(job.id, set())
+        chosen = [(fname, unlocked) for fname, unlocked in job.unlocked_files if fname in selected]
+        handle = ("selected", tuple(fname for fname, _ in chosen))
+        data = _prepared(job, handle)
+        if data is not None:
+            st.download_button(
+                label=f"Download {len(chosen)} selected as ZIP",
+                data=data,
+                file_name="unlocked_pdfs_selected.zip",
+                mime="application/zip",
+                key=f"download_selected_{job.id}"
+            )
+        elif st.button(f"Prepare ZIP of {len(chosen)} selected file(s)", disabled=not chosen, key=f"prepare_selected_{job.id}"):
+            _prepare(job, handle, lambda: _read_selected(chosen, job.options.zip_compression))
+
+    with col2:
+        st.subheader("Individual Downloads:")
+        files = job.unlocked_files
+        pages = (len(files) + PAGE_SIZE - 1) // PAGE_SIZE
+        page = 1
+        if pages > 1:
+            page = st.number_input(f"Page (of {pages}):", min_value=1, max_value=pages, value=1, key=f"page_{job.id}")
+        for fname, unlocked in files[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]:
+            check, action = st.columns([1, 8])
+            with check:
+                st.checkbox(
+                    "Select",
+                    value=fname in selected,
+                    key=f"select_{job.id}_{fname}",
+                    label_visibility="collapsed",
+                    on_change=_toggle_selected,
+                    args=(job, fname),
+                )
+            with action:
+                data = _prepared(job, fname)
+                if data is not None:
+                    st.download_button(
+                        label=f"💾 Save {fname}",
+                        data=data,
+                        file_name=fname,
+                        mime="application/pdf",
+                        key=f"download_{job.id}_{fname}"
+                    )
+                elif st.button(f"📄 {fname}", key=f"prepare_{job.id}_{fname}"):
+                    _prepare(job, fname, lambda: download_data(unlocked))
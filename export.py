@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from typing import IO, Optional, Tuple
+
+# UI label -> ZIP compression setting. PDFs are already compressed
+# internally, so storing them is usually as small and far cheaper.
+COMPRESSION_MODES = {
+    "stored": (zipfile.ZIP_STORED, None),
+    "deflate": (zipfile.ZIP_DEFLATED, None),
+    "deflate-1": (zipfile.ZIP_DEFLATED, 1),
+    "deflate-6": (zipfile.ZIP_DEFLATED, 6),
+    "deflate-9": (zipfile.ZIP_DEFLATED, 9),
+}
+
+# Archives smaller than this stay in memory; larger ones roll over to disk
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+def parse_compression(mode: str) -> Tuple[int, Optional[int]]:
+    """
+    Turn "stored", "deflate" or "deflate-<level>" into (compression, compresslevel)
+    """
+    if mode in COMPRESSION_MODES:
+        return COMPRESSION_MODES[mode]
+    if mode.startswith("deflate-") and mode[len("deflate-"):].isdigit():
+        level = int(mode[len("deflate-"):])
+        if 0 <= level <= 9:
+            return zipfile.ZIP_DEFLATED, level
+    raise ValueError(f"Unknown ZIP compression mode: {mode}")
+
+class ZipExporter:
+    """
+    Builds a ZIP archive incrementally in a spooled temporary file.
+
+    Call add() as each PDF is unlocked, then finish() once the batch is
+    done. Entries are written straight into the archive, so memory use is
+    bounded by SPOOL_MAX_SIZE rather than the size of the batch.
+
+    If stream is given, the archive is written to it instead, e.g. to a
+    chunked HTTP response. It need not be seekable; size, read() and
+    spill() are then unavailable.
+
+    The app reads a finished archive while the job manager's housekeeping
+    thread may spill it, so the spooled file is only touched under a lock.
+    """
+
+    def __init__(
+        self, compression: str = "stored", spool_max_size: int = SPOOL_MAX_SIZE, stream: Optional[IO[bytes]] = None
+    ):
+        self.compression = compression
+        method, level = parse_compression(compression)
+        if stream is not None:
+            self._file = stream
+        else:
+            self._file = tempfile.SpooledTemporaryFile(max_size=spool_max_size, suffix=".zip")
+        self._zip = zipfile.ZipFile(self._file, "w", method, compresslevel=level)
+        self._names = set()
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def _unique_name(self, filename: str) -> str:
+        name = filename
+        stem, ext = os.path.splitext(filename)
+        n = 1
+        while name in self._names:
+            name = f"{stem} ({n}){ext}"
+            n += 1
+        self._names.add(name)
+        return name
+
+    def add(self, filename: str, pdf_bytes: bytes) -> str:
+        """
+        Append one file to the archive.
+        Returns: the entry name used (renamed if filename was already taken)
+        """
+        name = self._unique_name(filename)
+        self._zip.writestr(name, pdf_bytes)
+        self.count += 1
+        return name
+
+    def add_file(self, filename: str, path: str) -> str:
+        """
+        Append a file from disk, copying it into the archive in chunks
+        """
+        name = self._unique_name(filename)
+        # The entry's size is not known when it is opened for writing, so
+        # ZIP64 headers must be asked for up front, with zipfile's own margin
+        force_zip64 = os.path.getsize(path) * 1.05 > zipfile.ZIP64_LIMIT
+        with open(path, "rb") as src, self._zip.open(name, "w", force_zip64=force_zip64) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        self.count += 1
+        return name
+
+    def finish(self) -> "ZipExporter":
+        """
+        Write the ZIP central directory. No more files can be added afterwards.
+        """
+        with self._lock:
+            if self._zip is not None:
+                self._zip.close()
+                self._zip = None
+        return self
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            return self._file.tell()
+
+    def read(self, limit: Optional[int] = None) -> bytes:
+        """
+        Returns: the finished archive's bytes
+        Raises: ValueError if it is larger than limit bytes, or was closed
+        """
+        self.finish()
+        with self._lock:
+            if self._file.closed:
+                raise ValueError("The archive was discarded")
+            size = self._file.seek(0, os.SEEK_END)
+            if limit is not None and size > limit:
+                raise ValueError(f"The archive is {size:,} bytes, over the {limit:,} byte limit")
+            self._file.seek(0)
+            return self._file.read()
+
+    def spill(self) -> None:
+        """
+        Move the archive to disk if it is still held in memory
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._file.rollover()
+
+    def close(self) -> None:
+        self.finish()
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,749 @@
+"""
+Background unlock jobs.
+
+"Remove Passwords" submits a Job to a JobManager instead of unlocking inside
+the Streamlit script run. The job runs on a manager thread (which in turn
+drives the process pools in unlocker.py), so reruns caused by widget
+interaction no longer interrupt a batch. The app keeps only job IDs in the
+session and polls each Job for progress and results.
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+from export import ZipExporter
+from metrics import FileMetrics
+from pipeline import Pipeline
+from scheduler import Scheduler
+from unlocker import (
+    DEFAULT_LEVEL,
+    part_filename,
+    split_parts,
+    unlock_batch,
+    unlock_files,
+    unlock_pdf,
+    unlock_pdf_file,
+    unlocked_filename,
+)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+# How often the manager spills and expires finished jobs
+HOUSEKEEPING_SECONDS = 30
+
+@dataclass
+class JobOptions:
+    passwords: Dict[str, str]
+    candidates: List[str] = field(default_factory=list)
+    use_parallel: bool = False
+    max_workers: int = 1
+    zip_compression: str = "stored"
+    large_files: bool = False
+    profile: str = "fast"
+    level: int = DEFAULT_LEVEL
+    # Page selection per file name, e.g. "1-10, 15"; files without one keep every page
+    pages: Dict[str, str] = field(default_factory=dict)
+    # Split every file into parts of this many pages (0 = don't split)
+    split_every: int = 0
+    # Metadata rewrite and re-encryption, run on every output in the same
+    # pass that unlocks it
+    pipeline: Optional[Pipeline] = None
+    # Files merged, in this order, into one document named merge_name
+    # instead of being written separately
+    merge: List[str] = field(default_factory=list)
+    merge_name: str = "merged.pdf"
+
+@dataclass
+class Job:
+    """
+    One submitted batch. Written by the job's thread, read by the app.
+    files are the uploaded files (anything with name, size, getbuffer() and
+    getvalue()) and triage their pre-flight results by file name; both are
+    released once the job has run.
+    """
+    files: list
+    triage: dict
+    options: JobOptions
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    message: str = ""
+    done: int = 0
+    total: int = 0
+    # (name, status, message) per file, in upload order
+    results: List[Tuple[str, str, str]] = field(default_factory=list)
+    # (filename, bytes or path to a spooled file) per unlocked file
+    unlocked_files: list = field(default_factory=list)
+    zip_export: Optional[ZipExporter] = None
+    spool_dir: Optional[str] = None
+    cache_stats: Optional[dict] = None
+    metrics: List[dict] = field(default_factory=list)
+    created: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    # Found by run_recovery_job; never part of results, only handed out
+    # once by reveal_password()
+    recovered_password: Optional[str] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        self.file_count = len(self.files)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, CANCELLED, FAILED)
+
+    @property
+    def progress(self) -> float:
+        if self.finished:
+            return 1.0
+        return self.done / self.total if self.total else 0.0
+
+    @property
+    def label(self) -> str:
+        started = time.strftime("%H:%M:%S", time.localtime(self.created))
+        return f"Started {started} · {self.file_count} file(s)"
+
+    @property
+    def memory_bytes(self) -> int:
+        """
+        Bytes of results held in memory (spooled results are on disk)
+        """
+        return sum(len(unlocked) for _, unlocked in self.unlocked_files if not isinstance(unlocked, str))
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    def reveal_password(self) -> Optional[str]:
+        """
+        Returns: the recovered password, on the first call only; None after
+        that or if none was recovered
+        """
+        password, self.recovered_password = self.recovered_password, None
+        return password
+
+    def spill(self) -> None:
+        """
+        Move results held in memory to files in the job's spool directory
+        """
+        if self.zip_export is not None:
+            self.zip_export.spill()
+        if not self.memory_bytes:
+            return
+        if self.spool_dir is None:
+            self.spool_dir = tempfile.mkdtemp(prefix="pdf_unlock_")
+        spilled = []
+        for index, (fname, unlocked) in enumerate(self.unlocked_files):
+            if not isinstance(unlocked, str):
+                path = os.path.join(self.spool_dir, f"spill_{index}.pdf")
+                with open(path, "wb") as f:
+                    f.write(unlocked)
+                unlocked = path
+            spilled.append((fname, unlocked))
+        # Swapped in one step; the app may be reading the old list
+        self.unlocked_files = spilled
+
+    def cleanup(self) -> None:
+        """
+        Delete the job's ZIP and spooled files
+        """
+        if self.zip_export is not None:
+            self.zip_export.close()
+            self.zip_export = None
+        if self.spool_dir is not None:
+            shutil.rmtree(self.spool_dir, ignore_errors=True)
+            self.spool_dir = None
+
+def estimate_memory(files, options: JobOptions) -> int:
+    """
+    Rough peak memory of a job beyond the uploads themselves, for admission
+    control. In memory each file is copied once for its worker and once as
+    output; workers need a few times the file being unlocked. Large-file
+    mode only holds what the workers are working on.
+    """
+    sizes = [file.size for file in files] or [0]
+    workers = options.max_workers if options.use_parallel else 1
+    in_flight = 4 * max(sizes) * min(workers, len(sizes))
+    if options.large_files:
+        return in_flight
+    return 2 * sum(sizes) + in_flight
+
+class JobManager:
+    """
+    Runs each job on its own thread once the Scheduler admits it, and keeps
+    jobs, by ID, until they are discarded or have been finished for longer
+    than keep_seconds. Results of jobs finished more than spill_seconds ago,
+    or needed to make room for a waiting job, are spilled to disk.
+    """
+
+    def __init__(self, scheduler: Scheduler, keep_seconds: float = 3600, spill_seconds: float = 600):
+        self.scheduler = scheduler
+        self.keep_seconds = keep_seconds
+        self.spill_seconds = spill_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._discarded = set()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._housekeeping, name="unlock-jobs-housekeeping", daemon=True).start()
+
+    def submit(self, job: Job, fn: Callable[..., None], *args) -> str:
+        """
+        Queue fn(job, *args) to run in the background.
+        Returns: the job ID
+        """
+        with self._lock:
+            self._jobs[job.id] = job
+        threading.Thread(target=self._run, args=(job, fn) + args, name=f"unlock-job-{job.id[:8]}", daemon=True).start()
+        return job.id
+
+    def _run(self, job: Job, fn: Callable[..., None], *args) -> None:
+        admitted = False
+        try:
+            options = job.options
+            cpus = self.scheduler.acquire(
+                job.id,
+                options.max_workers if options.use_parallel else 1,
+                estimate_memory(job.files, options),
+                cancel=job.cancel_event,
+                make_room=self._make_room,
+            )
+            if cpus is not None:
+                admitted = True
+                # Never run more workers than the scheduler granted
+                job.options = replace(options, max_workers=min(options.max_workers, cpus))
+                job.status = RUNNING
+                fn(job, *args)
+            job.status = CANCELLED if job.cancel_event.is_set() else DONE
+        except Exception as e:
+            job.message = f"Job failed: {str(e)}"
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            job.files = []
+            job.triage = {}
+            with self._lock:
+                discarded = job.id in self._discarded
+                self._discarded.discard(job.id)
+            if discarded:
+                job.cleanup()
+            self._update_retained()
+            if admitted:
+                self.scheduler.release(job.id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """
+        Returns: the job's place in the admission queue, or None if not waiting
+        """
+        return self.scheduler.position(job_id)
+
+    def cancel(self, job_id: str) -> None:
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def discard(self, job_id: str) -> None:
+        """
+        Forget a job, cancelling it first if it is still running. Its files
+        are deleted now, or when its thread finishes.
+        """
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is not None and not job.finished:
+                self._discarded.add(job_id)
+        if job is None:
+            return
+        job.cancel()
+        if job.finished:
+            job.cleanup()
+            self._update_retained()
+
+    def _finished_jobs(self) -> List[Job]:
+        # Oldest first
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.finished]
+        return sorted(jobs, key=lambda job: job.finished_at)
+
+    def _update_retained(self) -> None:
+        self.scheduler.set_retained(sum(job.memory_bytes for job in self._finished_jobs()))
+
+    def _make_room(self, num_bytes: int) -> None:
+        # Spill the oldest results until num_bytes more would fit the budget
+        for job in self._finished_jobs():
+            stats = self.scheduler.stats()
+            if stats["memory_used"] + num_bytes <= stats["memory_bytes"]:
+                break
+            if job.memory_bytes:
+                job.spill()
+                self._update_retained()
+
+    def housekeep(self) -> None:
+        """
+        Spill results older than spill_seconds and drop jobs older than keep_seconds
+        """
+        now = time.time()
+        for job in self._finished_jobs():
+            age = now - job.finished_at
+            if age > self.keep_seconds:
+                # Jobs whose sessions went away are never discarded explicitly
+                self.discard(job.id)
+            elif age > self.spill_seconds:
+                job.spill()
+        self._update_retained()
+
+    def _housekeeping(self) -> None:
+        while True:
+            time.sleep(HOUSEKEEPING_SECONDS)
+            try:
+                self.housekeep()
+            except Exception:
+                pass
+
+def run_unlock_job(job: Job, result_cache, recorder) -> None:
+    """
+    Unlock a job's files: match candidate passwords, serve repeats from
+    result_cache (a ResultCache), unlock the rest, merge the files to be
+    merged and build the ZIP. The job's pipeline stages run on every output.
+    Per-file metrics go to recorder (a MetricsRecorder). Progress, results
+    and downloads are written to the job as they become available.
+    """
+    # Imports pypdf, which the app only loads once there is work for it
+    from pages import format_page_ranges
+    from passwords import match_passwords
+    from pipeline import merge_pdf_files, start_merge
+    from triage import NOT_ENCRYPTED
+
+    options = job.options
+    uploaded_files = job.files
+    triage = job.triage
+    passwords = dict(options.passwords)
+    candidates = options.candidates
+    large_files = options.large_files
+    max_workers = options.max_workers
+    cancel = job.cancel_event
+    pipeline = options.pipeline if options.pipeline is not None and options.pipeline.active else None
+    output_options = dict(profile=options.profile, level=options.level, pipeline=pipeline)
+    page_selections = {name: spec.strip() for name, spec in options.pages.items() if spec.strip()}
+    splitting = options.split_every > 0
+    merging = bool(options.merge)
+
+    # The ZIP is written as files finish
+    zip_export = ZipExporter(options.zip_compression) if len(uploaded_files) > 1 or splitting else None
+    job.zip_export = zip_export
+
+    # In large-file mode, and for the parts of split files, results are
+    # files in the job's spool directory, and result tuples carry their
+    # path instead of bytes
+    spool_dir = tempfile.mkdtemp(prefix="pdf_unlock_") if large_files or splitting or merging else None
+    job.spool_dir = spool_dir
+
+    # Per-file stage timings, sizes and algorithm for the results table
+    file_metrics = {}
+
+    def export(file, result):
+        unlocked, success, _ = result
+        if success and zip_export is not None:
+            with file_metrics[file.name].stage("zip"):
+                if large_files:
+                    zip_export.add_file(unlocked_filename(file.name), unlocked)
+                else:
+                    zip_export.add(unlocked_filename(file.name), unlocked)
+
+    def cached_metrics(file, result):
+        unlocked, success, _ = result
+        output_bytes = 0
+        if success:
+            output_bytes = os.path.getsize(unlocked) if isinstance(unlocked, str) else len(unlocked)
+        file_metrics[file.name] = FileMetrics(
+            filename=file.name,
+            algorithm=triage[file.name].algorithm,
+            pages=triage[file.name].page_count,
+            input_bytes=file.size,
+            output_bytes=output_bytes,
+            success=success,
+            cached=True,
+        )
+
+    def spool_path(file, kind):
+        return os.path.join(spool_dir, f"{kind}_{uploaded_files.index(file)}.pdf")
+
+    # Candidate passwords are checked with key derivation only;
+    # each file is then unlocked once, with the password that matched
+    matched = {}
+    needs_password = [file for file in uploaded_files if triage[file.name].needs_password]
+    if candidates:
+        job.message = f"Matching {len(candidates)} candidate password(s) against {len(needs_password)} file(s)..."
+        matches = match_passwords(
+            [triage[file.name].params for file in needs_password],
+            candidates,
+            max_workers=max_workers,
+            cancel=cancel,
+        )
+        for file, match in zip(needs_password, matches):
+            if match is not None:
+                matched[file.name] = match
+                passwords[file.name] = candidates[match]
+
+    # Files to merge are read by one worker, which writes the merged
+    # document while the other files are unlocked (given more than one CPU);
+    # unprotected files can be merged too
+    by_name = {file.name: file for file in uploaded_files}
+    to_merge = [
+        by_name[name] for name in options.merge
+        if name in by_name and (name in passwords or triage[name].status == NOT_ENCRYPTED)
+    ]
+    merge_result = None
+    merge_future = None
+    merged_path = os.path.join(spool_dir, "merged.pdf") if merging else None
+    if to_merge and not cancel.is_set():
+        for file in to_merge:
+            with open(spool_path(file, "in"), "wb") as f:
+                f.write(file.getbuffer())
+        merge_sources = [
+            (file.name, spool_path(file, "in"), passwords.get(file.name, ""), page_selections.get(file.name))
+            for file in to_merge
+        ]
+        job.total += 1
+        if options.use_parallel and max_workers > 1:
+            merge_future = start_merge(merge_sources, merged_path, pipeline, options.profile, options.level)
+            # The merge worker takes one of the job's CPUs
+            max_workers -= 1
+        else:
+            # With a single CPU granted the merge runs first, in this
+            # process, rather than beside a worker on the same CPU
+            job.message = f"Merging {len(to_merge)} file(s)..."
+            merge_metrics = FileMetrics()
+            merge_result = (merge_pdf_files(
+                merge_sources, merged_path, metrics=merge_metrics, workers=max_workers, **output_options
+            ), merge_metrics)
+            job.done += 1
+    merged_names = {file.name for file in to_merge}
+
+    # Split files are written part by part below, outside the result cache
+    to_split = [file for file in uploaded_files if file.name in passwords and file.name not in merged_names] \
+        if splitting else []
+
+    # Identical uploads (same content, password and pages) are unlocked
+    # once; anything unlocked before comes from the result cache
+    to_process = [
+        file for file in uploaded_files if file.name in passwords and file.name not in merged_names and not splitting
+    ]
+
+    # Output under a new password is never cached: the cache would have to
+    # key it on that password
+    use_cache = not large_files and (pipeline is None or not pipeline.password)
+
+    def cache_options(file):
+        # Fast output of whole files keeps the cache keys it had before
+        # output profiles, page selections and pipeline stages existed
+        parts = [f"{options.profile}:{options.level}"] if options.profile != "fast" else []
+        if file.name in page_selections:
+            parts.append(f"pages={page_selections[file.name]}")
+        if pipeline is not None:
+            parts.append(f"metadata={sorted(pipeline.metadata.items())}:{pipeline.clear_metadata}")
+        return ";".join(parts)
+
+    keys = {
+        file.name: result_cache.key(file.getbuffer(), passwords[file.name], cache_options(file))
+        for file in to_process
+    }
+    batch_results = {}
+    from_cache = set()
+    pending = {}
+    for file in to_process:
+        key = keys[file.name]
+        if key in pending:
+            continue
+        cached = result_cache.get(key) if use_cache else None
+        if cached is not None:
+            batch_results[file.name] = cached
+            from_cache.add(file.name)
+            cached_metrics(file, cached)
+            export(file, cached)
+        else:
+            pending[key] = file
+    unique_files = list(pending.values())
+    job.total += len(unique_files)
+
+    def finish_file(file, result):
+        if use_cache:
+            result_cache.put(keys[file.name], result)
+        batch_results[file.name] = result
+        export(file, result)
+        job.done += 1
+        job.message = f"Finished {file.name} ({job.done}/{job.total})"
+
+    def new_metrics(file, metrics=None):
+        metrics = metrics or FileMetrics()
+        metrics.filename = file.name
+        file_metrics[file.name] = metrics
+        return metrics
+
+    if options.use_parallel and unique_files and not cancel.is_set():
+        def on_metrics(index, metrics):
+            new_metrics(unique_files[index], metrics)
+
+        def on_result(index, result):
+            finish_file(unique_files[index], result)
+
+        if large_files:
+            # Workers read and write the spooled files themselves
+            jobs = []
+            for file in unique_files:
+                with open(spool_path(file, "in"), "wb") as f:
+                    f.write(file.getbuffer())
+                jobs.append((spool_path(file, "in"), spool_path(file, "out"), passwords[file.name]))
+
+            def on_file_result(index, result):
+                success, message = result
+                os.remove(jobs[index][0])
+                on_result(index, (jobs[index][1] if success else None, success, message))
+
+            job.message = f"Processing {len(jobs)} file(s) with {max_workers} worker(s)..."
+            unlock_files(
+                jobs, max_workers=max_workers, on_result=on_file_result, on_metrics=on_metrics, cancel=cancel,
+                pages=[page_selections.get(file.name) for file in unique_files], **output_options
+            )
+        else:
+            jobs = [(file.getvalue(), passwords[file.name]) for file in unique_files]
+            job.message = f"Processing {len(jobs)} file(s) with {max_workers} worker(s)..."
+            unlock_batch(
+                jobs, max_workers=max_workers, on_result=on_result, on_metrics=on_metrics, cancel=cancel,
+                pages=[page_selections.get(file.name) for file in unique_files], **output_options
+            )
+    else:
+        for file in unique_files:
+            if cancel.is_set():
+                break
+            job.message = f"Processing {file.name}..."
+            metrics = new_metrics(file)
+            if large_files:
+                # Spooling the input keeps the upload's position untouched,
+                # since the app may still be reading it
+                with open(spool_path(file, "in"), "wb") as f:
+                    f.write(file.getbuffer())
+                success, message = unlock_pdf_file(
+                    spool_path(file, "in"), spool_path(file, "out"), passwords[file.name], metrics=metrics,
+                    workers=max_workers, pages=page_selections.get(file.name), **output_options
+                )
+                os.remove(spool_path(file, "in"))
+                finish_file(file, (spool_path(file, "out") if success else None, success, message))
+            else:
+                finish_file(file, unlock_pdf(
+                    io.BytesIO(file.getvalue()), passwords[file.name], metrics=metrics,
+                    workers=max_workers, pages=page_selections.get(file.name), **output_options
+                ))
+
+    # Each split file's parts are unlocked in parallel by workers that read
+    # the spooled upload themselves and write their part next to it; parts
+    # go into the ZIP as they finish
+    split_results = {}
+    part_metrics = []
+    for file in to_split:
+        if cancel.is_set():
+            break
+        job.message = f"Splitting {file.name}..."
+        with open(spool_path(file, "in"), "wb") as f:
+            f.write(file.getbuffer())
+        try:
+            parts = split_parts(
+                spool_path(file, "in"), passwords[file.name], options.split_every, page_selections.get(file.name)
+            )
+        except ValueError as e:
+            os.remove(spool_path(file, "in"))
+            split_results[file.name] = ([], [str(e)], 0)
+            continue
+        names = [part_filename(unlocked_filename(file.name), part) for part in parts]
+        part_jobs = [
+            (spool_path(file, "in"), os.path.join(spool_dir, f"part_{uploaded_files.index(file)}_{index}.pdf"),
+             passwords[file.name])
+            for index in range(len(parts))
+        ]
+        written = []
+        errors = []
+        job.total += len(parts)
+
+        # Called from unlock_files() below, within this iteration
+        def on_part_metrics(index, metrics):
+            metrics.filename = names[index]
+            part_metrics.append(metrics)
+
+        def on_part(index, result):
+            success, message = result
+            if success:
+                if zip_export is not None:
+                    with part_metrics[-1].stage("zip"):
+                        zip_export.add_file(names[index], part_jobs[index][1])
+                written.append((index, names[index], part_jobs[index][1]))
+            else:
+                errors.append(message)
+            job.done += 1
+            job.message = f"Finished {names[index]} ({job.done}/{job.total})"
+
+        unlock_files(
+            part_jobs, max_workers=max_workers, on_result=on_part, on_metrics=on_part_metrics, cancel=cancel,
+            pages=[format_page_ranges(part) for part in parts], **output_options
+        )
+        os.remove(spool_path(file, "in"))
+        split_results[file.name] = ([(name, path) for _, name, path in sorted(written)], errors, len(parts))
+
+    if merge_future is not None:
+        job.message = f"Merging {len(to_merge)} file(s)..."
+        try:
+            merge_result = merge_future.result()
+        except Exception as e:
+            merge_result = ((False, f"Error processing PDF: {str(e)}"), FileMetrics())
+        job.done += 1
+    for file in to_merge:
+        os.remove(spool_path(file, "in"))
+    if merge_result is not None:
+        (merge_success, merge_message), merge_metrics = merge_result
+        merge_metrics.filename = options.merge_name
+        if merge_success and zip_export is not None:
+            with merge_metrics.stage("zip"):
+                zip_export.add_file(options.merge_name, merged_path)
+
+    # Duplicates within the batch share the first copy's result
+    for file in to_process:
+        original = pending.get(keys[file.name])
+        if file.name not in batch_results and original is not None and original.name in batch_results:
+            batch_results[file.name] = batch_results[original.name]
+            from_cache.add(file.name)
+            cached_metrics(file, batch_results[file.name])
+            export(file, batch_results[file.name])
+
+    # Collect results in upload order
+    stages_note = f" · {pipeline.describe()}" if pipeline is not None else ""
+    results = []
+    unlocked_files = []
+    for file in uploaded_files:
+        if file.name in merged_names:
+            if merge_result is None:
+                results.append((file.name, "⚠️ Cancelled", "Cancelled before this file was merged"))
+            elif merge_success:
+                results.append((file.name, "✅ Success", f"Merged into {options.merge_name}"))
+            else:
+                results.append((file.name, "❌ Failed", merge_message))
+        elif file.name in split_results:
+            written, errors, part_count = split_results[file.name]
+            unlocked_files.extend(written)
+            if written and not errors and len(written) == part_count:
+                results.append((
+                    file.name, "✅ Success", f"Password removed and split into {part_count} part(s){stages_note}"
+                ))
+            elif written:
+                results.append((
+                    file.name, "❌ Failed",
+                    f"Only {len(written)} of {part_count} part(s) unlocked: {errors[0] if errors else 'cancelled'}"
+                ))
+            else:
+                results.append((file.name, "❌ Failed", errors[0] if errors else "Cancelled before this file was split"))
+        elif file.name in batch_results:
+            unlocked, success, message = batch_results[file.name]
+            if success:
+                unlocked_files.append((unlocked_filename(file.name), unlocked))
+                message = "Password removed successfully"
+                if file.name in matched:
+                    message += f" with candidate #{matched[file.name] + 1}"
+                if file.name in from_cache:
+                    message += " (cached)"
+                if options.profile != "fast" and file.name in file_metrics:
+                    metrics = file_metrics[file.name]
+                    message += (
+                        f" · {metrics.input_bytes / 1024:,.0f} KB → {metrics.output_bytes / 1024:,.0f} KB"
+                        f" ({metrics.stages.get('optimize', 0.0):.2f}s optimizing)"
+                    )
+                results.append((file.name, "✅ Success", message + stages_note))
+            else:
+                results.append((file.name, "❌ Failed", message))
+        elif cancel.is_set() and (file.name in passwords or (candidates and triage[file.name].needs_password)):
+            results.append((file.name, "⚠️ Cancelled", "Cancelled before this file was unlocked"))
+        elif candidates and triage[file.name].needs_password:
+            results.append((file.name, "❌ Failed", "None of the candidate passwords matched"))
+        else:
+            results.append((file.name, "⚠️ Skipped", triage[file.name].message or "No password provided"))
+
+    if merge_result is not None and merge_success:
+        unlocked_files.append((options.merge_name, merged_path))
+        results.append((
+            options.merge_name, "✅ Success",
+            f"Merged {len(to_merge)} file(s), {merge_metrics.pages} page(s){stages_note}"
+        ))
+
+    ordered_metrics = [file_metrics[file.name] for file in uploaded_files if file.name in file_metrics]
+    ordered_metrics += sorted(part_metrics, key=lambda metrics: metrics.filename)
+    if merge_result is not None:
+        ordered_metrics.append(merge_metrics)
+    recorder.record_many(ordered_metrics)
+
+    job.results = results
+    job.unlocked_files = unlocked_files
+    job.cache_stats = None if splitting else {"hits": len(from_cache), "misses": len(unique_files)}
+    job.metrics = [metrics.row() for metrics in ordered_metrics]
+    job.zip_export = zip_export.finish() if zip_export is not None else None
+    job.message = "Cancelled" if cancel.is_set() else "Processing complete!"
+
+def run_recovery_job(job: Job, result_cache, recorder, keyspace) -> None:
+    """
+    Search keyspace (a recovery.Keyspace) for the password of the job's only
+    file on job.options.max_workers processes, reporting candidates/sec and
+    ETA as the job's progress. A found password is then used to unlock the
+    file as run_unlock_job does. The password itself stays out of the
+    results and options; it is kept for a single job.reveal_password().
+    A cancelled search can be resumed by submitting the same search again.
+    """
+    from recovery import format_duration, recover_password
+
+    file = job.files[0]
+
+    def on_progress(progress):
+        job.total = progress.total
+        job.done = progress.checked
+        job.message = (
+            f"Checked {progress.checked:,} of {progress.total:,} candidates · "
+            f"{progress.rate:,.0f}/s · ETA {format_duration(progress.eta_seconds)}"
+        )
+
+    job.message = f"Recovering the password of {file.name}..."
+    result = recover_password(
+        job.triage[file.name].params,
+        keyspace,
+        max_workers=job.options.max_workers,
+        on_progress=on_progress,
+        cancel=job.cancel_event,
+    )
+    searched = f"{result.checked - result.resumed_from:,} candidate(s) checked in {format_duration(result.seconds)}"
+    if result.resumed_from:
+        searched += f", resumed at {result.resumed_from:,}"
+    if result.password is None:
+        if result.exhausted:
+            job.results = [(file.name, "❌ Failed", f"No candidate matched ({searched})")]
+            job.message = "Password not found"
+        else:
+            stopped = f"Stopped after {result.checked:,} of {result.total:,} candidates"
+            job.results = [(file.name, "⚠️ Cancelled", f"{stopped}; start the same search again to resume")]
+            job.message = "Cancelled"
+        return
+
+    job.options = replace(job.options, passwords={file.name: result.password}, candidates=[])
+    job.done = job.total = 0
+    try:
+        run_unlock_job(job, result_cache, recorder)
+    finally:
+        job.options = replace(job.options, passwords={})
+    job.recovered_password = result.password
+    job.results = [
+        (name, status, f"Password recovered ({searched}) · {message}")
+        if name == file.name else (name, status, message)
+        for name, status, message in job.results
+    ]
@@ -1,67 +1,187 @@
 import streamlit as st
 import os
-import io
-from pypdf import PdfReader, PdfWriter
-import zipfile
-from typing import List, Tuple
-from component import page_style
+from cache import ResultCache
+from component import page_style, server_load
+from downloads import download_section
+from export import COMPRESSION_MODES
+from jobs import FAILED, Job, JobManager, JobOptions, run_recovery_job, run_unlock_job
+from metrics import MetricsRecorder
+from pipeline import Pipeline
+from scheduler import Scheduler
+from unlocker import DEFAULT_LEVEL, OUTPUT_PROFILES, default_workers
 
-def unlock_pdf(pdf_file, password: str) -> Tuple[bytes, bool, str]:
+# Uploads at least this big switch large-file mode on by default
+LARGE_FILE_BYTES = 100 * 1024 * 1024
+# Finished batches kept per session, newest first
+MAX_SESSION_JOBS = 5
+# How often a running batch's progress is refreshed
+JOB_POLL_SECONDS = 1.0
+
+@st.cache_resource
+def get_result_cache():
     """
-    Unlock a PDF file with the given password
-    Returns: (unlocked_pdf_bytes, success, error_message)
+    Process-wide cache of unlocked PDFs, shared by all sessions.
+    Configured with PDF_UNLOCK_CACHE_MB (memory limit, default 256),
+    PDF_UNLOCK_CACHE_DIR (optional on-disk tier) and PDF_UNLOCK_CACHE_DISK_MB
+    (disk limit, default 2048).
     """
-    try:
-        # Read the PDF
-        reader = PdfReader(pdf_file)
-        
-        # Check if PDF is encrypted
-        if not reader.is_encrypted:
-            return None, False, "PDF is not password protected"
-        
-        # Try to decrypt with the provided password
-        if not reader.decrypt(password):
-            return None, False, "Incorrect password"
-        
-        # Create a new PDF writer
-        writer = PdfWriter()
-        
-        # Copy all pages to the writer
-        for page in reader.pages:
-            writer.add_page(page)
-        
-        # Write to bytes buffer
-        output_buffer = io.BytesIO()
-        writer.write(output_buffer)
-        output_buffer.seek(0)
-        
-        return output_buffer.getvalue(), True, "Success"
-        
-    except Exception as e:
-        return None, False, f"Error processing PDF: {str(e)}"
+    return ResultCache(
+        max_bytes=int(os.environ.get("PDF_UNLOCK_CACHE_MB", "256")) * 1024 * 1024,
+        cache_dir=os.environ.get("PDF_UNLOCK_CACHE_DIR") or None,
+        disk_max_bytes=int(os.environ.get("PDF_UNLOCK_CACHE_DISK_MB", "2048")) * 1024 * 1024,
+    )
+
+@st.cache_resource
+def get_metrics_recorder():
+    """
+    Process-wide metrics sink. PDF_UNLOCK_METRICS_JSONL appends one JSON line
+    per file; PDF_UNLOCK_METRICS_PROM is rewritten with running totals in
+    Prometheus text format (e.g. for the node exporter's textfile collector).
+    """
+    return MetricsRecorder(
+        jsonl_path=os.environ.get("PDF_UNLOCK_METRICS_JSONL") or None,
+        prom_path=os.environ.get("PDF_UNLOCK_METRICS_PROM") or None,
+    )
+
+@st.cache_resource
+def get_job_manager():
+    """
+    Process-wide background job runner, shared by all sessions.
+    Admission is limited by PDF_UNLOCK_CPU_SLOTS worker processes (default:
+    number of CPUs), a PDF_UNLOCK_MEMORY_MB budget (default 1024) and,
+    optionally, PDF_UNLOCK_MAX_JOBS running batches. Results are spilled to
+    disk after PDF_UNLOCK_SPILL_AFTER seconds (default 600) and dropped after
+    PDF_UNLOCK_JOB_TTL seconds (default 3600).
+    """
+    max_jobs = os.environ.get("PDF_UNLOCK_MAX_JOBS")
+    scheduler = Scheduler(
+        cpu_slots=int(os.environ.get("PDF_UNLOCK_CPU_SLOTS", "0")) or default_workers(),
+        memory_bytes=int(os.environ.get("PDF_UNLOCK_MEMORY_MB", "1024")) * 1024 * 1024,
+        max_jobs=int(max_jobs) if max_jobs else None,
+    )
+    return JobManager(
+        scheduler,
+        keep_seconds=float(os.environ.get("PDF_UNLOCK_JOB_TTL", "3600")),
+        spill_seconds=float(os.environ.get("PDF_UNLOCK_SPILL_AFTER", "600")),
+    )
 
-def create_zip_file(unlocked_files: List[Tuple[str, bytes]]) -> bytes:
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress(job_id):
     """
-    Create a ZIP file containing multiple unlocked PDFs
+    Progress of a running job, refreshed on its own without rerunning the page
     """
-    zip_buffer = io.BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for filename, pdf_bytes in unlocked_files:
-            zip_file.writestr(filename, pdf_bytes)
-    
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        return
+    if job.finished:
+        # Rerun the whole page to show the results
+        st.rerun()
+    position = manager.position(job_id)
+    if position is not None:
+        stats = manager.scheduler.stats()
+        st.info(f"Queued: position {position} of {stats['queued']}, {stats['running']} batch(es) running")
+    st.progress(job.progress, text=job.message or "Waiting to start...")
+    if job.cancel_event.is_set():
+        st.caption("Cancelling - files already being unlocked will finish first")
+    elif st.button("Cancel", key=f"cancel_{job_id}"):
+        job.cancel()
+
+def submit_job(job, fn, *args):
+    """
+    Run fn(job, *args) in the background and remember the job in this session
+    """
+    manager = get_job_manager()
+    manager.submit(job, fn, *args)
+    st.session_state.job_ids.append(job.id)
+    # Older batches' results are dropped along with their files
+    while len(st.session_state.job_ids) > MAX_SESSION_JOBS:
+        manager.discard(st.session_state.job_ids.pop(0))
+
+def recovery_section(file, info):
+    """
+    Password recovery for a single file whose owner has forgotten its
+    password; info is the file's triage result
+    """
+    import datetime
+
+    from recovery import DEFAULT_FIRST_YEAR, build_keyspace, default_state_path, load_progress, search_fingerprint
+
+    with st.expander(f"🧩 Forgot the password of {file.name}?"):
+        st.caption(
+            "Tries candidates from a wordlist, a mask, or both on every CPU core, checking each one against "
+            "the file's encryption dictionary only. Once the password is found the file is unlocked as usual."
+        )
+        owner = st.checkbox(
+            "I own this file or am authorized to remove its password",
+            key=f"recovery_owner_{file.name}"
+        )
+        wordlist = st.file_uploader(
+            "Wordlist (one candidate per line):",
+            type=["txt"],
+            key=f"recovery_wordlist_{file.name}"
+        )
+        extra_words = st.text_area(
+            "More candidate words (one per line):",
+            key=f"recovery_words_{file.name}"
+        )
+        mask = st.text_input(
+            "Mask:",
+            placeholder="e.g. ?{DD}?{MM}?{YYYY} or CUST?d?d?d?d?d?d",
+            help="?d digit, ?l lowercase, ?u uppercase, ?s symbol, ?a any of those, ?w a word from the list; "
+                 "?{DD}, ?{MM}, ?{YY} and ?{YYYY} fill in real calendar dates; \\ makes the next character literal. "
+                 "With a wordlist, a mask without ?w is tried after each word.",
+            key=f"recovery_mask_{file.name}"
+        )
+        this_year = datetime.date.today().year
+        years = st.slider(
+            "Years for date placeholders:",
+            min_value=1900,
+            max_value=this_year,
+            value=(DEFAULT_FIRST_YEAR, this_year),
+            key=f"recovery_years_{file.name}"
+        )
+
+        words = extra_words.splitlines()
+        if wordlist is not None:
+            words = wordlist.getvalue().decode("utf-8", "replace").splitlines() + words
+        if not words and not mask.strip():
+            return
+        try:
+            keyspace = build_keyspace(words, mask.strip() or None, years)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        # Progress is saved per search, so the same search picks up where it stopped
+        fingerprint = search_fingerprint(info.params, keyspace)
+        resume_from = load_progress(default_state_path(fingerprint), fingerprint)
+        summary = f"{keyspace.size:,} candidate(s)"
+        if resume_from:
+            summary += f"; an earlier search stopped at {resume_from:,} and will be resumed"
+        st.caption(summary)
+        if st.button("Recover Password", disabled=not owner, key=f"recover_{file.name}"):
+            job = Job(
+                files=[file],
+                triage={file.name: info},
+                options=JobOptions(
+                    passwords={},
+                    use_parallel=True,
+                    max_workers=default_workers(),
+                    large_files=file.size >= LARGE_FILE_BYTES,
+                ),
+            )
+            submit_job(job, run_recovery_job, get_result_cache(), get_metrics_recorder(), keyspace)
 
 def main():
 
     page_style()
+    server_load(get_job_manager().scheduler.stats())
 
     # Initialize session state for persistence
-    if 'unlocked_files' not in st.session_state:
-        st.session_state.unlocked_files = []
-    if 'results' not in st.session_state:
-        st.session_state.results = []
+    if 'job_ids' not in st.session_state:
+        st.session_state.job_ids = []
+    if 'triage' not in st.session_state:
+        st.session_state.triage = {}
 
     st.title("🔓 PDF Password Remover")
     st.markdown("Upload password-protected PDFs and remove their passwords for easier access.")
@@ -76,115 +196,287 @@ def main():
     )
 
     if uploaded_files:
+        # These import pypdf; deferring them keeps it off the first render
+        from pages import parse_page_ranges
+        from passwords import parse_candidates
+        from triage import NOT_ENCRYPTED, OWNER_ONLY, triage_pdf
+
         st.success(f"Uploaded {len(uploaded_files)} file(s)")
         
-        # Password input section
-        st.header("🔑 Password Settings")
-        
-        # Toggle for same password
-        use_same_password = st.toggle(
-            "Use the same password for all PDFs",
-            value=True,
-            help="Enable this if all your PDFs have the same password"
-        )
-        
+        # Pre-flight check: classify each file from its trailer and /Encrypt
+        # dictionary only. Results are kept per upload so reruns don't rescan.
+        known = st.session_state.triage
+        triage = {}
+        for file in uploaded_files:
+            if file.file_id not in known:
+                known[file.file_id] = triage_pdf(file)
+            triage[file.name] = known[file.file_id]
+        st.session_state.triage = {file.file_id: known[file.file_id] for file in uploaded_files}
+
+        with st.expander("🔍 Encryption check", expanded=len(uploaded_files) <= 10):
+            for file in uploaded_files:
+                info = triage[file.name]
+                pages = f" · {info.page_count} page(s)" if info.page_count is not None else ""
+                st.markdown(f"**{file.name}**: {info.label}{pages}")
+
+        needs_password = [file for file in uploaded_files if triage[file.name].needs_password]
         passwords = {}
-        
-        if use_same_password:
-            # Single password input
-            common_password = st.text_input(
-                "Enter password for all PDFs:",
-                type="password",
-                help="This password will be used for all uploaded PDFs"
+        candidates = []
+
+        # Files with an empty open password only carry owner restrictions
+        for file in uploaded_files:
+            if triage[file.name].status == OWNER_ONLY:
+                passwords[file.name] = ""
+
+        if needs_password:
+            # Password input section
+            st.header("🔑 Password Settings")
+            
+            # Toggle for same password
+            use_same_password = st.toggle(
+                "Use the same password for all PDFs",
+                value=True,
+                help="Enable this if all your PDFs have the same password"
             )
             
-            if common_password:
-                for file in uploaded_files:
-                    passwords[file.name] = common_password
-        else:
-            # Individual password inputs
-            st.subheader("Enter password for each PDF:")
-            for file in uploaded_files:
-                password = st.text_input(
-                    f"Password for {file.name}:",
+            if use_same_password:
+                # Single password input
+                common_password = st.text_input(
+                    "Enter password for all PDFs:",
                     type="password",
-                    key=f"pwd_{file.name}"
+                    help="This password will be used for all uploaded PDFs"
+                )
+                
+                if common_password:
+                    for file in needs_password:
+                        passwords[file.name] = common_password
+            else:
+                use_candidates = st.toggle(
+                    "Match from a list of candidate passwords",
+                    help="Each candidate is checked against every file; only the one that matches is used to unlock it"
                 )
-                if password:
-                    passwords[file.name] = password
+                if use_candidates:
+                    candidates = parse_candidates(st.text_area(
+                        "Candidate passwords (one per line):",
+                        help="For example customer IDs or dates of birth. Passwords are never shown in the results."
+                    ))
+                else:
+                    # Individual password inputs
+                    st.subheader("Enter password for each PDF:")
+                    for file in needs_password:
+                        password = st.text_input(
+                            f"Password for {file.name}:",
+                            type="password",
+                            key=f"pwd_{file.name}"
+                        )
+                        if password:
+                            passwords[file.name] = password
+
+            if len(needs_password) == 1 and needs_password[0].name not in passwords:
+                recovery_section(needs_password[0], triage[needs_password[0].name])
         
         # Process PDFs section
-        if passwords:
+        if passwords or candidates:
             st.header("🔄 Process PDFs")
-            if st.button("Remove Passwords", type="primary"):
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-
-                unlocked_files = []
-                results = []
-
-                for i, file in enumerate(uploaded_files):
-                    if file.name in passwords:
-                        status_text.text(f"Processing {file.name}...")
-                        file.seek(0)
-                        unlocked_bytes, success, message = unlock_pdf(file, passwords[file.name])
-                        if success:
-                            name_without_ext = os.path.splitext(file.name)[0]
-                            output_filename = f"unlocked_{name_without_ext}.pdf"
-                            unlocked_files.append((output_filename, unlocked_bytes))
-                            results.append((file.name, "✅ Success", "Password removed successfully"))
-                        else:
-                            results.append((file.name, "❌ Failed", message))
-                    else:
-                        results.append((file.name, "⚠️ Skipped", "No password provided"))
-                    progress_bar.progress((i + 1) / len(uploaded_files))
-
-                status_text.text("Processing complete!")
-                # Save to session state
-                st.session_state.unlocked_files = unlocked_files
-                st.session_state.results = results
-
-            # Display results and download options if available
-            if st.session_state.results:
-                st.header("📊 Results")
-                for fname, status, msg in st.session_state.results:
-                    if "Success" in status:
-                        st.success(f"**{fname}**: {msg}")
-                    elif "Failed" in status:
-                        st.error(f"**{fname}**: {msg}")
-                    else:
-                        st.warning(f"**{fname}**: {msg}")
-
-                if st.session_state.unlocked_files:
-                    st.header("⬇️ Download Unlocked PDFs")
-                    if len(st.session_state.unlocked_files) == 1:
-                        fname, pdf_bytes = st.session_state.unlocked_files[0]
-                        st.download_button(
-                            label=f"Download {fname}",
-                            data=pdf_bytes,
-                            file_name=fname,
-                            mime="application/pdf"
-                        )
-                    else:
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            zip_bytes = create_zip_file(st.session_state.unlocked_files)
-                            st.download_button(
-                                label="Download All as ZIP",
-                                data=zip_bytes,
-                                file_name="unlocked_pdfs.zip",
-                                mime="application/zip"
-                            )
-                        with col2:
-                            st.subheader("Individual Downloads:")
-                            for fname, pdf_bytes in st.session_state.unlocked_files:
-                                st.download_button(
-                                    label=f"📄 {fname}",
-                                    data=pdf_bytes,
-                                    file_name=fname,
-                                    mime="application/pdf",
-                                    key=f"download_{fname}"
-                                )
+            use_parallel = st.toggle(
+                "Process files in parallel",
+                value=len(uploaded_files) > 1,
+                help="Unlock several PDFs at once using multiple CPU cores"
+            )
+            max_workers = default_workers()
+            if use_parallel:
+                max_workers = st.number_input(
+                    "Worker processes:",
+                    min_value=1,
+                    max_value=max(default_workers() * 2, 1),
+                    value=default_workers(),
+                    help="Number of PDFs unlocked at the same time"
+                )
+            zip_compression = "stored"
+            if len(uploaded_files) > 1:
+                zip_compression = st.selectbox(
+                    "ZIP compression:",
+                    list(COMPRESSION_MODES),
+                    help="PDFs are already compressed, so 'stored' is usually just as small and much faster"
+                )
+            profile = st.selectbox(
+                "Output profile:",
+                list(OUTPUT_PROFILES),
+                help="'fast' copies streams unchanged; 'compact' merges duplicate objects and images, "
+                     "packs objects into object streams and recompresses streams for a smaller file"
+            )
+            level = DEFAULT_LEVEL
+            if profile == "compact":
+                level = st.slider(
+                    "Compression level:",
+                    min_value=1,
+                    max_value=9,
+                    value=DEFAULT_LEVEL,
+                    help="Higher levels give smaller files but take longer"
+                )
+            large_files = st.toggle(
+                "Large-file mode",
+                value=any(file.size >= LARGE_FILE_BYTES for file in uploaded_files),
+                help="Write unlocked PDFs straight to temporary files on disk instead of keeping them in memory. "
+                     "Recommended for very large (e.g. scanned) documents."
+            )
+            # Only some pages, or fixed-size parts, of very long documents
+            page_selections = {}
+            page_errors = False
+            with st.expander("📄 Pages"):
+                split_every = st.number_input(
+                    "Split into parts of (pages):",
+                    min_value=0,
+                    value=0,
+                    help="Write every this many pages as a separate PDF; parts are unlocked in parallel. "
+                         "0 keeps each document whole."
+                )
+                for file in uploaded_files:
+                    if file.name not in passwords and not (candidates and triage[file.name].needs_password):
+                        continue
+                    spec = st.text_input(
+                        f"Pages of {file.name}:",
+                        key=f"pages_{file.name}",
+                        placeholder="All pages, or e.g. 1-10, 15, 20-",
+                        help="Only these pages, and what they use, are decrypted and written"
+                    )
+                    if not spec.strip():
+                        continue
+                    # Files whose page count is encrypted are checked when unlocked
+                    if triage[file.name].page_count is not None:
+                        try:
+                            parse_page_ranges(spec, triage[file.name].page_count)
+                        except ValueError as e:
+                            st.error(f"**{file.name}**: {str(e)}")
+                            page_errors = True
+                            continue
+                    page_selections[file.name] = spec
+            # Further stages, run in the same pass that unlocks each file
+            with st.expander("🧰 Output stages"):
+                new_password = st.text_input(
+                    "Re-encrypt with password (AES-256):",
+                    type="password",
+                    key="new_password",
+                    help="Protect every output with this password, e.g. a company-standard one. "
+                         "Leave empty for unprotected output."
+                )
+                owner_password = ""
+                if new_password:
+                    owner_password = st.text_input(
+                        "Owner password (optional):",
+                        type="password",
+                        key="new_owner_password",
+                        help="Defaults to the new password"
+                    )
+                metadata = {}
+                for key in ("Title", "Author", "Subject", "Keywords"):
+                    value = st.text_input(f"{key}:", key=f"meta_{key}", placeholder="Keep as is")
+                    if value:
+                        metadata[key] = value
+                clear_metadata = st.checkbox(
+                    "Remove all other metadata",
+                    help="Drop every document information entry not set above"
+                )
+                merge = []
+                merge_name = "merged.pdf"
+                mergeable = [
+                    file.name for file in uploaded_files
+                    if file.name in passwords or triage[file.name].status == NOT_ENCRYPTED
+                    or (candidates and triage[file.name].needs_password)
+                ]
+                if len(mergeable) > 1:
+                    merge = st.multiselect(
+                        "Merge into one PDF:",
+                        mergeable,
+                        help="The pages of these files, in the order selected, are written to one document "
+                             "instead of separate files"
+                    )
+                    if merge:
+                        merge_name = st.text_input("Merged file name:", value="merged.pdf").strip() or "merged.pdf"
+                        if not merge_name.lower().endswith(".pdf"):
+                            merge_name += ".pdf"
+            if st.button("Remove Passwords", type="primary", disabled=page_errors):
+                # The batch runs in the background; the session only keeps
+                # the job ID, so reruns don't interrupt it
+                job = Job(
+                    files=list(uploaded_files),
+                    triage=triage,
+                    options=JobOptions(
+                        passwords=passwords,
+                        candidates=candidates,
+                        use_parallel=use_parallel,
+                        max_workers=max_workers,
+                        zip_compression=zip_compression,
+                        large_files=large_files,
+                        profile=profile,
+                        level=level,
+                        pages=page_selections,
+                        split_every=int(split_every),
+                        pipeline=Pipeline(
+                            metadata=metadata,
+                            clear_metadata=clear_metadata,
+                            password=new_password or None,
+                            owner_password=owner_password or None,
+                        ),
+                        merge=merge,
+                        merge_name=merge_name,
+                    ),
+                )
+                submit_job(job, run_unlock_job, get_result_cache(), get_metrics_recorder())
+
+    # Batches submitted in this session, newest first
+    manager = get_job_manager()
+    jobs = [manager.get(job_id) for job_id in reversed(st.session_state.job_ids)]
+    jobs = [job for job in jobs if job is not None]
+    st.session_state.job_ids = [job.id for job in reversed(jobs)]
+    if not jobs:
+        return
+
+    job = jobs[0]
+    if len(jobs) > 1:
+        job = manager.get(st.selectbox(
+            "Batch:",
+            [job.id for job in jobs],
+            format_func=lambda job_id: manager.get(job_id).label
+        ))
+
+    if not job.finished:
+        st.header("🔄 Processing")
+        job_progress(job.id)
+        return
+
+    # Display results and download options
+    if job.status == FAILED:
+        st.error(job.message)
+    if job.results:
+        st.header("📊 Results")
+        for fname, status, msg in job.results:
+            if "Success" in status:
+                st.success(f"**{fname}**: {msg}")
+            elif "Failed" in status:
+                st.error(f"**{fname}**: {msg}")
+            else:
+                st.warning(f"**{fname}**: {msg}")
+        if job.recovered_password is not None and st.button("🔑 Reveal recovered password", key=f"reveal_{job.id}"):
+            password = job.reveal_password()
+            if password is not None:
+                st.code(password, language=None)
+                st.caption("Shown this once only: copy it now. It is not kept after the next interaction.")
+
+        if job.cache_stats is not None:
+            totals = get_result_cache().stats()
+            st.caption(
+                f"Result cache: {job.cache_stats['hits']} hit(s), "
+                f"{job.cache_stats['misses']} miss(es) in this batch · "
+                f"{totals['hits']} hit(s), {totals['misses']} miss(es) since startup"
+            )
+
+        if job.metrics:
+            with st.expander("⏱️ Timings"):
+                st.dataframe(job.metrics, hide_index=True, use_container_width=True)
+
+        if job.unlocked_files:
+            download_section(job)
 
 # Run the main function
 main()
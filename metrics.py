@@ -0,0 +1,168 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+# Pipeline stages, in the order they run
+STAGES = ("parse", "key", "decrypt", "optimize", "serialize", "zip")
+
+# Upper bounds (seconds) of the per-file latency histogram
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+@dataclass
+class FileMetrics:
+    """
+    Timings and sizes for one file going through the unlock pipeline.
+    Stage times are accumulated with time.perf_counter(), which costs well
+    under a microsecond per call, so collection is always on.
+    """
+    filename: str = ""
+    algorithm: Optional[str] = None
+    pages: Optional[int] = None
+    input_bytes: int = 0
+    output_bytes: int = 0
+    success: bool = False
+    cached: bool = False
+    # Why the fast writer gave up and the page-by-page copy was used, if it was
+    fallback: Optional[str] = None
+    stages: Dict[str, float] = field(default_factory=dict)
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.stages.values())
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["stages"] = {k: round(v, 6) for k, v in self.stages.items()}
+        data["total_seconds"] = round(self.total_seconds, 6)
+        return data
+
+    def row(self) -> dict:
+        """
+        Flat dict for display in a table, stage times in milliseconds
+        """
+        row = {
+            "file": self.filename,
+            "algorithm": self.algorithm or "",
+            "pages": self.pages,
+            "input KB": round(self.input_bytes / 1024, 1),
+            "output KB": round(self.output_bytes / 1024, 1),
+        }
+        for stage in STAGES:
+            row[f"{stage} ms"] = round(self.stages.get(stage, 0.0) * 1000, 1)
+        row["total ms"] = round(self.total_seconds * 1000, 1)
+        row["cached"] = self.cached
+        row["fallback"] = self.fallback or ""
+        return row
+
+class MetricsRecorder:
+    """
+    Process-wide sink for FileMetrics.
+
+    Each record is appended as a JSON line to jsonl_path (if set), and
+    running totals are rewritten to prom_path (if set) in Prometheus text
+    format, atomically, for the node exporter's textfile collector.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, prom_path: Optional[str] = None):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        self.files_total: Dict[str, int] = {}
+        self.stage_seconds: Dict[str, float] = {}
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.fallbacks = 0
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.latency_count = 0
+        self.latency_sum = 0.0
+
+    def record(self, metrics: FileMetrics) -> None:
+        self.record_many([metrics])
+
+    def record_many(self, records: List[FileMetrics]) -> None:
+        if not records:
+            return
+        with self._lock:
+            for metrics in records:
+                status = "cached" if metrics.cached else ("success" if metrics.success else "failed")
+                self.files_total[status] = self.files_total.get(status, 0) + 1
+                for stage, seconds in metrics.stages.items():
+                    self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+                self.input_bytes += metrics.input_bytes
+                self.output_bytes += metrics.output_bytes
+                if metrics.fallback:
+                    self.fallbacks += 1
+                if not metrics.cached:
+                    total = metrics.total_seconds
+                    self.latency_count += 1
+                    self.latency_sum += total
+                    for i, bound in enumerate(LATENCY_BUCKETS):
+                        if total <= bound:
+                            self.bucket_counts[i] += 1
+            if self.jsonl_path:
+                now = time.time()
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    for metrics in records:
+                        f.write(json.dumps(dict(metrics.to_dict(), timestamp=now)) + "\n")
+            if self.prom_path:
+                self._write_prometheus()
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            return self._prometheus_text()
+
+    def _prometheus_text(self) -> str:
+        lines = [
+            "# HELP pdf_unlock_files_total Files processed by the PDF unlocker.",
+            "# TYPE pdf_unlock_files_total counter",
+        ]
+        for status, count in sorted(self.files_total.items()):
+            lines.append(f'pdf_unlock_files_total{{status="{status}"}} {count}')
+        lines += [
+            "# HELP pdf_unlock_stage_seconds_total Time spent in each unlock pipeline stage.",
+            "# TYPE pdf_unlock_stage_seconds_total counter",
+        ]
+        for stage, seconds in sorted(self.stage_seconds.items()):
+            lines.append(f'pdf_unlock_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}')
+        lines += [
+            "# HELP pdf_unlock_bytes_total Bytes read and written by the PDF unlocker.",
+            "# TYPE pdf_unlock_bytes_total counter",
+            f'pdf_unlock_bytes_total{{direction="in"}} {self.input_bytes}',
+            f'pdf_unlock_bytes_total{{direction="out"}} {self.output_bytes}',
+            "# HELP pdf_unlock_fallbacks_total Files the fast writer could not handle, copied page by page instead.",
+            "# TYPE pdf_unlock_fallbacks_total counter",
+            f"pdf_unlock_fallbacks_total {self.fallbacks}",
+            "# HELP pdf_unlock_file_seconds Time to unlock one file.",
+            "# TYPE pdf_unlock_file_seconds histogram",
+        ]
+        for bound, count in zip(LATENCY_BUCKETS, self.bucket_counts):
+            lines.append(f'pdf_unlock_file_seconds_bucket{{le="{bound}"}} {count}')
+        lines.append(f'pdf_unlock_file_seconds_bucket{{le="+Inf"}} {self.latency_count}')
+        lines.append(f"pdf_unlock_file_seconds_sum {self.latency_sum:.6f}")
+        lines.append(f"pdf_unlock_file_seconds_count {self.latency_count}")
+        return "\n".join(lines) + "\n"
+
+    def _write_prometheus(self) -> None:
+        # Caller holds self._lock. Write and rename so the collector never
+        # reads a half-written file.
+        directory = os.path.dirname(os.path.abspath(self.prom_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".prom.tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self._prometheus_text())
+        os.replace(tmp_path, self.prom_path)
@@ -0,0 +1,379 @@
+"""
+Output profiles for unlocked PDFs.
+
+"fast" writes the decrypted objects exactly as unlocker.write_decrypted
+reads them: streams are copied unchanged and nothing is merged. "compact"
+trades CPU time for a smaller file:
+
+- identical objects (fonts, images, ICC profiles, repeated resources) are
+  stored once and every reference points to the surviving copy
+- objects nothing refers to any more are dropped
+- FlateDecode streams, and streams that were stored uncompressed, are
+  recompressed at a chosen zlib level and kept only where that is smaller;
+  independent streams are spread over worker processes
+- all other non-stream objects are packed into compressed object streams
+  behind a cross-reference stream (PDF 1.5)
+
+Compacting holds the whole decrypted document in memory, like the "rebuild"
+unlock mode.
+"""
+import hashlib
+import io
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    NumberObject,
+    StreamObject,
+)
+
+from metrics import FileMetrics
+from unlocker import DEFAULT_LEVEL, ObjectWriter, decrypted_objects
+
+if TYPE_CHECKING:
+    from pipeline import Pipeline
+
+# Non-stream objects per object stream
+OBJECTS_PER_STREAM = 100
+
+# Streams are handed to worker processes in batches of about this many bytes
+BATCH_BYTES = 4 * 1024 * 1024
+
+# Files with fewer stream bytes than this are recompressed in-process;
+# starting a pool costs more than it saves
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+
+# Merging rounds; each round can expose new duplicates among objects that
+# referred to the copies merged in the round before
+MAX_DEDUPE_ROUNDS = 8
+
+# Objects whose identity matters even when their contents are identical:
+# page tree nodes, annotations, form fields, outline items, structure elements
+_UNIQUE_TYPES = ("/Catalog", "/Pages", "/Page", "/Annot", "/StructTreeRoot", "/StructElem", "/OCG", "/Sig")
+_UNIQUE_KEYS = ("/Parent", "/Rect", "/P")
+
+# Trailer entries carried over into the cross-reference stream
+_TRAILER_KEYS = ("/Root", "/Info", "/ID")
+
+def _recompress(data: bytes, filtered: bool, level: int) -> Optional[bytes]:
+    # Inflating only the Flate layer leaves predictor-encoded data as it
+    # was, so /DecodeParms stay valid
+    if filtered:
+        try:
+            data_in = zlib.decompress(data)
+        except zlib.error:
+            return None
+    else:
+        data_in = data
+    compressed = zlib.compress(data_in, level)
+    return compressed if len(compressed) < len(data) else None
+
+def _recompress_batch(batch: List[Tuple[int, bytes, bool]], level: int) -> List[Tuple[int, Optional[bytes]]]:
+    # Runs inside a worker process
+    return [(idnum, _recompress(data, filtered, level)) for idnum, data, filtered in batch]
+
+def _flate_candidate(obj: StreamObject) -> Optional[bool]:
+    """
+    Returns: True for Flate-only streams, False for unfiltered ones, None
+    for anything that can't be recompressed safely
+    """
+    filters = obj.get("/Filter")
+    if isinstance(filters, ArrayObject) and len(filters) == 1:
+        filters = filters[0]
+    if filters is None:
+        # PDF/A wants XMP metadata left readable
+        if "/DecodeParms" in obj or obj.get("/Type") == "/Metadata":
+            return None
+        return False
+    return True if filters == "/FlateDecode" else None
+
+def recompress_streams(objects: Dict[int, object], level: int = DEFAULT_LEVEL, workers: int = 1) -> int:
+    """
+    Recompress the Flate and unfiltered streams in objects (object number
+    to decrypted object) in place, keeping each new copy only if smaller.
+    Batches go to up to workers processes once there are enough bytes.
+    Returns: the number of bytes saved
+    """
+    candidates = []
+    for idnum, obj in objects.items():
+        if isinstance(obj, StreamObject):
+            filtered = _flate_candidate(obj)
+            if filtered is not None and obj._data:
+                candidates.append((idnum, obj._data, filtered))
+    total = sum(len(data) for _, data, _ in candidates)
+
+    batches = [[]]
+    batch_bytes = 0
+    for candidate in candidates:
+        if batch_bytes >= BATCH_BYTES:
+            batches.append([])
+            batch_bytes = 0
+        batches[-1].append(candidate)
+        batch_bytes += len(candidate[1])
+
+    if workers > 1 and total >= PARALLEL_MIN_BYTES and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+            done = [pair for batch in pool.map(_recompress_batch, batches, [level] * len(batches)) for pair in batch]
+    else:
+        done = [pair for batch in batches for pair in _recompress_batch(batch, level)]
+
+    saved = 0
+    for idnum, data in done:
+        if data is None:
+            continue
+        obj = objects[idnum]
+        saved += len(obj._data) - len(data)
+        obj._data = data
+        if "/Filter" not in obj:
+            obj[NameObject("/Filter")] = NameObject("/FlateDecode")
+    return saved
+
+def remap_references(obj, resolve):
+    """
+    Point every reference inside obj (changed in place) at resolve(idnum),
+    or null if that returns None
+    Returns: obj, or its replacement if obj itself is a reference
+    """
+    if isinstance(obj, IndirectObject):
+        target = resolve(obj.idnum)
+        if target is None:
+            return NullObject()
+        if target == obj.idnum and obj.generation == 0:
+            return obj
+        return IndirectObject(target, 0, obj.pdf)
+    if isinstance(obj, DictionaryObject):
+        for key, value in list(dict.items(obj)):
+            new = remap_references(value, resolve)
+            if new is not value:
+                dict.__setitem__(obj, key, new)
+    elif isinstance(obj, ArrayObject):
+        for i, value in enumerate(obj):
+            new = remap_references(value, resolve)
+            if new is not value:
+                list.__setitem__(obj, i, new)
+    return obj
+
+def _references(obj, found: List[int]) -> None:
+    if isinstance(obj, IndirectObject):
+        found.append(obj.idnum)
+    elif isinstance(obj, DictionaryObject):
+        for value in dict.values(obj):
+            _references(value, found)
+    elif isinstance(obj, ArrayObject):
+        for value in obj:
+            _references(value, found)
+
+def _mergeable(obj) -> bool:
+    if not isinstance(obj, DictionaryObject):
+        return True
+    if dict.get(obj, "/Type") in _UNIQUE_TYPES:
+        return False
+    return not any(key in obj for key in _UNIQUE_KEYS)
+
+def _fingerprint(obj) -> bytes:
+    buffer = io.BytesIO()
+    buffer.write(type(obj).__name__.encode())
+    obj.write_to_stream(buffer)
+    return hashlib.sha256(buffer.getvalue()).digest()
+
+def dedupe_objects(objects: Dict[int, object]) -> Dict[int, int]:
+    """
+    Find objects in objects (object number to decrypted object) that are
+    identical to a lower-numbered one once their own references are merged,
+    and point every reference at the survivor.
+    Returns: the merged object numbers, mapped to their survivor
+    """
+    alias: Dict[int, int] = {}
+
+    def resolve(idnum: int) -> Optional[int]:
+        while idnum in alias:
+            idnum = alias[idnum]
+        return idnum
+
+    for _ in range(MAX_DEDUPE_ROUNDS):
+        seen: Dict[bytes, int] = {}
+        merged = 0
+        for idnum in sorted(objects):
+            if idnum in alias:
+                continue
+            obj = remap_references(objects[idnum], resolve)
+            objects[idnum] = obj
+            if not _mergeable(obj):
+                continue
+            first = seen.setdefault(_fingerprint(obj), idnum)
+            if first != idnum:
+                alias[idnum] = first
+                merged += 1
+        if not merged:
+            break
+    for idnum in alias:
+        del objects[idnum]
+    for idnum in objects:
+        objects[idnum] = remap_references(objects[idnum], resolve)
+    return alias
+
+def _reachable(objects: Dict[int, object], roots: List[int]) -> List[int]:
+    seen = set()
+    todo = [idnum for idnum in roots if idnum in objects]
+    while todo:
+        idnum = todo.pop()
+        if idnum in seen:
+            continue
+        seen.add(idnum)
+        found = []
+        _references(objects[idnum], found)
+        todo.extend(ref for ref in found if ref in objects and ref not in seen)
+    return sorted(seen)
+
+def _pdf_version(header: str) -> str:
+    match = re.match(r"%PDF-(\d+)\.(\d+)", header)
+    major, minor = (int(match.group(1)), int(match.group(2))) if match else (1, 0)
+    # Object and cross-reference streams need PDF 1.5
+    return f"{major}.{minor}" if (major, minor) >= (1, 5) else "1.5"
+
+def _flate_stream(data: bytes, level: int, entries: dict) -> StreamObject:
+    stream = StreamObject()
+    stream._data = zlib.compress(data, level)
+    stream[NameObject("/Filter")] = NameObject("/FlateDecode")
+    for key, value in entries.items():
+        stream[NameObject(key)] = value
+    return stream
+
+def write_compact(
+    objects: Dict[int, object],
+    trailer: dict,
+    header: str,
+    stream,
+    level: int = DEFAULT_LEVEL,
+    pipeline: Optional["Pipeline"] = None,
+) -> None:
+    """
+    Write objects (object number to object, references already final) as a
+    PDF with renumbered objects, non-stream objects packed into object
+    streams and a cross-reference stream. trailer holds the /Root, /Info and
+    /ID entries to keep. Objects run through pipeline's stages if given;
+    when these encrypt, object streams are encrypted as a whole and the
+    cross-reference stream not at all.
+    """
+    writer = ObjectWriter(stream, f"%PDF-{_pdf_version(header)}", trailer, max(objects, default=0) + 1, pipeline)
+    packed = []
+    for idnum in sorted(objects):
+        obj = objects[idnum]
+        if isinstance(obj, StreamObject):
+            writer.write(idnum, 0, obj)
+        else:
+            packed.append((idnum, writer.transform(idnum, 0, obj, packed=True)))
+    # Objects added by the stages (such as /Encrypt) stay outside object streams
+    writer.write_added()
+    entries: Dict[int, Tuple[int, int, int]] = {}
+
+    next_id = max([*objects, *writer.added], default=0) + 1
+    for start in range(0, len(packed), OBJECTS_PER_STREAM):
+        chunk = packed[start:start + OBJECTS_PER_STREAM]
+        objstm_id = next_id
+        next_id += 1
+        offsets = []
+        body = io.BytesIO()
+        for index, (idnum, obj) in enumerate(chunk):
+            offsets.append(f"{idnum} {body.tell()}")
+            obj.write_to_stream(body)
+            body.write(b"\n")
+            entries[idnum] = (2, objstm_id, index)
+        first = " ".join(offsets).encode() + b"\n"
+        objstm = _flate_stream(first + body.getvalue(), level, {
+            "/Type": NameObject("/ObjStm"),
+            "/N": NumberObject(len(chunk)),
+            "/First": NumberObject(len(first)),
+        })
+        writer.write(objstm_id, 0, objstm)
+
+    for idnum, (offset, generation) in writer.offsets.items():
+        entries[idnum] = (1, offset, generation)
+    xref_id = next_id
+    xref_offset = stream.tell()
+    entries[xref_id] = (1, xref_offset, 0)
+    offset_width = max(4, (xref_offset.bit_length() + 7) // 8)
+    rows = [b"\x00" + b"\x00" * offset_width + b"\xff\xff"]
+    for idnum in range(1, xref_id + 1):
+        kind, field2, field3 = entries.get(idnum, (0, 0, 0))
+        rows.append(bytes([kind]) + field2.to_bytes(offset_width, "big") + field3.to_bytes(2, "big"))
+    xref_entries = {
+        "/Type": NameObject("/XRef"),
+        "/Size": NumberObject(xref_id + 1),
+        "/W": ArrayObject([NumberObject(1), NumberObject(offset_width), NumberObject(2)]),
+    }
+    xref_entries.update(writer.trailer)
+    xref = _flate_stream(b"".join(rows), level, xref_entries)
+    stream.write(f"{xref_id} 0 obj\n".encode())
+    xref.write_to_stream(stream)
+    stream.write(f"\nendobj\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+def compact_decrypted(
+    reader: PdfReader,
+    stream,
+    level: int = DEFAULT_LEVEL,
+    workers: int = 1,
+    metrics: Optional[FileMetrics] = None,
+    pipeline: Optional["Pipeline"] = None,
+) -> None:
+    """
+    Write a decrypted reader to stream with the "compact" profile, running
+    objects through pipeline's stages if given.
+    Loading objects is timed as "decrypt", merging and recompression as
+    "optimize" and writing as "serialize".
+    """
+    if metrics is None:
+        metrics = FileMetrics()
+    with metrics.stage("decrypt"):
+        objects = {idnum: obj for idnum, _, obj in decrypted_objects(reader)}
+
+    trailer = {key: reader.trailer.raw_get(key) for key in _TRAILER_KEYS if key in reader.trailer}
+    compact_objects(
+        objects, trailer, reader.pdf_header, stream, level=level, workers=workers, metrics=metrics, pipeline=pipeline
+    )
+
+def compact_objects(
+    objects: Dict[int, object],
+    trailer: dict,
+    header: str,
+    stream,
+    level: int = DEFAULT_LEVEL,
+    workers: int = 1,
+    metrics: Optional[FileMetrics] = None,
+    pipeline: Optional["Pipeline"] = None,
+) -> None:
+    """
+    Merge, prune, recompress and write already decrypted objects (object
+    number to object) with the "compact" profile. trailer holds the /Root,
+    /Info and /ID entries to keep; pipeline's stages run as objects are
+    written. Merging and recompression are timed as
+    "optimize" and writing as "serialize".
+    """
+    if metrics is None:
+        metrics = FileMetrics()
+    started = perf_counter()
+    dedupe_objects(objects)
+    roots = []
+    for value in trailer.values():
+        _references(value, roots)
+    # Everything reachable from the trailer, renumbered 1..n in original order
+    numbers = {idnum: new for new, idnum in enumerate(_reachable(objects, roots), start=1)}
+    objects = {numbers[idnum]: objects[idnum] for idnum in numbers}
+    for obj in objects.values():
+        remap_references(obj, numbers.get)
+    for key, value in trailer.items():
+        trailer[key] = remap_references(value, numbers.get)
+    recompress_streams(objects, level, workers)
+    metrics.add("optimize", perf_counter() - started)
+
+    with metrics.stage("serialize"):
+        write_compact(objects, trailer, header, stream, level, pipeline)
@@ -0,0 +1,291 @@
+"""
+Unlocking part of a document.
+
+select_pages() builds a document holding only some of a decrypted reader's
+pages. It walks the page tree down to those pages, skipping subtrees by
+their /Count, and then follows references out of each page (contents,
+resources, annotations). Only objects reached that way are loaded, and so
+decrypted, which makes the cost follow the pages selected rather than the
+size of the document.
+
+Document-level structures that span every page (outlines, forms, named
+destinations, the structure tree) are left out, and references to pages
+that were not selected become null.
+"""
+import bisect
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject
+
+from metrics import FileMetrics
+from optimize import compact_objects, remap_references
+from unlocker import DEFAULT_LEVEL, ObjectWriter
+
+if TYPE_CHECKING:
+    from pipeline import Pipeline
+
+# Page attributes a page may inherit from its ancestors in the page tree
+INHERITABLE = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+# Objects that belong to the document's structure rather than to a page;
+# references to them from selected pages become null
+_SKIPPED_TYPES = ("/Page", "/Pages", "/Catalog")
+
+class _TreeMismatch(Exception):
+    # The page tree's /Count entries don't match its contents
+    pass
+
+def parse_page_ranges(spec: str, page_count: Optional[int] = None) -> Optional[List[int]]:
+    """
+    Parse a page selection such as "1-10, 15, 20-": 1-based, inclusive
+    pages and ranges separated by commas. A range without an end runs to
+    the last page, which needs page_count.
+    Returns: the selected 0-based page indices, sorted and without repeats,
+    or None if spec is blank (every page)
+    Raises: ValueError if spec is malformed or names pages past page_count
+    """
+    parts = [part.strip() for part in spec.split(",") if part.strip()]
+    if not parts:
+        return None
+    pages = set()
+    for part in parts:
+        first, dash, last = (text.strip() for text in part.partition("-"))
+        if dash and not last:
+            if page_count is None:
+                raise ValueError(f"'{part}' needs the document's page count")
+            last = str(page_count)
+        try:
+            start = int(first)
+            end = int(last) if dash else start
+        except ValueError:
+            raise ValueError(f"'{part}' is not a page or page range") from None
+        if start < 1 or end < start:
+            raise ValueError(f"'{part}' is not a valid page range")
+        if page_count is not None and end > page_count:
+            raise ValueError(f"Page {end} is past the end of the document ({page_count} page(s))")
+        pages.update(range(start - 1, end))
+    return sorted(pages)
+
+def format_page_ranges(indices: Sequence[int]) -> str:
+    """
+    Returns: a page selection for parse_page_ranges() covering the given
+    0-based page indices, e.g. "1-10,15"
+    """
+    ranges = []
+    for index in sorted(set(indices)):
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ",".join(str(first + 1) if first == last else f"{first + 1}-{last + 1}" for first, last in ranges)
+
+def split_pages(indices: Sequence[int], every: int) -> List[List[int]]:
+    """
+    Returns: indices cut into consecutive parts of at most every pages
+    """
+    if every < 1:
+        raise ValueError("Parts need at least one page")
+    indices = list(indices)
+    return [indices[start:start + every] for start in range(0, len(indices), every)]
+
+def _any_between(wanted: List[int], low: int, high: int) -> bool:
+    position = bisect.bisect_left(wanted, low)
+    return position < len(wanted) and wanted[position] < high
+
+def _walk_page_tree(reader: PdfReader, wanted: List[int]) -> Dict[int, Tuple[IndirectObject, DictionaryObject]]:
+    found = {}
+    visited = set()
+
+    def walk(node: DictionaryObject, offset: int, inherited: dict) -> None:
+        kids = node.get("/Kids") or ArrayObject()
+        # When every kid is a single page, page i is kid i and the other
+        # kids don't need to be loaded at all
+        flat = int(node.get("/Count", -1)) == len(kids)
+        for kid_ref in kids:
+            if offset > wanted[-1]:
+                return
+            if flat and not _any_between(wanted, offset, offset + 1):
+                offset += 1
+                continue
+            if not isinstance(kid_ref, IndirectObject) or kid_ref.idnum in visited:
+                raise _TreeMismatch()
+            visited.add(kid_ref.idnum)
+            kid = kid_ref.get_object()
+            if "/Kids" in kid:
+                count = int(kid.get("/Count", 0))
+                if flat and count != 1:
+                    raise _TreeMismatch()
+                if _any_between(wanted, offset, offset + count):
+                    kid_inherited = dict(inherited)
+                    kid_inherited.update((key, kid.raw_get(key)) for key in INHERITABLE if key in kid)
+                    walk(kid, offset, kid_inherited)
+                offset += count
+            else:
+                if _any_between(wanted, offset, offset + 1):
+                    for key, value in inherited.items():
+                        if key not in kid:
+                            kid[NameObject(key)] = value
+                    found[offset] = (kid_ref, kid)
+                offset += 1
+
+    root = reader.trailer["/Root"]["/Pages"]
+    walk(root, 0, {key: root.raw_get(key) for key in INHERITABLE if key in root})
+    if len(found) != len(wanted):
+        raise _TreeMismatch()
+    return found
+
+def find_pages(reader: PdfReader, indices: Sequence[int]) -> List[Tuple[IndirectObject, DictionaryObject]]:
+    """
+    Look up pages by 0-based index, loading only the page tree nodes on the
+    way to them. Inherited attributes are copied onto each page.
+    Returns: (reference, page dictionary) per index, in the order given
+    """
+    wanted = sorted(set(indices))
+    if not wanted:
+        return []
+    try:
+        found = _walk_page_tree(reader, wanted)
+    except (_TreeMismatch, KeyError, TypeError, ValueError):
+        # Broken page trees: let pypdf flatten the whole tree instead
+        found = {}
+        for index in wanted:
+            page = reader.pages[index]
+            found[index] = (page.indirect_reference, page)
+    return [found[index] for index in indices]
+
+def _collect_references(obj, found: List[IndirectObject]) -> None:
+    if isinstance(obj, IndirectObject):
+        found.append(obj)
+    elif isinstance(obj, DictionaryObject):
+        for value in dict.values(obj):
+            _collect_references(value, found)
+    elif isinstance(obj, ArrayObject):
+        for value in obj:
+            _collect_references(value, found)
+
+def collect_pages(
+    reader: PdfReader, indices: Sequence[int], first_id: int = 1
+) -> Tuple[Dict[int, object], List[int], Optional[object]]:
+    """
+    Load the given pages of a decrypted reader and every object they use,
+    renumbered from first_id in the order of the original file. Pages lose
+    their /Parent; see add_page_tree().
+    Returns: (objects by number, the number of each page in the order
+    given, the document's /Info entry with references renumbered or None)
+    """
+    pages = find_pages(reader, indices)
+    selected = {ref.idnum for ref, _ in pages}
+    loaded: Dict[int, object] = {}
+    todo: List[IndirectObject] = []
+    for ref, page in pages:
+        if ref.idnum in loaded:
+            continue
+        # The old page tree is replaced
+        if "/Parent" in page:
+            del page["/Parent"]
+        loaded[ref.idnum] = page
+        _collect_references(page, todo)
+    info = reader.trailer.raw_get("/Info") if "/Info" in reader.trailer else None
+    if isinstance(info, IndirectObject):
+        todo.append(info)
+
+    skipped = set()
+    while todo:
+        ref = todo.pop()
+        if ref.idnum in loaded or ref.idnum in skipped:
+            continue
+        obj = ref.get_object()
+        if obj is None or (
+            isinstance(obj, DictionaryObject) and ref.idnum not in selected and obj.get("/Type") in _SKIPPED_TYPES
+        ):
+            skipped.add(ref.idnum)
+            continue
+        loaded[ref.idnum] = obj
+        _collect_references(obj, todo)
+
+    numbers = {idnum: new for new, idnum in enumerate(sorted(loaded), start=first_id)}
+    objects = {numbers[idnum]: remap_references(obj, numbers.get) for idnum, obj in loaded.items()}
+    if info is not None:
+        info = remap_references(info, numbers.get)
+    return objects, [numbers[ref.idnum] for ref, _ in pages], info
+
+def add_page_tree(objects: Dict[int, object], page_ids: List[int]) -> IndirectObject:
+    """
+    Add a page tree holding the pages numbered page_ids, in that order, and
+    a catalog for it to objects
+    Returns: a reference to the catalog
+    """
+    tree_id = max(objects, default=0) + 1
+    catalog_id = tree_id + 1
+    kids = ArrayObject()
+    for page_id in page_ids:
+        objects[page_id][NameObject("/Parent")] = IndirectObject(tree_id, 0, None)
+        kids.append(IndirectObject(page_id, 0, None))
+    objects[tree_id] = DictionaryObject({
+        NameObject("/Type"): NameObject("/Pages"),
+        NameObject("/Kids"): kids,
+        NameObject("/Count"): NumberObject(len(kids)),
+    })
+    objects[catalog_id] = DictionaryObject({
+        NameObject("/Type"): NameObject("/Catalog"),
+        NameObject("/Pages"): IndirectObject(tree_id, 0, None),
+    })
+    return IndirectObject(catalog_id, 0, None)
+
+def select_pages(reader: PdfReader, indices: Sequence[int]) -> Tuple[Dict[int, object], dict]:
+    """
+    Load the given pages of a decrypted reader and every object they use.
+    Objects are renumbered 1..n; a new page tree and catalog hold the pages
+    in the order given.
+    Returns: (objects by number, trailer with the /Root, /Info and /ID entries)
+    """
+    objects, page_ids, info = collect_pages(reader, indices)
+    trailer = {"/Root": add_page_tree(objects, page_ids)}
+    if info is not None:
+        trailer["/Info"] = info
+    if "/ID" in reader.trailer:
+        trailer["/ID"] = reader.trailer.raw_get("/ID")
+    return objects, trailer
+
+def write_objects(
+    objects: Dict[int, object], trailer: dict, header: str, stream, pipeline: Optional["Pipeline"] = None
+) -> None:
+    """
+    Write objects (object number to object, references already final) as a
+    PDF with a classic cross-reference table, running each object through
+    pipeline's stages if given
+    """
+    writer = ObjectWriter(stream, header, trailer, max(objects, default=0) + 1, pipeline)
+    for idnum in sorted(objects):
+        writer.write(idnum, 0, objects[idnum])
+    writer.write_added()
+    writer.finish()
+
+def write_pages(
+    reader: PdfReader,
+    stream,
+    indices: Sequence[int],
+    profile: str = "fast",
+    level: int = DEFAULT_LEVEL,
+    workers: int = 1,
+    metrics: Optional[FileMetrics] = None,
+    pipeline: Optional["Pipeline"] = None,
+) -> None:
+    """
+    Write the given pages of a decrypted reader to stream, with the output
+    profile and pipeline stages as in unlocker.unlock_to_stream. Loading the
+    pages' objects is timed as "decrypt" and writing as "serialize".
+    """
+    if metrics is None:
+        metrics = FileMetrics()
+    with metrics.stage("decrypt"):
+        objects, trailer = select_pages(reader, indices)
+    if profile == "compact":
+        compact_objects(
+            objects, trailer, reader.pdf_header, stream, level=level, workers=workers, metrics=metrics,
+            pipeline=pipeline
+        )
+    else:
+        with metrics.stage("serialize"):
+            write_objects(objects, trailer, reader.pdf_header, stream, pipeline)
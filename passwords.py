@@ -0,0 +1,134 @@
+import csv
+import fnmatch
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from threading import Event
+from typing import Callable, Dict, List, Optional
+
+from triage import EncryptParams
+
+def load_password_map(path: str) -> Dict[str, str]:
+    """
+    Load a per-file password mapping.
+    JSON files hold an object of {pattern: password}; anything else is read
+    as CSV with two columns: pattern,password. Patterns are file names,
+    relative paths or shell-style globs (e.g. "statements/2024-*.pdf").
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(".json"):
+            data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError(f"{path}: expected a JSON object of pattern -> password")
+            return {str(k): str(v) for k, v in data.items()}
+
+        mapping = {}
+        for row in csv.reader(f):
+            if not row or row[0].startswith("#"):
+                continue
+            if len(row) < 2:
+                raise ValueError(f"{path}: expected 'pattern,password' rows, got {row!r}")
+            # Passwords may themselves contain commas
+            mapping[row[0]] = ",".join(row[1:])
+        return mapping
+
+def password_for(rel_path: str, mapping: Dict[str, str]) -> Optional[str]:
+    """
+    Find the password for a file in a mapping loaded by load_password_map.
+    Exact matches on the relative path or file name win over globs; globs
+    are tried in the order they appear in the mapping file.
+    """
+    rel_path = rel_path.replace(os.sep, "/")
+    name = os.path.basename(rel_path)
+    for key in (rel_path, name):
+        if key in mapping:
+            return mapping[key]
+    for pattern, password in mapping.items():
+        if fnmatch.fnmatchcase(rel_path, pattern) or fnmatch.fnmatchcase(name, pattern):
+            return password
+    return None
+
+def encode_password(password: str) -> bytes:
+    """
+    Encode a password the way pypdf does when decrypting
+    """
+    try:
+        return password.encode("latin-1")
+    except UnicodeEncodeError:
+        return password.encode("utf-8")
+
+def check_password(params: EncryptParams, password: str) -> bool:
+    """
+    True if password opens the file, as user or owner password.
+    Uses only the /Encrypt values (key derivation against /U and /O), so no
+    part of the document itself is parsed.
+    """
+    from pypdf._encryption import AlgV4, AlgV5
+
+    pwd = encode_password(password)
+    if params.V == 5:
+        return bool(
+            AlgV5.verify_owner_password(params.R, pwd, params.O, params.OE, params.U)
+            or AlgV5.verify_user_password(params.R, pwd, params.U, params.UE)
+        )
+    args = (params.R, params.length, params.O, params.U, params.P & 0xFFFFFFFF, params.id0, params.encrypt_metadata)
+    return bool(AlgV4.verify_owner_password(pwd, *args) or AlgV4.verify_user_password(pwd, *args))
+
+def match_password(params: EncryptParams, candidates: List[str]) -> Optional[int]:
+    """
+    Returns: the index of the first candidate that opens the file, or None
+    """
+    for index, candidate in enumerate(candidates):
+        if check_password(params, candidate):
+            return index
+    return None
+
+def _match_job(index: int, params: EncryptParams, candidates: List[str]):
+    return index, match_password(params, candidates)
+
+def match_passwords(
+    params_list: List[EncryptParams],
+    candidates: List[str],
+    max_workers: Optional[int] = None,
+    on_result: Optional[Callable[[int, Optional[int]], None]] = None,
+    cancel: Optional[Event] = None,
+) -> List[Optional[int]]:
+    """
+    Match candidate passwords against many files in a process pool.
+    Once cancel is set, files not yet started are left unmatched.
+    Returns: per file, the index of the matching candidate or None
+    """
+    from unlocker import CANCEL_POLL_SECONDS, default_workers
+
+    matches: List[Optional[int]] = [None] * len(params_list)
+    if not params_list or not candidates:
+        return matches
+
+    workers = max(1, min(max_workers or default_workers(), len(params_list)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_match_job, index, params, candidates)
+            for index, params in enumerate(params_list)
+        ]
+        not_done = set(futures)
+        while not_done:
+            finished, not_done = wait(not_done, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index, match = future.result()
+                matches[index] = match
+                if on_result is not None:
+                    on_result(index, match)
+            if cancel is not None and cancel.is_set():
+                not_done = {future for future in not_done if not future.cancel()}
+    return matches
+
+def parse_candidates(text: str) -> List[str]:
+    """
+    One candidate per line; blank lines are ignored and duplicates dropped
+    """
+    candidates = []
+    for line in text.splitlines():
+        line = line.rstrip("\r")
+        if line and line not in candidates:
+            candidates.append(line)
+    return candidates
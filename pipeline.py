@@ -0,0 +1,359 @@
+"""
+Transform stages run on unlocked documents.
+
+Unlocking already loads every object of a document once and writes it
+once. Rather than re-reading the unlocked file for each further step, the
+optional stages here run inside that same pass: unlocker.ObjectWriter, which
+every output profile writes through, hands each object to a
+DocumentTransform on its way to the output.
+
+Stages are applied in this order:
+- metadata: entries of the document information dictionary are set or
+  removed (XMP metadata streams are left as they are)
+- encrypt: every object is encrypted with AES-256 under a new password
+
+merge_pdfs() unlocks several documents into one, reading each source once,
+and runs the same stages on the merged document while writing it.
+"""
+import os
+import secrets
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import FileMetrics
+from unlocker import DEFAULT_LEVEL, OUTPUT_PROFILES
+
+@dataclass
+class Pipeline:
+    """
+    Optional stages for unlocked documents. Plain data, so it can be handed
+    to worker processes as is.
+    metadata maps document information keys ("Title", "Author", ... with or
+    without the leading slash) to new values; an empty value removes the
+    entry, and clear_metadata drops every existing entry first.
+    password, if given, re-encrypts the output with AES-256; owner_password
+    defaults to password.
+    """
+    metadata: Dict[str, str] = field(default_factory=dict)
+    clear_metadata: bool = False
+    password: Optional[str] = None
+    owner_password: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return bool(self.metadata or self.clear_metadata or self.password)
+
+    def describe(self) -> str:
+        """
+        Returns: what the stages do to a document, e.g. "metadata rewritten,
+        re-encrypted with AES-256", or "" if no stage is active
+        """
+        done = []
+        if self.metadata or self.clear_metadata:
+            done.append("metadata rewritten")
+        if self.password:
+            done.append("re-encrypted with AES-256")
+        return ", ".join(done)
+
+    def begin(self, trailer: dict, next_id: int) -> "DocumentTransform":
+        """
+        Start the stages on one document about to be written. trailer holds
+        the trailer entries the writer would write and next_id the first
+        object number the writer leaves free.
+        Returns: the document's DocumentTransform
+        """
+        stages = []
+        if self.metadata or self.clear_metadata:
+            stages.append(_MetadataStage(self.metadata, self.clear_metadata))
+        if self.password:
+            stages.append(_EncryptStage(self.password, self.owner_password or self.password))
+        return DocumentTransform(stages, trailer, next_id)
+
+    def configure(self, writer, info=None) -> None:
+        """
+        Apply the stages to a pypdf PdfWriter, for documents written by
+        copying pages (the "rebuild" unlock mode). info is the source
+        document's information dictionary, which the metadata stage starts
+        from, as it does when objects are copied.
+        """
+        from pypdf.generic import DictionaryObject
+
+        if self.metadata or self.clear_metadata:
+            source = info if isinstance(info, DictionaryObject) else DictionaryObject()
+            writer.metadata = _rewrite_info(source, _info_entries(self.metadata), self.clear_metadata)
+        if self.password:
+            writer.encrypt(self.password, self.owner_password or self.password, algorithm="AES-256")
+
+def _info_entries(metadata: Dict[str, str]) -> Dict[str, str]:
+    return {"/" + key.strip().lstrip("/"): value for key, value in metadata.items() if key.strip().lstrip("/")}
+
+def _rewrite_info(info, entries: Dict[str, str], clear: bool):
+    from pypdf.generic import DictionaryObject, NameObject, TextStringObject
+
+    result = DictionaryObject() if clear else DictionaryObject(info)
+    for key, value in entries.items():
+        if value:
+            result[NameObject(key)] = TextStringObject(value)
+        else:
+            result.pop(key, None)
+    return result
+
+class DocumentTransform:
+    """
+    The stages of a Pipeline applied to one document while it is written.
+    trailer holds the trailer entries to write, as changed by the stages;
+    objects holds objects the stages add, by number, which are written, and
+    passed through transform(), like every other object; next_id is the
+    first object number still free.
+    """
+
+    def __init__(self, stages: list, trailer: dict, next_id: int):
+        self.trailer = dict(trailer)
+        self.objects: Dict[int, object] = {}
+        self.next_id = next_id
+        self._stages = stages
+        for stage in stages:
+            self.objects.update(stage.begin(self.trailer, self._allocate))
+
+    def _allocate(self) -> int:
+        idnum = self.next_id
+        self.next_id += 1
+        return idnum
+
+    def transform(self, idnum: int, generation: int, obj, packed: bool = False):
+        """
+        Run one object through the stages. packed marks objects written
+        inside an object stream, which is encrypted as a whole instead.
+        Returns: the object to write in obj's place
+        """
+        for stage in self._stages:
+            obj = stage.transform(idnum, generation, obj, packed)
+        return obj
+
+class _MetadataStage:
+
+    def __init__(self, metadata: Dict[str, str], clear: bool):
+        self.entries = _info_entries(metadata)
+        self.clear = clear
+        self.info_id = None
+
+    def begin(self, trailer: dict, allocate: Callable[[], int]) -> Dict[int, object]:
+        from pypdf.generic import DictionaryObject, IndirectObject
+
+        info = trailer.get("/Info")
+        if isinstance(info, IndirectObject):
+            self.info_id = info.idnum
+            return {}
+        # No information dictionary, or a direct one: write it as a new object
+        self.info_id = allocate()
+        trailer["/Info"] = IndirectObject(self.info_id, 0, None)
+        return {self.info_id: DictionaryObject(info) if isinstance(info, DictionaryObject) else DictionaryObject()}
+
+    def transform(self, idnum: int, generation: int, obj, packed: bool):
+        from pypdf.generic import DictionaryObject
+
+        if idnum != self.info_id or not isinstance(obj, DictionaryObject):
+            return obj
+        return _rewrite_info(obj, self.entries, self.clear)
+
+class _EncryptStage:
+
+    def __init__(self, password: str, owner_password: str):
+        self.password = password
+        self.owner_password = owner_password
+        self.encryption = None
+        self.encrypt_id = None
+
+    def begin(self, trailer: dict, allocate: Callable[[], int]) -> Dict[int, object]:
+        from pypdf._encryption import EncryptAlgorithm, Encryption
+        from pypdf.constants import UserAccessPermissions
+        from pypdf.generic import ArrayObject, ByteStringObject, IndirectObject
+
+        # The file key is bound to the first /ID entry; keep the document's
+        # own where it has one, and mark this as a new revision of it
+        first_id = None
+        ids = trailer.get("/ID")
+        if isinstance(ids, ArrayObject) and ids:
+            first_id = getattr(ids[0], "original_bytes", None)
+        if not first_id:
+            first_id = secrets.token_bytes(16)
+        self.encryption = Encryption.make(EncryptAlgorithm.AES_256, UserAccessPermissions.all(), first_id)
+        entry = self.encryption.write_entry(self.password, self.owner_password)
+        self.encrypt_id = allocate()
+        trailer["/Encrypt"] = IndirectObject(self.encrypt_id, 0, None)
+        trailer["/ID"] = ArrayObject([ByteStringObject(first_id), ByteStringObject(secrets.token_bytes(16))])
+        return {self.encrypt_id: entry}
+
+    def transform(self, idnum: int, generation: int, obj, packed: bool):
+        # The /Encrypt dictionary itself is never encrypted, and objects in
+        # object streams are covered by the encrypted object stream
+        if packed or idnum == self.encrypt_id:
+            return obj
+        return self.encryption.encrypt_object(obj, idnum, generation)
+
+def _pdf_header(headers: List[str]) -> str:
+    # The highest version among the merged documents
+    def version(header: str) -> Tuple[int, int]:
+        try:
+            major, minor = header[5:].split(".")[:2]
+            return int(major), int(minor[:1])
+        except ValueError:
+            return 1, 0
+
+    return max(headers, key=version, default="%PDF-1.7")
+
+def merge_pdfs(
+    sources: List[Tuple[str, object, str, Optional[str]]],
+    output,
+    pipeline: Optional[Pipeline] = None,
+    profile: str = "fast",
+    level: int = DEFAULT_LEVEL,
+    workers: int = 1,
+    metrics: Optional[FileMetrics] = None,
+) -> Tuple[bool, str]:
+    """
+    Unlock several PDFs and write their pages, in the order given, as one
+    document to the writable, seekable stream output.
+    sources holds (name, pdf_file, password, pages) per document: pdf_file a
+    path or seekable binary stream, and pages an optional page selection as
+    in unlocker.unlock_to_stream. Unprotected documents need no password.
+    Each source is read and decrypted once; the merged document keeps the
+    first source's document information and runs through pipeline's stages
+    as it is written, with the output profile as in unlock_to_stream.
+    Returns: (success, error_message)
+    """
+    from pypdf import PdfReader
+
+    from optimize import compact_objects
+    from pages import add_page_tree, collect_pages, parse_page_ranges, write_objects
+    from triage import algorithm_name
+
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile: {profile}")
+    if metrics is None:
+        metrics = FileMetrics()
+    objects: Dict[int, object] = {}
+    page_ids: List[int] = []
+    headers = []
+    info = None
+    for name, pdf_file, password, pages in sources:
+        try:
+            is_path = isinstance(pdf_file, (str, os.PathLike))
+            handle = open(pdf_file, "rb") if is_path else pdf_file
+            try:
+                handle.seek(0, os.SEEK_END)
+                metrics.input_bytes += handle.tell()
+                handle.seek(0)
+                with metrics.stage("parse"):
+                    reader = PdfReader(handle)
+                if reader.is_encrypted:
+                    metrics.algorithm = metrics.algorithm or algorithm_name(reader.trailer["/Encrypt"].get_object())
+                    with metrics.stage("key"):
+                        if not reader.decrypt(password or ""):
+                            return False, f"{name}: Incorrect password"
+                page_count = len(reader.pages)
+                try:
+                    indices = parse_page_ranges(pages or "", page_count)
+                except ValueError as e:
+                    return False, f"{name}: Invalid page selection: {str(e)}"
+                if indices is None:
+                    indices = list(range(page_count))
+                with metrics.stage("decrypt"):
+                    loaded, loaded_pages, loaded_info = collect_pages(reader, indices, first_id=len(objects) + 1)
+                headers.append(reader.pdf_header)
+            finally:
+                if is_path:
+                    handle.close()
+        except Exception as e:
+            return False, f"{name}: Error processing PDF: {str(e)}"
+        objects.update(loaded)
+        page_ids.extend(loaded_pages)
+        if info is None:
+            info = loaded_info
+
+    if not page_ids:
+        return False, "No pages to merge"
+    trailer = {"/Root": add_page_tree(objects, page_ids)}
+    if info is not None:
+        trailer["/Info"] = info
+    metrics.pages = len(page_ids)
+
+    start = output.tell()
+    try:
+        if profile == "compact":
+            compact_objects(
+                objects, trailer, _pdf_header(headers), output, level=level, workers=workers, metrics=metrics,
+                pipeline=pipeline
+            )
+        else:
+            with metrics.stage("serialize"):
+                write_objects(objects, trailer, _pdf_header(headers), output, pipeline)
+    except Exception as e:
+        return False, f"Error writing merged PDF: {str(e)}"
+    metrics.output_bytes = output.tell() - start
+    metrics.success = True
+    return True, "Success"
+
+def merge_pdf_files(
+    sources: List[Tuple[str, str, str, Optional[str]]],
+    dst_path: str,
+    pipeline: Optional[Pipeline] = None,
+    profile: str = "fast",
+    level: int = DEFAULT_LEVEL,
+    workers: int = 1,
+    metrics: Optional[FileMetrics] = None,
+) -> Tuple[bool, str]:
+    """
+    merge_pdfs() with sources read from, and the result written to, files.
+    Nothing is written when merging fails.
+    Returns: (success, message)
+    """
+    os.makedirs(os.path.dirname(dst_path) or ".", exist_ok=True)
+    tmp_path = f"{dst_path}.{uuid.uuid4().hex[:8]}.part"
+    with open(tmp_path, "xb") as dst:
+        try:
+            success, message = merge_pdfs(
+                sources, dst, pipeline=pipeline, profile=profile, level=level, workers=workers, metrics=metrics
+            )
+        except BaseException:
+            # As in unlock_pdf_file: never leave the partial file behind
+            dst.close()
+            os.remove(tmp_path)
+            raise
+    if success:
+        os.replace(tmp_path, dst_path)
+    else:
+        os.remove(tmp_path)
+    return success, message
+
+def _merge_job(
+    sources: List[Tuple[str, str, str, Optional[str]]], dst_path: str, pipeline: Optional[Pipeline], profile: str,
+    level: int,
+) -> Tuple[Tuple[bool, str], FileMetrics]:
+    # Runs inside a worker process; only paths cross the process boundary
+    metrics = FileMetrics()
+    try:
+        result = merge_pdf_files(sources, dst_path, pipeline=pipeline, profile=profile, level=level, metrics=metrics)
+    except OSError as e:
+        result = (False, f"Error processing PDF: {str(e)}")
+    return result, metrics
+
+def start_merge(
+    sources: List[Tuple[str, str, str, Optional[str]]],
+    dst_path: str,
+    pipeline: Optional[Pipeline] = None,
+    profile: str = "fast",
+    level: int = DEFAULT_LEVEL,
+) -> Future:
+    """
+    Run merge_pdf_files() in a worker process of its own, so a merge goes on
+    alongside other files being unlocked.
+    Returns: a Future for ((success, message), metrics)
+    """
+    pool = ProcessPoolExecutor(max_workers=1)
+    future = pool.submit(_merge_job, sources, dst_path, pipeline, profile, level)
+    # The worker exits once the merge is done
+    pool.shutdown(wait=False)
+    return future
@@ -0,0 +1,467 @@
+"""
+Password recovery for a single PDF whose owner has forgotten its password.
+
+Candidates come from a wordlist, a mask, or both, and are numbered 0..n-1
+so that any range of them can be generated on its own. The search hands
+ranges ("chunks") to a process pool. Each worker checks its candidates
+with passwords.check_password(), which only runs key derivation against
+the /Encrypt values; the document itself is never parsed.
+
+Masks are written with these placeholders, which all start with "?";
+anything else is literal, and a backslash makes the next character literal:
+
+    ?d  digit          ?l  lowercase letter    ?u  uppercase letter
+    ?s  symbol         ?a  any of those        ??  a literal "?"
+    ?w  a word from the wordlist
+    ?{DD} ?{MM} ?{YY} ?{YYYY}   day, month and year of a real calendar date
+
+For example "?{DD}?{MM}?{YYYY}" tries every date in the year range,
+"CUST?d?d?d?d?d?d" a customer ID prefix plus six digits, and
+"SUMMER?{YYYY}" the literal word SUMMER followed by a year. With both a
+wordlist and a mask that has no ?w, each word is followed by the mask.
+
+Cancelling a search, or finding the password, also stops the chunks
+already running: workers check a shared stop event between slices of each
+chunk, so the search ends within a small part of CHUNK_SECONDS.
+
+Progress is saved to a small JSON state file after each chunk. A search
+restarted with the same file, mask, wordlist and years continues from the
+first candidate not yet checked.
+"""
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import string
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from threading import Event
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from passwords import check_password
+from triage import EncryptParams
+
+# Character sets behind the ?x placeholders
+CHARSETS = {
+    "d": string.digits,
+    "l": string.ascii_lowercase,
+    "u": string.ascii_uppercase,
+    "s": string.punctuation + " ",
+}
+CHARSETS["a"] = CHARSETS["l"] + CHARSETS["u"] + CHARSETS["d"] + CHARSETS["s"]
+
+# Date placeholders, written ?{DD} and so on
+DATE_TOKENS = ("YYYY", "YY", "DD", "MM")
+
+# Years tried by date placeholders unless others are given
+DEFAULT_FIRST_YEAR = 1940
+
+# Each chunk should keep a worker busy for about this long: long enough that
+# pool overhead doesn't matter, short enough for smooth progress and resume
+CHUNK_SECONDS = 1.0
+MAX_CHUNK = 1_000_000
+
+# Running chunks check the stop event this many times each
+CHUNK_SLICES = 20
+
+# Candidates timed in-process to size chunks and estimate the search time
+CALIBRATION_SECONDS = 0.2
+
+# Where searches save their progress unless a state file is given
+STATE_DIR = os.path.join(tempfile.gettempdir(), "pdf_unlock_recovery")
+
+# How often the state file is rewritten while chunks finish
+SAVE_SECONDS = 2.0
+
+@dataclass
+class Mask:
+    """
+    A parsed mask. parts holds ("text", literal), ("set", characters),
+    ("date", token) or ("word", "") in mask order; dates holds the distinct
+    values of the mask's date tokens, in order, one tuple per date.
+    """
+    parts: List[Tuple[str, str]]
+    dates: List[Tuple[str, ...]] = field(default_factory=list)
+
+    @property
+    def has_word(self) -> bool:
+        return any(kind == "word" for kind, _ in self.parts)
+
+    @property
+    def size(self) -> int:
+        """
+        Candidates per word (all of them if the mask has no ?w)
+        """
+        size = len(self.dates) if self.dates else 1
+        for kind, value in self.parts:
+            if kind == "set":
+                size *= len(value)
+        return size
+
+    def candidate(self, index: int, word: str = "") -> str:
+        """
+        Returns: candidate number index (0 <= index < size), with word in place of ?w
+        """
+        # The rightmost placeholder changes fastest
+        chars = {}
+        for position in range(len(self.parts) - 1, -1, -1):
+            kind, value = self.parts[position]
+            if kind == "set":
+                index, digit = divmod(index, len(value))
+                chars[position] = value[digit]
+        date = self.dates[index] if self.dates else ()
+        pieces = []
+        dates_used = 0
+        for position, (kind, value) in enumerate(self.parts):
+            if kind == "text":
+                pieces.append(value)
+            elif kind == "set":
+                pieces.append(chars[position])
+            elif kind == "date":
+                pieces.append(date[dates_used])
+                dates_used += 1
+            else:
+                pieces.append(word)
+        return "".join(pieces)
+
+def _date_values(tokens: List[str], years: Tuple[int, int]) -> List[Tuple[str, ...]]:
+    formats = {"YYYY": "%Y", "YY": "%y", "DD": "%d", "MM": "%m"}
+    day = datetime.date(years[0], 1, 1)
+    last = datetime.date(years[1], 12, 31)
+    values = {}
+    while day <= last:
+        values.setdefault(tuple(day.strftime(formats[token]) for token in tokens), None)
+        day += datetime.timedelta(days=1)
+    return list(values)
+
+def parse_mask(mask: str, years: Optional[Tuple[int, int]] = None) -> Mask:
+    """
+    Parse a mask (see the module docstring). years is the inclusive range
+    of years for date placeholders, by default 1940 to this year.
+    Raises: ValueError for unknown placeholders or a bad year range
+    """
+    if years is None:
+        years = (DEFAULT_FIRST_YEAR, datetime.date.today().year)
+    if not 1 <= years[0] <= years[1] <= 9999:
+        raise ValueError(f"Invalid year range {years[0]}-{years[1]}")
+    parts: List[Tuple[str, str]] = []
+
+    def literal(text: str) -> None:
+        if parts and parts[-1][0] == "text":
+            parts[-1] = ("text", parts[-1][1] + text)
+        else:
+            parts.append(("text", text))
+
+    position = 0
+    while position < len(mask):
+        char = mask[position]
+        if char == "\\" and position + 1 < len(mask):
+            literal(mask[position + 1])
+            position += 2
+        elif char == "?":
+            code = mask[position + 1:position + 2]
+            if code == "?":
+                literal("?")
+            elif code == "w":
+                parts.append(("word", ""))
+            elif code in CHARSETS:
+                parts.append(("set", CHARSETS[code]))
+            elif code == "{":
+                end = mask.find("}", position)
+                token = mask[position + 2:end]
+                if end == -1 or token not in DATE_TOKENS:
+                    raise ValueError(
+                        f"Unknown date placeholder at '{mask[position:]}'; use ?{{DD}}, ?{{MM}}, ?{{YY}} or ?{{YYYY}}"
+                    )
+                parts.append(("date", token))
+                position = end + 1
+                continue
+            else:
+                raise ValueError(f"Unknown mask placeholder '?{code}'")
+            position += 2
+        else:
+            literal(char)
+            position += 1
+
+    tokens = [value for kind, value in parts if kind == "date"]
+    return Mask(parts, _date_values(tokens, years) if tokens else [])
+
+@dataclass
+class Keyspace:
+    """
+    Every candidate of a search: words (possibly none) times the mask.
+    Candidate i is the mask's candidate i % mask.size for word i // mask.size.
+    """
+    mask: Mask
+    words: List[str] = field(default_factory=list)
+
+    @property
+    def size(self) -> int:
+        return self.mask.size * (len(self.words) if self.mask.has_word else 1)
+
+    def word_range(self, start: int, stop: int) -> Tuple[int, int]:
+        """
+        Returns: the slice of words that candidates start..stop-1 use
+        """
+        if not self.mask.has_word:
+            return 0, 0
+        return start // self.mask.size, (stop - 1) // self.mask.size + 1
+
+def build_keyspace(
+    words: Optional[Iterable[str]] = None, mask: Optional[str] = None, years: Optional[Tuple[int, int]] = None
+) -> Keyspace:
+    """
+    Combine a wordlist and a mask into one keyspace. Without a mask every
+    word is tried as is; with both, a mask without ?w is appended to each word.
+    Raises: ValueError if neither is given or the mask is invalid
+    """
+    words = list(dict.fromkeys(word for word in (words or []) if word))
+    if not words and not mask:
+        raise ValueError("Give a wordlist, a mask, or both")
+    parsed = parse_mask(mask or "?w", years)
+    if words and not parsed.has_word:
+        parsed.parts.insert(0, ("word", ""))
+    if parsed.has_word and not words:
+        raise ValueError("The mask uses ?w but the wordlist is empty")
+    return Keyspace(parsed, words)
+
+def search_fingerprint(params: EncryptParams, keyspace: Keyspace) -> str:
+    """
+    Identifies a search: the file's /Encrypt values and every candidate
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((params.R, params.O, params.U, params.OE, params.UE, params.id0)).encode())
+    digest.update(repr(keyspace.mask).encode())
+    for word in keyspace.words:
+        digest.update(word.encode("utf-8", "surrogatepass") + b"\n")
+    return digest.hexdigest()
+
+def default_state_path(fingerprint: str) -> str:
+    """
+    State file used for a search when none is given
+    """
+    return os.path.join(STATE_DIR, f"{fingerprint[:32]}.json")
+
+def load_progress(state_path: str, fingerprint: str) -> int:
+    """
+    Returns: the first candidate not yet checked by an earlier run of the
+    same search, or 0
+    """
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if state.get("fingerprint") != fingerprint:
+        return 0
+    return max(0, int(state.get("next", 0)))
+
+def _save_progress(state_path: str, fingerprint: str, next_index: int, total: int) -> None:
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    tmp_path = f"{state_path}.part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "next": next_index, "total": total, "updated": time.time()}, f)
+    os.replace(tmp_path, state_path)
+
+def _check_range(
+    params: EncryptParams, mask: Mask, words: List[str], word_offset: int, start: int, stop: int
+) -> Optional[int]:
+    for index in range(start, stop):
+        word_index, mask_index = divmod(index, mask.size)
+        word = words[word_index - word_offset] if mask.has_word else ""
+        if check_password(params, mask.candidate(mask_index, word)):
+            return index
+    return None
+
+# Set once per worker process by _init_worker, so chunks only carry their range
+_worker_search = None
+
+def _init_worker(params: EncryptParams, mask: Mask, stop_event=None) -> None:
+    global _worker_search
+    _worker_search = (params, mask, stop_event)
+    # Ctrl+C reaches the whole process group; the parent cancels the search
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _check_chunk(start: int, stop: int, words: List[str], word_offset: int) -> Tuple[int, int, Optional[int]]:
+    """
+    Check candidates start..stop-1 in slices, giving up between slices once
+    the search's stop event is set. Runs inside a worker process.
+    Returns: (start, end, found): candidates start..end-1 were checked, end
+    being stop unless the search was stopped
+    """
+    params, mask, stop_event = _worker_search
+    step = max(1, -(-(stop - start) // CHUNK_SLICES))
+    for first in range(start, stop, step):
+        if stop_event is not None and stop_event.is_set():
+            return start, first, None
+        found = _check_range(params, mask, words, word_offset, first, min(stop, first + step))
+        if found is not None:
+            return start, stop, found
+    return start, stop, None
+
+@dataclass
+class RecoveryProgress:
+    checked: int        # candidates checked, including earlier runs
+    total: int
+    rate: float         # candidates per second in this run
+    eta_seconds: Optional[float]
+
+    @property
+    def fraction(self) -> float:
+        return self.checked / self.total if self.total else 1.0
+
+@dataclass
+class RecoveryResult:
+    password: Optional[str]
+    checked: int
+    total: int
+    resumed_from: int
+    seconds: float
+
+    @property
+    def exhausted(self) -> bool:
+        return self.password is None and self.checked >= self.total
+
+def format_duration(seconds: Optional[float]) -> str:
+    """
+    Returns: e.g. "3h 12m", "4m 05s" or "12s"; "unknown" for None
+    """
+    if seconds is None:
+        return "unknown"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+def recover_password(
+    params: EncryptParams,
+    keyspace: Keyspace,
+    max_workers: Optional[int] = None,
+    on_progress: Optional[Callable[[RecoveryProgress], None]] = None,
+    cancel: Optional[Event] = None,
+    state_path: Optional[str] = None,
+    resume: bool = True,
+) -> RecoveryResult:
+    """
+    Search keyspace for a password that opens the file described by params,
+    on up to max_workers processes. A few candidates are first checked
+    in-process to size chunks for about CHUNK_SECONDS each; chunks then run
+    in the pool in order. on_progress is called after each chunk. Progress
+    is saved to state_path (by default a file under STATE_DIR), and with
+    resume an earlier run of the same search continues where it stopped.
+    The state file is removed once the search finishes.
+    Returns: the password found (or None) and how far the search got
+    """
+    from unlocker import CANCEL_POLL_SECONDS, default_workers
+
+    started = time.perf_counter()
+    total = keyspace.size
+    fingerprint = search_fingerprint(params, keyspace)
+    if state_path is None:
+        state_path = default_state_path(fingerprint)
+    resumed_from = min(load_progress(state_path, fingerprint), total) if resume else 0
+    mask, words = keyspace.mask, keyspace.words
+
+    def finish(password: Optional[str], checked: int) -> RecoveryResult:
+        if password is not None or checked >= total:
+            try:
+                os.remove(state_path)
+            except OSError:
+                pass
+        else:
+            _save_progress(state_path, fingerprint, checked, total)
+        return RecoveryResult(password, checked, total, resumed_from, time.perf_counter() - started)
+
+    def report(checked: int) -> None:
+        if on_progress is None:
+            return
+        elapsed = time.perf_counter() - started
+        rate = (checked - resumed_from) / elapsed if elapsed > 0 else 0.0
+        eta = (total - checked) / rate if rate > 0 else None
+        on_progress(RecoveryProgress(checked, total, rate, eta))
+
+    # Calibrate on the first candidates still to check
+    position = resumed_from
+    while position < total and time.perf_counter() - started < CALIBRATION_SECONDS:
+        if cancel is not None and cancel.is_set():
+            return finish(None, position)
+        word_index = position // mask.size
+        found = _check_range(params, mask, words[word_index:word_index + 1], word_index, position, position + 1)
+        if found is not None:
+            return finish(mask.candidate(found % mask.size, words[word_index] if mask.has_word else ""), found + 1)
+        position += 1
+    report(position)
+    if position >= total:
+        return finish(None, total)
+    per_candidate = (time.perf_counter() - started) / max(1, position - resumed_from)
+    chunk = max(1, min(MAX_CHUNK, int(CHUNK_SECONDS / per_candidate)))
+
+    workers = max(1, min(max_workers or default_workers(), -(-(total - position) // chunk)))
+    # Tells running chunks to stop, on a cancel or once the password is found
+    stop_event = multiprocessing.Event()
+    next_start = position
+    in_flight = {}
+    # Starts of chunks submitted but not checked, including cancelled ones;
+    # everything before the lowest of them (or next_start) has been checked
+    unchecked = set()
+    checked_until = position
+    last_saved = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(params, mask, stop_event)
+    ) as pool:
+
+        def submit_next() -> None:
+            nonlocal next_start
+            if next_start >= total or (cancel is not None and cancel.is_set()):
+                return
+            stop = min(total, next_start + chunk)
+            first_word, last_word = keyspace.word_range(next_start, stop)
+            future = pool.submit(_check_chunk, next_start, stop, words[first_word:last_word], first_word)
+            in_flight[future] = (next_start, stop)
+            unchecked.add(next_start)
+            next_start = stop
+
+        for _ in range(workers * 2):
+            submit_next()
+        done_count = 0
+        while in_flight:
+            done, _ = wait(in_flight, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                stop_event.set()
+                for future in list(in_flight):
+                    if future not in done and future.cancel():
+                        del in_flight[future]
+            for future in done:
+                _, requested_stop = in_flight.pop(future)
+                if future.cancelled():
+                    continue
+                start, stop, found = future.result()
+                unchecked.discard(start)
+                if stop < requested_stop:
+                    # Stopped early by a cancel; the rest is still to check
+                    unchecked.add(stop)
+                done_count += stop - start
+                if found is not None:
+                    stop_event.set()
+                    for other in in_flight:
+                        other.cancel()
+                    word_index = found // mask.size
+                    password = mask.candidate(found % mask.size, words[word_index] if mask.has_word else "")
+                    return finish(password, max(checked_until, found + 1))
+                submit_next()
+            if not done:
+                continue
+            checked_until = min(unchecked, default=next_start)
+            report(position + done_count)
+            if time.perf_counter() - last_saved >= SAVE_SECONDS:
+                _save_progress(state_path, fingerprint, checked_until, total)
+                last_saved = time.perf_counter()
+    return finish(None, min(unchecked, default=next_start))
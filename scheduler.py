@@ -0,0 +1,111 @@
+"""
+Process-wide admission control for unlock jobs.
+
+All sessions on a server share one Scheduler. A job asks for a number of
+CPU slots (worker processes) and an estimate of the memory it will need,
+and waits in a single FIFO queue until both are free. Jobs are admitted
+strictly in order, so a large batch at the head of the queue is not
+overtaken by smaller ones: latency under load stays predictable at some
+cost in peak throughput.
+"""
+import threading
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+# How often waiting jobs re-check for cancellation
+POLL_SECONDS = 0.2
+
+class Scheduler:
+    """
+    cpu_slots caps worker processes across all running jobs, memory_bytes
+    caps their estimated memory plus results still held in memory
+    (see set_retained), and max_jobs, if set, caps running jobs.
+    A job that needs more than the whole budget runs alone.
+    """
+
+    def __init__(self, cpu_slots: int, memory_bytes: int, max_jobs: Optional[int] = None):
+        self.cpu_slots = max(1, cpu_slots)
+        self.memory_bytes = memory_bytes
+        self.max_jobs = max_jobs
+        self.retained = 0
+        self._cond = threading.Condition()
+        self._queue = []
+        self._running: Dict[Hashable, Tuple[int, int]] = {}
+
+    def _fits(self, cpus: int, memory: int) -> bool:
+        if self.max_jobs is not None and len(self._running) >= self.max_jobs:
+            return False
+        used_cpus = sum(c for c, _ in self._running.values())
+        used_memory = sum(m for _, m in self._running.values()) + self.retained
+        return used_cpus + cpus <= self.cpu_slots and used_memory + memory <= self.memory_bytes
+
+    def acquire(
+        self,
+        ticket: Hashable,
+        cpus: int,
+        memory: int,
+        cancel: Optional[threading.Event] = None,
+        make_room: Optional[Callable[[int], None]] = None,
+    ) -> Optional[int]:
+        """
+        Block until ticket reaches the head of the queue and its resources
+        are free. make_room(memory_bytes), if given, is called while the head
+        of the queue is waiting for memory, e.g. to spill retained results
+        to disk.
+        Returns: the CPU slots granted, or None if cancel was set first
+        """
+        cpus = max(1, min(cpus, self.cpu_slots))
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        return None
+                    if self._queue[0] == ticket:
+                        if not self._fits(cpus, memory) and make_room is not None and self.retained:
+                            # Spilling writes files; don't hold the lock meanwhile
+                            self._cond.release()
+                            try:
+                                make_room(memory)
+                            finally:
+                                self._cond.acquire()
+                        if self._fits(cpus, memory) or not self._running:
+                            self._running[ticket] = (cpus, memory)
+                            return cpus
+                    self._cond.wait(POLL_SECONDS)
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    def release(self, ticket: Hashable) -> None:
+        with self._cond:
+            self._running.pop(ticket, None)
+            self._cond.notify_all()
+
+    def set_retained(self, num_bytes: int) -> None:
+        """
+        Bytes of finished results still held in memory
+        """
+        with self._cond:
+            self.retained = num_bytes
+            self._cond.notify_all()
+
+    def position(self, ticket: Hashable) -> Optional[int]:
+        """
+        Returns: 1-based place in the queue, or None if not waiting
+        """
+        with self._cond:
+            if ticket in self._queue:
+                return self._queue.index(ticket) + 1
+            return None
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "running": len(self._running),
+                "queued": len(self._queue),
+                "cpu_used": sum(c for c, _ in self._running.values()),
+                "cpu_slots": self.cpu_slots,
+                "memory_used": sum(m for _, m in self._running.values()) + self.retained,
+                "memory_retained": self.retained,
+                "memory_bytes": self.memory_bytes,
+            }
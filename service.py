@@ -0,0 +1,629 @@
+"""
+HTTP API around the unlock core, for other services to call.
+
+    POST /unlock          the PDF as the request body, its password in the
+                          X-PDF-Password header
+    POST /unlock/batch    multipart/form-data with one part per PDF, plus a
+                          "password" field for every file and/or a
+                          "passwords" field holding a JSON object of
+                          {pattern: password} (see passwords.password_for)
+    GET  /healthz         JSON: workers, files in flight, capacity
+    GET  /metrics         Prometheus text: the unlock metrics plus HTTP counters
+
+Query parameters mode, profile and level choose the unlock mode and output
+profile, and pages (e.g. "1-10, 15") keeps only those pages of each file;
+a batch also takes compression (see export.COMPRESSION_MODES) and a single
+upload takes filename.
+
+Request bodies, with a Content-Length or chunked, are copied in chunks
+into a per-request temporary directory. Responses use chunked transfer
+encoding. A single PDF is streamed from the file its worker wrote. A batch
+comes back as a ZIP written straight to the socket as files finish. Its last
+entry is results.json with each file's status.
+
+All requests share one process pool. Each file holds a slot from admission
+until its worker is done. Once workers * (1 + queue_depth) slots are taken,
+new requests get 429 with a Retry-After estimate. A worker that dies while
+unlocking a file (e.g. killed for memory) gives 503 with Retry-After, or a
+failed entry in a batch's results.json; the next file gets a fresh pool.
+"""
+import email.message
+import email.parser
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from export import ZipExporter, parse_compression
+from metrics import FileMetrics, MetricsRecorder
+from passwords import password_for
+from unlocker import DEFAULT_LEVEL, OUTPUT_PROFILES, UNLOCK_MODES, default_workers, unlock_pdf_file, unlocked_filename
+
+# Read and write size for request and response bodies
+CHUNK_SIZE = 64 * 1024
+
+# Files allowed to wait per worker before requests are turned away
+QUEUE_DEPTH = 4
+
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+
+# Limits for the headers and non-file fields of multipart parts
+MAX_PART_HEADER_BYTES = 16 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+
+# Idle connections and stalled uploads are dropped after this long
+SOCKET_TIMEOUT = 60
+
+# Bounds of the Retry-After hint sent with 429 responses
+MAX_RETRY_AFTER = 60
+
+class RequestError(Exception):
+    """
+    Ends a request with an HTTP error status and a JSON {"error": message} body
+    """
+
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+class _BodyReader:
+    """
+    Reads a request body sent with Content-Length or chunked transfer
+    encoding, failing with 413 once it goes over max_bytes
+    """
+
+    def __init__(self, rfile, headers, max_bytes: int):
+        self._rfile = rfile
+        self._max_bytes = max_bytes
+        self._total = 0
+        self._done = False
+        self._chunked = "chunked" in headers.get("Transfer-Encoding", "").lower()
+        if self._chunked:
+            self._remaining = 0
+            return
+        length = headers.get("Content-Length")
+        if length is None:
+            raise RequestError(411, "Send a Content-Length or use chunked transfer encoding")
+        try:
+            self._remaining = int(length)
+        except ValueError:
+            raise RequestError(400, "Invalid Content-Length")
+        if self._remaining > max_bytes:
+            raise RequestError(413, f"Uploads are limited to {max_bytes} bytes")
+
+    def _next_chunk(self) -> None:
+        line = self._rfile.readline(1024)
+        try:
+            size = int(line.split(b";")[0].strip(), 16)
+        except ValueError:
+            raise RequestError(400, "Malformed chunked body")
+        if size == 0:
+            # Optional trailer headers, then a blank line
+            while self._rfile.readline(1024) not in (b"\r\n", b"\n", b""):
+                pass
+            self._done = True
+        self._remaining = size
+
+    def read(self, size: int = CHUNK_SIZE) -> bytes:
+        if self._chunked and self._remaining == 0 and not self._done:
+            self._next_chunk()
+        if self._remaining == 0:
+            return b""
+        data = self._rfile.read(min(size, self._remaining))
+        if not data:
+            raise RequestError(400, "Request body ended early")
+        self._remaining -= len(data)
+        if self._chunked and self._remaining == 0:
+            self._rfile.readline(1024)
+        self._total += len(data)
+        if self._total > self._max_bytes:
+            raise RequestError(413, f"Uploads are limited to {self._max_bytes} bytes")
+        return data
+
+class _ChunkedWriter:
+    """
+    Write-only file object that sends what is written to it as HTTP/1.1
+    chunks, gathering small writes into CHUNK_SIZE pieces
+    """
+
+    def __init__(self, wfile):
+        self._wfile = wfile
+        self._buffer = bytearray()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        if len(self._buffer) >= CHUNK_SIZE:
+            self._send()
+        return len(data)
+
+    def _send(self) -> None:
+        if self._buffer:
+            self._wfile.write(b"%x\r\n" % len(self._buffer) + bytes(self._buffer) + b"\r\n")
+            self._buffer.clear()
+
+    def flush(self) -> None:
+        # zipfile flushes after every entry; sending each entry's tail as it
+        # is written keeps the client's download moving
+        self._send()
+
+    def close(self) -> None:
+        self._send()
+        self._wfile.write(b"0\r\n\r\n")
+
+def _read_multipart(body: _BodyReader, boundary: bytes, directory: str) -> Tuple[Dict[str, str], List[Tuple[str, str]]]:
+    """
+    Stream a multipart/form-data body, writing file parts into directory.
+    Returns: (fields, files) - text fields by name, and (filename, path) per
+    file part in the order they were sent
+    """
+    delimiter = b"\r\n--" + boundary
+    # The first delimiter has no line break before it
+    buffer = b"\r\n"
+    fields: Dict[str, str] = {}
+    files: List[Tuple[str, str]] = []
+
+    def fill() -> None:
+        nonlocal buffer
+        data = body.read(CHUNK_SIZE)
+        if not data:
+            raise RequestError(400, "Malformed multipart body")
+        buffer += data
+
+    while delimiter not in buffer:
+        buffer = buffer[-len(delimiter):]
+        fill()
+    buffer = buffer[buffer.index(delimiter) + len(delimiter):]
+
+    while True:
+        while len(buffer) < 2:
+            fill()
+        if buffer.startswith(b"--"):
+            break
+        while b"\r\n\r\n" not in buffer:
+            if len(buffer) > MAX_PART_HEADER_BYTES:
+                raise RequestError(400, "Multipart part headers too long")
+            fill()
+        end = buffer.index(b"\r\n\r\n")
+        headers = email.parser.BytesHeaderParser().parsebytes(buffer[:end].lstrip(b"\r\n"))
+        buffer = buffer[end + 4:]
+        name = headers.get_param("name", header="content-disposition")
+        filename = headers.get_filename()
+
+        if filename:
+            path = os.path.join(directory, f"upload_{len(files)}.pdf")
+            sink = open(path, "wb")
+        else:
+            sink = io.BytesIO()
+        with sink:
+            while delimiter not in buffer:
+                # Keep enough of the tail to spot a delimiter split across reads
+                keep = len(delimiter) - 1
+                if len(buffer) > keep:
+                    sink.write(buffer[:-keep])
+                    buffer = buffer[-keep:]
+                if not filename and sink.tell() > MAX_FIELD_BYTES:
+                    raise RequestError(413, f"Form field {name!r} is too long")
+                fill()
+            index = buffer.index(delimiter)
+            sink.write(buffer[:index])
+            buffer = buffer[index + len(delimiter):]
+            if filename:
+                files.append((os.path.basename(filename.replace("\\", "/")), path))
+            elif name:
+                fields[name] = sink.getvalue().decode("utf-8", "replace")
+
+    # Anything after the closing delimiter is ignored, but must be read
+    # for the connection to be reused
+    while body.read(CHUNK_SIZE):
+        pass
+    return fields, files
+
+def _unlock_job(
+    src_path: str, dst_path: str, password: str, mode: str, profile: str, level: int, pages: Optional[str]
+) -> Tuple[Tuple[bool, str], FileMetrics]:
+    # Runs inside a worker process
+    metrics = FileMetrics()
+    try:
+        result = unlock_pdf_file(
+            src_path, dst_path, password, mode=mode, metrics=metrics, profile=profile, level=level, pages=pages
+        )
+    except OSError as e:
+        result = (False, f"Error processing PDF: {str(e)}")
+    return result, metrics
+
+class UnlockService:
+    """
+    State shared by all request threads: the process pool, admission
+    control and metrics. Files are admitted while fewer than capacity are
+    in flight; a request bigger than the whole capacity is admitted only
+    when nothing else is running.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        queue_depth: int = QUEUE_DEPTH,
+        max_upload_bytes: int = MAX_UPLOAD_BYTES,
+        mode: str = "fast",
+        profile: str = "fast",
+        level: int = DEFAULT_LEVEL,
+        recorder: Optional[MetricsRecorder] = None,
+        spool_dir: Optional[str] = None,
+        log_requests: bool = True,
+    ):
+        self.workers = workers or default_workers()
+        self.capacity = self.workers * (1 + queue_depth)
+        self.max_upload_bytes = max_upload_bytes
+        self.mode = mode
+        self.profile = profile
+        self.level = level
+        self.recorder = recorder or MetricsRecorder()
+        self.spool_dir = spool_dir
+        self.log_requests = log_requests
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.in_flight = 0
+        self.rejected = 0
+        self.responses: Dict[int, int] = {}
+        # Moving average of worker seconds per file, for Retry-After
+        self.file_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def saturated(self) -> bool:
+        with self._lock:
+            return self.in_flight >= self.capacity
+
+    def admit(self, files: int) -> bool:
+        """
+        Reserve slots for files; each is released when its worker finishes
+        (or by release() if it is never submitted).
+        Returns: False if the pool is too busy
+        """
+        with self._lock:
+            if self.in_flight and self.in_flight + files > self.capacity:
+                return False
+            self.in_flight += files
+            return True
+
+    def release(self, files: int = 1) -> None:
+        with self._lock:
+            self.in_flight -= files
+
+    def retry_after(self) -> int:
+        """
+        Returns: seconds until the files now in flight should be done
+        """
+        with self._lock:
+            per_file = self.file_seconds or 1.0
+            return max(1, min(MAX_RETRY_AFTER, math.ceil(self.in_flight * per_file / self.workers)))
+
+    def busy(self) -> RequestError:
+        """
+        Returns: the 429 error for a request that was turned away
+        """
+        with self._lock:
+            self.rejected += 1
+        retry_after = self.retry_after()
+        return RequestError(429, "Too many files in flight, retry later", {"Retry-After": str(retry_after)})
+
+    def submit(self, src_path: str, dst_path: str, password: str, options: dict) -> Future:
+        """
+        Unlock one admitted file in the pool; its slot is released when done
+        """
+        args = (src_path, dst_path, password, options["mode"], options["profile"], options["level"], options["pages"])
+        pool = self.pool
+        try:
+            future = pool.submit(_unlock_job, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool
+            with self._lock:
+                if self.pool is pool:
+                    self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                pool = self.pool
+            future = pool.submit(_unlock_job, *args)
+        future.add_done_callback(lambda _: self.release())
+        return future
+
+    def result(self, future: Future) -> Tuple[Tuple[bool, str], FileMetrics]:
+        """
+        Wait for a file handed to submit()
+        Returns: ((success, message), metrics)
+        Raises: RequestError (503, with Retry-After) if its worker died or
+        failed outside the unlock itself
+        """
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # submit() replaces the broken pool for the next file
+            message = "The worker unlocking this file stopped unexpectedly, retry later"
+        except Exception as e:
+            message = f"The worker unlocking this file failed: {str(e)}"
+        raise RequestError(503, message, {"Retry-After": str(self.retry_after())})
+
+    def record(self, metrics: FileMetrics) -> None:
+        if not metrics.cached and metrics.stages:
+            with self._lock:
+                seconds = metrics.total_seconds
+                self.file_seconds = seconds if self.file_seconds is None else 0.9 * self.file_seconds + 0.1 * seconds
+        self.recorder.record(metrics)
+
+    def count_response(self, status: int) -> None:
+        with self._lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+
+    def health(self) -> dict:
+        with self._lock:
+            return {
+                "status": "saturated" if self.in_flight >= self.capacity else "ok",
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "capacity": self.capacity,
+                "rejected": self.rejected,
+                "file_seconds": round(self.file_seconds, 4) if self.file_seconds is not None else None,
+            }
+
+    def metrics_text(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP pdf_unlock_http_responses_total HTTP responses sent, by status code.",
+                "# TYPE pdf_unlock_http_responses_total counter",
+            ]
+            for status, count in sorted(self.responses.items()):
+                lines.append(f'pdf_unlock_http_responses_total{{code="{status}"}} {count}')
+            lines += [
+                "# HELP pdf_unlock_http_rejected_total Requests turned away with 429.",
+                "# TYPE pdf_unlock_http_rejected_total counter",
+                f"pdf_unlock_http_rejected_total {self.rejected}",
+                "# HELP pdf_unlock_http_files_in_flight Files admitted and not yet unlocked.",
+                "# TYPE pdf_unlock_http_files_in_flight gauge",
+                f"pdf_unlock_http_files_in_flight {self.in_flight}",
+                "# HELP pdf_unlock_http_capacity Files that can be in flight before requests get 429.",
+                "# TYPE pdf_unlock_http_capacity gauge",
+                f"pdf_unlock_http_capacity {self.capacity}",
+            ]
+        return self.recorder.prometheus_text() + "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+def _quote_filename(filename: str) -> str:
+    return filename.replace("\\", "_").replace('"', "_")
+
+class UnlockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "pdf-unlock"
+    timeout = SOCKET_TIMEOUT
+
+    @property
+    def service(self) -> UnlockService:
+        return self.server.service
+
+    def send_response(self, code, message=None) -> None:
+        self.service.count_response(code)
+        super().send_response(code, message)
+
+    def log_message(self, format, *args) -> None:
+        if self.service.log_requests:
+            super().log_message(format, *args)
+
+    def _send_body(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_body(status, json.dumps(data).encode("utf-8") + b"\n", "application/json", headers)
+
+    def _start_chunked(self, content_type: str, filename: str, headers: Optional[Dict[str, str]] = None) -> _ChunkedWriter:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Disposition", f'attachment; filename="{_quote_filename(filename)}"')
+        self.send_header("Transfer-Encoding", "chunked")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        return _ChunkedWriter(self.wfile)
+
+    def _options(self, query: Dict[str, List[str]]) -> dict:
+        def value(name, default):
+            return query.get(name, [default])[-1]
+
+        options = {
+            "mode": value("mode", self.service.mode),
+            "profile": value("profile", self.service.profile),
+            "level": value("level", str(self.service.level)),
+        }
+        if options["mode"] not in UNLOCK_MODES:
+            raise RequestError(400, f"mode must be one of {', '.join(UNLOCK_MODES)}")
+        if options["profile"] not in OUTPUT_PROFILES:
+            raise RequestError(400, f"profile must be one of {', '.join(OUTPUT_PROFILES)}")
+        if not options["level"].isdigit() or not 1 <= int(options["level"]) <= 9:
+            raise RequestError(400, "level must be 1-9")
+        options["level"] = int(options["level"])
+        # Checked against each file's page count when it is unlocked
+        options["pages"] = value("pages", "").strip() or None
+        return options
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if path == "/healthz":
+            self._send_json(200, self.service.health())
+        elif path == "/metrics":
+            self._send_body(200, self.service.metrics_text().encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            if url.path == "/unlock":
+                self._unlock_single(query)
+            elif url.path == "/unlock/batch":
+                self._unlock_batch(query)
+            else:
+                raise RequestError(404, "Not found")
+        except RequestError as e:
+            # The rest of the request body may still be unread
+            self.close_connection = True
+            self._send_json(e.status, {"error": e.message}, e.headers)
+        except (BrokenPipeError, ConnectionResetError, TimeoutError):
+            self.close_connection = True
+
+    def _unlock_single(self, query: Dict[str, List[str]]) -> None:
+        options = self._options(query)
+        password = self.headers.get("X-PDF-Password")
+        if password is None:
+            raise RequestError(400, "Send the password in the X-PDF-Password header")
+        # Header values arrive decoded as Latin-1; clients send UTF-8
+        try:
+            password = password.encode("latin-1").decode("utf-8")
+        except UnicodeError:
+            pass
+        filename = os.path.basename(query.get("filename", ["document.pdf"])[-1])
+        body = _BodyReader(self.rfile, self.headers, self.service.max_upload_bytes)
+        if not self.service.admit(1):
+            raise self.service.busy()
+
+        submitted = False
+        try:
+            with tempfile.TemporaryDirectory(prefix="pdf_unlock_http_", dir=self.service.spool_dir) as directory:
+                src_path = os.path.join(directory, "in.pdf")
+                dst_path = os.path.join(directory, "out.pdf")
+                with open(src_path, "wb") as f:
+                    for data in iter(body.read, b""):
+                        f.write(data)
+                future = self.service.submit(src_path, dst_path, password, options)
+                submitted = True
+                (success, message), metrics = self.service.result(future)
+                metrics.filename = filename
+                self.service.record(metrics)
+                if not success:
+                    raise RequestError(422, message)
+
+                stream = self._start_chunked("application/pdf", unlocked_filename(filename), {
+                    "X-Unlock-Input-Bytes": str(metrics.input_bytes),
+                    "X-Unlock-Output-Bytes": str(metrics.output_bytes),
+                    "X-Unlock-Seconds": f"{metrics.total_seconds:.4f}",
+                })
+                with open(dst_path, "rb") as f:
+                    shutil.copyfileobj(f, stream, CHUNK_SIZE)
+                stream.close()
+        finally:
+            if not submitted:
+                self.service.release()
+
+    def _unlock_batch(self, query: Dict[str, List[str]]) -> None:
+        options = self._options(query)
+        compression = query.get("compression", ["stored"])[-1]
+        try:
+            parse_compression(compression)
+        except ValueError as e:
+            raise RequestError(400, str(e))
+        content_type = email.message.Message()
+        content_type["Content-Type"] = self.headers.get("Content-Type", "")
+        boundary = content_type.get_param("boundary")
+        if content_type.get_content_type() != "multipart/form-data" or not boundary:
+            raise RequestError(415, "Send a multipart/form-data body")
+        # Turn requests away before reading their uploads where possible
+        if self.service.saturated():
+            raise self.service.busy()
+
+        with tempfile.TemporaryDirectory(prefix="pdf_unlock_http_", dir=self.service.spool_dir) as directory:
+            body = _BodyReader(self.rfile, self.headers, self.service.max_upload_bytes)
+            fields, files = _read_multipart(body, boundary.encode("latin-1"), directory)
+            if not files:
+                raise RequestError(400, "No files in the request")
+            mapping = {}
+            if "passwords" in fields:
+                try:
+                    mapping = json.loads(fields["passwords"])
+                except ValueError:
+                    mapping = None
+                if not isinstance(mapping, dict):
+                    raise RequestError(400, "passwords must be a JSON object of pattern -> password")
+                mapping = {str(k): str(v) for k, v in mapping.items()}
+
+            results = []
+            jobs = []
+            for index, (filename, path) in enumerate(files):
+                password = password_for(filename, mapping) if mapping else None
+                if password is None:
+                    password = fields.get("password")
+                entry = {"file": filename, "status": "skipped", "message": "No password provided"}
+                results.append(entry)
+                if password is not None:
+                    jobs.append((entry, path, os.path.join(directory, f"out_{index}.pdf"), password))
+            if not self.service.admit(len(jobs)):
+                raise self.service.busy()
+
+            futures = {}
+            try:
+                for job in jobs:
+                    entry, src_path, dst_path, password = job
+                    futures[self.service.submit(src_path, dst_path, password, options)] = job
+            finally:
+                self.service.release(len(jobs) - len(futures))
+
+            stream = self._start_chunked("application/zip", "unlocked_pdfs.zip")
+            zip_export = ZipExporter(compression, stream=stream)
+            try:
+                for future in as_completed(futures):
+                    entry, _, dst_path, _ = futures[future]
+                    try:
+                        (success, message), metrics = self.service.result(future)
+                    except RequestError as e:
+                        success, message, metrics = False, e.message, FileMetrics()
+                    metrics.filename = entry["file"]
+                    self.service.record(metrics)
+                    entry["status"] = "success" if success else "failed"
+                    entry["message"] = message
+                    if success:
+                        entry["output"] = zip_export.add_file(unlocked_filename(entry["file"]), dst_path)
+                        entry["input_bytes"] = metrics.input_bytes
+                        entry["output_bytes"] = metrics.output_bytes
+                zip_export.add("results.json", json.dumps(results, indent=2).encode("utf-8"))
+                zip_export.finish()
+                stream.close()
+            finally:
+                # If the client went away, drop queued files and let running
+                # ones finish before their directory is removed
+                for future in futures:
+                    future.cancel()
+                wait(futures)
+
+def make_server(host: str, port: int, service: UnlockService) -> ThreadingHTTPServer:
+    """
+    Returns: an HTTP server for service, not yet serving
+    """
+    server = ThreadingHTTPServer((host, port), UnlockHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+def serve(host: str, port: int, service: UnlockService) -> None:
+    """
+    Serve until interrupted, then shut the pool down
+    """
+    server = make_server(host, port, service)
+    if service.log_requests:
+        print(f"Listening on http://{server.server_address[0]}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,25 @@
+import io
+import os
+import sys
+from typing import Optional
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def encrypted_pdf(
+    pages: int, password: str = "secret", algorithm: str = "AES-256", owner_password: Optional[str] = None
+) -> bytes:
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(612, 792)
+    writer.encrypt(password, owner_password, algorithm=algorithm)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+@pytest.fixture
+def make_pdf():
+    return encrypted_pdf
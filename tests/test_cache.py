@@ -0,0 +1,71 @@
+import os
+
+from cache import ResultCache
+
+def _ok(data: bytes):
+    return data, True, "Success"
+
+def test_key_depends_on_content_password_and_options():
+    cache = ResultCache()
+    key = cache.key(b"%PDF-a", "secret")
+    assert cache.key(b"%PDF-a", "secret") == key
+    assert cache.key(b"%PDF-b", "secret") != key
+    assert cache.key(b"%PDF-a", "Secret") != key
+    assert cache.key(b"%PDF-a", "secret", "compact:6") != key
+    # Salted per cache: another cache can't recognise the password
+    assert ResultCache().key(b"%PDF-a", "secret") != key
+
+def test_memory_tier_evicts_least_recently_used_by_bytes():
+    cache = ResultCache(max_bytes=30)
+    for name in "abc":
+        cache.put(name, _ok(name.encode() * 10))
+    assert cache.get("a") is not None  # now the most recently used
+    cache.put("d", _ok(b"d" * 10))
+    assert cache.get("b") is None
+    assert [cache.get(name)[0][:1] for name in "acd"] == [b"a", b"c", b"d"]
+    assert cache.stats()["bytes"] == 30
+
+    # Too large to keep at all, and nothing is evicted for it
+    cache.put("huge", _ok(b"x" * 31))
+    assert cache.get("huge") is None
+    assert cache.stats()["entries"] == 3
+
+def test_failures_are_not_cached():
+    cache = ResultCache()
+    cache.put("key", (b"", False, "Incorrect password"))
+    assert cache.get("key") is None
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path))
+    key = cache.key(b"%PDF-locked", "secret")
+    cache.put(key, _ok(b"%PDF-unlocked"))
+
+    restarted = ResultCache(cache_dir=str(tmp_path))
+    # The stored salt keeps keys stable across restarts
+    assert restarted.key(b"%PDF-locked", "secret") == key
+    assert restarted.get(key) == _ok(b"%PDF-unlocked")
+    assert restarted.stats()["hits"] == 1 and restarted.disk_hits == 1
+
+def test_disk_tier_is_trimmed_least_recently_used_first(tmp_path):
+    cache = ResultCache(max_bytes=0, cache_dir=str(tmp_path), disk_max_bytes=25)
+    cache.put("aa-old", _ok(b"a" * 10))
+    cache.put("bb-new", _ok(b"b" * 10))
+    old = os.path.join(str(tmp_path), "aa", "aa-old.pdf")
+    os.utime(old, (1, 1))
+    cache.put("cc-newest", _ok(b"c" * 10))
+    assert cache.get("aa-old") is None
+    assert cache.get("bb-new") is not None and cache.get("cc-newest") is not None
+
+def test_passwords_never_reach_disk(tmp_path):
+    password = "correct horse battery staple"
+    cache = ResultCache(cache_dir=str(tmp_path))
+    key = cache.key(b"%PDF-locked", password)
+    assert password not in key
+    cache.put(key, _ok(b"%PDF-unlocked"))
+
+    for variant in (password.encode("utf-8"), password.encode("utf-16-le"), password.encode().hex().encode()):
+        for root, _, names in os.walk(str(tmp_path)):
+            for name in names:
+                assert variant.decode("latin-1") not in name
+                with open(os.path.join(root, name), "rb") as f:
+                    assert variant not in f.read()
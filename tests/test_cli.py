@@ -0,0 +1,48 @@
+import os
+import signal
+import stat
+
+import pytest
+
+import cli
+
+@pytest.fixture
+def locked(tmp_path, make_pdf, monkeypatch):
+    monkeypatch.setattr("recovery.STATE_DIR", str(tmp_path / "state"))
+    src = tmp_path / "archive.pdf"
+    src.write_bytes(make_pdf(1, password="0613", algorithm="RC4-128"))
+    # cmd_recover installs its own Ctrl+C and SIGTERM handlers
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)}
+    yield src, tmp_path / "out"
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+def recover(src, out, *extra) -> int:
+    return cli.main(["recover", str(src), "-o", str(out), "--owner", "-m", "?d?d?d?d", "-j", "1", *extra])
+
+def test_recovered_password_is_saved_owner_only(locked, capsys):
+    src, out = locked
+    assert recover(src, out) == 0
+    saved = out / "archive.pdf.password"
+    assert saved.read_text() == "0613\n"
+    assert stat.S_IMODE(os.stat(saved).st_mode) == 0o600
+    assert (out / "archive.pdf").exists()
+    captured = capsys.readouterr()
+    assert "0613" not in captured.out + captured.err
+
+def test_save_password_replaces_a_readable_file(locked, tmp_path, capsys):
+    src, out = locked
+    secret = tmp_path / "secret.txt"
+    secret.write_text("old\n")
+    os.chmod(secret, 0o644)
+    assert recover(src, out, "--save-password", str(secret)) == 0
+    assert secret.read_text() == "0613\n"
+    assert stat.S_IMODE(os.stat(secret).st_mode) == 0o600
+    assert not (out / "archive.pdf.password").exists()
+    assert "0613" not in capsys.readouterr().out
+
+def test_print_flag_prints_instead_of_saving(locked, capsys):
+    src, out = locked
+    assert recover(src, out, "--print", "-q") == 0
+    assert capsys.readouterr().out == "0613\n"
+    assert os.listdir(out) == ["archive.pdf"]
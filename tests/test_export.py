@@ -0,0 +1,44 @@
+import io
+import threading
+import zipfile
+
+import pytest
+
+from export import ZipExporter
+
+def test_entry_over_the_zip64_limit_from_disk(tmp_path, monkeypatch):
+    # Stands in for a file over 2 GiB; zipfile reads the limit at run time
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 4096)
+    data = bytes(range(256)) * 64
+    path = tmp_path / "large.pdf"
+    path.write_bytes(data)
+
+    for compression in ("stored", "deflate-6"):
+        stream = io.BytesIO()
+        zip_export = ZipExporter(compression, stream=stream)
+        zip_export.add_file("large.pdf", str(path))
+        zip_export.add("small.pdf", b"%PDF-1.7")
+        zip_export.finish()
+        with zipfile.ZipFile(io.BytesIO(stream.getvalue())) as archive:
+            assert archive.read("large.pdf") == data
+            assert archive.read("small.pdf") == b"%PDF-1.7"
+
+def test_read_is_safe_alongside_spill_and_limited():
+    zip_export = ZipExporter(spool_max_size=1 << 30)
+    for index in range(50):
+        zip_export.add(f"doc{index}.pdf", bytes([index]) * 10000)
+    zip_export.finish()
+
+    spilled = threading.Thread(target=zip_export.spill)
+    spilled.start()
+    data = zip_export.read()
+    spilled.join()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert len(archive.namelist()) == 50
+    assert zip_export.read() == data
+
+    with pytest.raises(ValueError, match="limit"):
+        zip_export.read(limit=len(data) - 1)
+    zip_export.close()
+    with pytest.raises(ValueError, match="discarded"):
+        zip_export.read()
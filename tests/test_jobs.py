@@ -0,0 +1,76 @@
+import io
+
+import pytest
+from pypdf import PdfReader
+
+import pipeline
+from cache import ResultCache
+from jobs import Job, JobOptions, run_recovery_job, run_unlock_job
+from metrics import MetricsRecorder
+from recovery import build_keyspace
+from triage import triage_pdf
+
+class Upload:
+    """
+    Stands in for a Streamlit UploadedFile
+    """
+
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self.size = len(data)
+        self._data = data
+
+    def getbuffer(self):
+        return memoryview(self._data)
+
+    def getvalue(self) -> bytes:
+        return self._data
+
+def make_job(files, **options) -> Job:
+    uploads = [Upload(name, data) for name, data in files]
+    triage = {upload.name: triage_pdf(io.BytesIO(upload.getvalue())) for upload in uploads}
+    passwords = {upload.name: "secret" for upload in uploads}
+    return Job(uploads, triage, JobOptions(passwords, **options))
+
+def run(job: Job) -> Job:
+    run_unlock_job(job, ResultCache(), MetricsRecorder())
+    return job
+
+def result(job: Job, name: str):
+    data = dict(job.unlocked_files)[name]
+    if isinstance(data, str):
+        with open(data, "rb") as f:
+            data = f.read()
+    return PdfReader(io.BytesIO(data))
+
+@pytest.mark.parametrize("max_workers, background", [(1, False), (2, True)])
+def test_merge_only_runs_beside_the_batch_with_a_spare_cpu(monkeypatch, make_pdf, max_workers, background):
+    started = []
+    start_merge = pipeline.start_merge
+
+    def spy(*args, **kwargs):
+        started.append(args)
+        return start_merge(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline, "start_merge", spy)
+    job = make_job(
+        [("a.pdf", make_pdf(1)), ("b.pdf", make_pdf(2)), ("c.pdf", make_pdf(3))],
+        use_parallel=True, max_workers=max_workers, merge=["b.pdf", "a.pdf"],
+    )
+    run(job)
+    assert bool(started) == background
+    assert len(result(job, "merged.pdf").pages) == 3
+    assert len(result(job, "unlocked_c.pdf").pages) == 3
+
+def test_recovered_password_is_only_revealed_once(monkeypatch, tmp_path, make_pdf):
+    monkeypatch.setattr("recovery.STATE_DIR", str(tmp_path))
+    job = make_job([("c.pdf", make_pdf(2, password="hunter2"))])
+    run_recovery_job(job, ResultCache(), MetricsRecorder(), build_keyspace(["a", "b", "hunter2"]))
+
+    ((name, status, message),) = job.results
+    assert "Success" in status and message.startswith("Password recovered (")
+    assert "hunter2" not in repr(job.results) + job.message + repr(job)
+    assert job.options.passwords == {}
+    assert len(result(job, "unlocked_c.pdf").pages) == 2
+    assert job.reveal_password() == "hunter2"
+    assert job.reveal_password() is None
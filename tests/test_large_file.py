@@ -0,0 +1,17 @@
+import os
+
+from benchmarks.bench_large_file import make_large_pdf, measure
+
+# Small enough to run with the rest of the suite, large enough that the
+# interpreter's own fluctuations stay well under one stream
+STREAMS = 4
+STREAM_MB = 8
+MAX_RATIO = 5.0
+
+def test_disk_backed_unlock_stays_within_a_few_streams(tmp_path):
+    src = os.path.join(tmp_path, "large.pdf")
+    dst = os.path.join(tmp_path, "unlocked.pdf")
+    make_large_pdf(src, STREAMS, STREAM_MB)
+    growth = measure("disk", src, dst)
+    assert os.path.getsize(dst) > STREAMS * STREAM_MB * 1024 * 1024
+    assert growth / STREAM_MB <= MAX_RATIO, f"peak RSS grew {growth:.0f} MB for {STREAM_MB} MB streams"
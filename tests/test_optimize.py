@@ -0,0 +1,126 @@
+import io
+import os
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, IndirectObject, NameObject, NumberObject,
+    TextStringObject,
+)
+
+from optimize import dedupe_objects
+from unlocker import unlock_to_stream
+
+def _name(value: str) -> NameObject:
+    return NameObject(value)
+
+def _image(data: bytes) -> DecodedStreamObject:
+    image = DecodedStreamObject()
+    image.set_data(data)
+    image.update({
+        _name("/Type"): _name("/XObject"), _name("/Subtype"): _name("/Image"),
+        _name("/Width"): NumberObject(8), _name("/Height"): NumberObject(8),
+        _name("/ColorSpace"): _name("/DeviceGray"), _name("/BitsPerComponent"): NumberObject(8),
+    })
+    return image
+
+def _annotation(subtype: str, **entries) -> DictionaryObject:
+    annotation = DictionaryObject({
+        _name("/Type"): _name("/Annot"), _name("/Subtype"): _name(subtype),
+        _name("/Rect"): ArrayObject([FloatObject(10), FloatObject(10), FloatObject(50), FloatObject(30)]),
+    })
+    for key, value in entries.items():
+        annotation[_name("/" + key)] = value
+    return annotation
+
+def document(pages: int = 4) -> bytes:
+    """
+    Pages with their own text, the same 8x8 image stored as a separate
+    object on every page, and an identical link and form widget on each
+    """
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        _name("/Type"): _name("/Font"), _name("/Subtype"): _name("/Type1"), _name("/BaseFont"): _name("/Helvetica"),
+    }))
+    pixels = os.urandom(64)
+    fields = ArrayObject()
+    for index in range(pages):
+        page = writer.add_blank_page(612, 792)
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 72 720 Td (Page {index + 1} text) Tj ET q 8 0 0 8 72 600 cm /Im0 Do Q".encode())
+        page[_name("/Contents")] = writer._add_object(content)
+        page[_name("/Resources")] = DictionaryObject({
+            _name("/Font"): DictionaryObject({_name("/F1"): font}),
+            _name("/XObject"): DictionaryObject({_name("/Im0"): writer._add_object(_image(pixels))}),
+        })
+        link = writer._add_object(_annotation("/Link", Border=ArrayObject([NumberObject(0)] * 3)))
+        widget = writer._add_object(_annotation("/Widget", FT=_name("/Btn"), T=TextStringObject("agree")))
+        page[_name("/Annots")] = ArrayObject([link, widget])
+        fields.append(widget)
+    writer._root_object[_name("/AcroForm")] = writer._add_object(DictionaryObject({_name("/Fields"): fields}))
+    writer.encrypt("secret", algorithm="AES-256")
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def unlock(data: bytes, profile: str) -> PdfReader:
+    output = io.BytesIO()
+    success, message = unlock_to_stream(io.BytesIO(data), "secret", output, profile=profile)
+    assert success, message
+    return PdfReader(io.BytesIO(output.getvalue()))
+
+def _objects(reader: PdfReader):
+    found = []
+    for generation, numbers in reader.xref.items():
+        found += [IndirectObject(idnum, generation, reader).get_object() for idnum in numbers]
+    found += [IndirectObject(idnum, 0, reader).get_object() for idnum in reader.xref_objStm]
+    return [obj for obj in found if isinstance(obj, DictionaryObject)]
+
+def test_compact_output_matches_fast_output():
+    data = document()
+    fast, compact = unlock(data, "fast"), unlock(data, "compact")
+    assert len(compact.pages) == len(fast.pages) == 4
+    assert [page.extract_text() for page in compact.pages] == [page.extract_text() for page in fast.pages]
+    assert compact.pages[2].extract_text().strip() == "Page 3 text"
+
+def test_duplicate_images_collapse_to_one_object():
+    compact = unlock(document(), "compact")
+    images = [obj for obj in _objects(compact) if obj.get("/Subtype") == "/Image"]
+    assert len(images) == 1
+    references = {page["/Resources"]["/XObject"].raw_get("/Im0").idnum for page in compact.pages}
+    assert len(references) == 1
+
+def test_pages_annotations_and_fields_are_never_merged():
+    compact = unlock(document(), "compact")
+    pages = [page.indirect_reference.idnum for page in compact.pages]
+    assert len(set(pages)) == 4
+    annotations = [ref.idnum for page in compact.pages for ref in page["/Annots"]]
+    assert len(set(annotations)) == 8
+    fields = [ref.idnum for ref in compact.trailer["/Root"]["/AcroForm"]["/Fields"]]
+    assert len(set(fields)) == 4
+    assert all(ref.get_object()["/Type"] == "/Annot" for ref in compact.trailer["/Root"]["/AcroForm"]["/Fields"])
+
+def test_dedupe_keeps_identical_unique_types_apart():
+    def page():
+        return DictionaryObject({_name("/Type"): _name("/Page"), _name("/Parent"): IndirectObject(9, 0, None)})
+
+    def plain():
+        return DictionaryObject({_name("/Width"): NumberObject(3)})
+
+    def struct_element():
+        return DictionaryObject({_name("/Type"): _name("/StructElem"), _name("/S"): _name("/P")})
+
+    objects = {1: page(), 2: page(), 3: plain(), 4: plain(), 5: struct_element(), 6: struct_element(),
+               7: _annotation("/Link"), 8: _annotation("/Link")}
+    assert dedupe_objects(objects) == {4: 3}
+    assert sorted(objects) == [1, 2, 3, 5, 6, 7, 8]
+
+def test_dedupe_follows_merged_references():
+    # Two fonts that only differ in which (identical) descriptor they use
+    objects = {
+        1: DictionaryObject({_name("/FontName"): _name("/A")}),
+        2: DictionaryObject({_name("/FontName"): _name("/A")}),
+        3: DictionaryObject({_name("/FontDescriptor"): IndirectObject(1, 0, None)}),
+        4: DictionaryObject({_name("/FontDescriptor"): IndirectObject(2, 0, None)}),
+    }
+    assert dedupe_objects(objects) == {2: 1, 4: 3}
+    assert objects[3].raw_get("/FontDescriptor").idnum == 1
@@ -0,0 +1,86 @@
+import io
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+from pages import format_page_ranges, parse_page_ranges, select_pages, split_pages, write_objects
+from unlocker import unlock_to_stream
+
+def numbered_pdf(pages: int) -> bytes:
+    # Page i is 100 + i points wide, so pages can be told apart
+    writer = PdfWriter()
+    for index in range(pages):
+        writer.add_blank_page(100 + index, 792)
+    writer.encrypt("secret", algorithm="AES-256")
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def page_numbers(data: bytes):
+    return [int(page.mediabox.width) - 100 for page in PdfReader(io.BytesIO(data)).pages]
+
+def test_parse_pages_and_ranges():
+    assert parse_page_ranges("1-10, 15, 20-", 22) == list(range(10)) + [14, 19, 20, 21]
+    # Sorted, without repeats
+    assert parse_page_ranges("5, 1-3, 2", 10) == [0, 1, 2, 4]
+    assert parse_page_ranges("7", None) == [6]
+
+@pytest.mark.parametrize("spec", ["", "  ", " , ,"])
+def test_blank_selection_means_every_page(spec):
+    assert parse_page_ranges(spec, 5) is None
+
+@pytest.mark.parametrize("spec, count, message", [
+    ("5-3", 10, "not a valid page range"),
+    ("0", 10, "not a valid page range"),
+    ("11", 10, "past the end"),
+    ("8-12", 10, "past the end"),
+    ("20-", None, "needs the document's page count"),
+    ("a-b", 10, "not a page or page range"),
+    ("1-2-3", 10, "not a page or page range"),
+])
+def test_invalid_selections(spec, count, message):
+    with pytest.raises(ValueError, match=message):
+        parse_page_ranges(spec, count)
+
+def test_format_round_trips():
+    indices = [0, 1, 2, 4, 9, 10]
+    assert format_page_ranges(indices) == "1-3,5,10-11"
+    assert parse_page_ranges(format_page_ranges(indices), 11) == indices
+
+def test_split_part_boundaries():
+    assert split_pages(range(10), 4) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert split_pages(range(8), 4) == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert split_pages([2, 5, 7], 1) == [[2], [5], [7]]
+    assert split_pages([], 3) == []
+    with pytest.raises(ValueError):
+        split_pages(range(3), 0)
+
+def test_selected_output_has_exactly_the_requested_pages_in_order():
+    reader = PdfReader(io.BytesIO(numbered_pdf(12)))
+    reader.decrypt("secret")
+    objects, trailer = select_pages(reader, [7, 2, 11, 0])
+    output = io.BytesIO()
+    write_objects(objects, trailer, reader.pdf_header, output)
+    assert page_numbers(output.getvalue()) == [7, 2, 11, 0]
+
+@pytest.mark.parametrize("profile", ["fast", "compact"])
+def test_unlocking_a_selection(profile):
+    output = io.BytesIO()
+    success, message = unlock_to_stream(
+        io.BytesIO(numbered_pdf(25)), "secret", output, profile=profile, pages="1-3, 10, 20-"
+    )
+    assert success, message
+    assert page_numbers(output.getvalue()) == [0, 1, 2, 9, 19, 20, 21, 22, 23, 24]
+
+def test_unlocking_an_invalid_selection_fails():
+    success, message = unlock_to_stream(io.BytesIO(numbered_pdf(3)), "secret", io.BytesIO(), pages="2-9")
+    assert not success
+    assert message.startswith("Invalid page selection")
+
+def test_split_parts_of_a_selection(tmp_path):
+    from unlocker import split_parts
+
+    src = tmp_path / "doc.pdf"
+    src.write_bytes(numbered_pdf(10))
+    assert split_parts(str(src), "secret", 4, "2-7") == [[1, 2, 3, 4], [5, 6]]
+    assert split_parts(str(src), "secret", 5) == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]]
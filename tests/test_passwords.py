@@ -0,0 +1,48 @@
+import io
+
+import pytest
+
+from passwords import check_password, match_password, match_passwords
+from triage import triage_pdf
+
+ALGORITHMS = ["RC4-40", "RC4-128", "AES-128", "AES-256"]
+
+def params(data: bytes):
+    return triage_pdf(io.BytesIO(data)).params
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_user_and_owner_passwords_open_the_file(make_pdf, algorithm):
+    locked = params(make_pdf(1, password="user-pw", owner_password="owner-pw", algorithm=algorithm))
+    assert check_password(locked, "user-pw")
+    assert check_password(locked, "owner-pw")
+    assert not check_password(locked, "")
+    assert not check_password(locked, "user-pw ")
+    assert not check_password(locked, "other")
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_first_matching_candidate_index(make_pdf, algorithm):
+    locked = params(make_pdf(1, password="user-pw", owner_password="owner-pw", algorithm=algorithm))
+    assert match_password(locked, ["a", "b", "owner-pw", "user-pw"]) == 2
+    assert match_password(locked, ["user-pw", "owner-pw"]) == 0
+    assert match_password(locked, ["a", "b"]) is None
+    assert match_password(locked, []) is None
+
+def test_non_ascii_password(make_pdf):
+    locked = params(make_pdf(1, password="pässwörd", algorithm="AES-256"))
+    assert match_password(locked, ["passwoerd", "pässwörd"]) == 1
+
+def test_match_many_files_in_a_pool(make_pdf):
+    candidates = ["zero", "one", "two", "three"]
+    files = [
+        make_pdf(1, password="two", algorithm="RC4-40"),
+        make_pdf(1, password="nope", owner_password="three", algorithm="RC4-128"),
+        make_pdf(1, password="unknown", algorithm="AES-128"),
+        make_pdf(1, password="zero", owner_password="one", algorithm="AES-256"),
+    ]
+    reported = {}
+    matches = match_passwords(
+        [params(data) for data in files], candidates, max_workers=2,
+        on_result=lambda index, match: reported.__setitem__(index, match),
+    )
+    assert matches == [2, 3, None, 0]
+    assert reported == dict(enumerate(matches))
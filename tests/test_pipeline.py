@@ -0,0 +1,81 @@
+import io
+
+import pytest
+from pypdf import PasswordType, PdfReader, PdfWriter
+
+from pipeline import Pipeline, merge_pdfs
+from unlocker import unlock_to_stream
+
+# (mode, profile, pages): every path an unlocked document is written through
+PATHS = [
+    ("fast", "fast", None),
+    ("fast", "compact", None),
+    ("fast", "fast", "2-3"),
+    ("fast", "compact", "2-3"),
+    ("rebuild", "fast", None),
+]
+PATH_IDS = ["fast", "compact", "pages", "compact-pages", "rebuild"]
+
+def source_pdf(widths=(101, 102, 103), password: str = "secret") -> bytes:
+    writer = PdfWriter()
+    for width in widths:
+        writer.add_blank_page(width, 792)
+    writer.add_metadata({"/Title": "Report", "/Author": "Finance", "/Subject": "Q3"})
+    writer.encrypt(password, algorithm="AES-256")
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def unlock(pipeline: Pipeline, mode: str, profile: str, pages) -> PdfReader:
+    output = io.BytesIO()
+    success, message = unlock_to_stream(
+        io.BytesIO(source_pdf()), "secret", output, mode=mode, profile=profile, pages=pages, pipeline=pipeline
+    )
+    assert success, message
+    return PdfReader(io.BytesIO(output.getvalue()))
+
+def _widths(reader: PdfReader):
+    return [int(page.mediabox.width) for page in reader.pages]
+
+@pytest.mark.parametrize("mode, profile, pages", PATHS, ids=PATH_IDS)
+def test_reencrypted_output_opens_with_new_passwords(mode, profile, pages):
+    pipeline = Pipeline(metadata={"Subject": "Q4"}, password="user-pw", owner_password="owner-pw")
+    for password, matched in (("user-pw", PasswordType.USER_PASSWORD), ("owner-pw", PasswordType.OWNER_PASSWORD)):
+        reader = unlock(pipeline, mode, profile, pages)
+        assert reader.is_encrypted
+        assert reader.decrypt("secret") == PasswordType.NOT_DECRYPTED
+        assert reader.decrypt(password) == matched
+        assert _widths(reader) == ([102, 103] if pages else [101, 102, 103])
+        # Strings are encrypted too, and read back as written
+        assert (reader.metadata["/Title"], reader.metadata["/Subject"]) == ("Report", "Q4")
+
+@pytest.mark.parametrize("mode, profile, pages", PATHS, ids=PATH_IDS)
+def test_metadata_values_are_set_and_empty_values_removed(mode, profile, pages):
+    reader = unlock(Pipeline(metadata={"Title": "Redacted", "/Author": ""}), mode, profile, pages)
+    info = reader.metadata
+    assert info["/Title"] == "Redacted"
+    assert "/Author" not in info
+    assert info["/Subject"] == "Q3"
+
+@pytest.mark.parametrize("mode, profile, pages", PATHS, ids=PATH_IDS)
+def test_clear_metadata_removes_every_entry(mode, profile, pages):
+    assert not unlock(Pipeline(clear_metadata=True), mode, profile, pages).metadata
+    reader = unlock(Pipeline(metadata={"Title": "Kept"}, clear_metadata=True), mode, profile, pages)
+    assert dict(reader.metadata) == {"/Title": "Kept"}
+
+@pytest.mark.parametrize("profile", ["fast", "compact"])
+def test_merge_keeps_page_order_and_runs_the_stages(profile):
+    sources = [
+        ("a.pdf", io.BytesIO(source_pdf((101, 102, 103))), "secret", None),
+        ("b.pdf", io.BytesIO(source_pdf((201, 202, 203))), "secret", "2"),
+        ("c.pdf", io.BytesIO(source_pdf((301,))), "secret", None),
+    ]
+    output = io.BytesIO()
+    pipeline = Pipeline(metadata={"Author": ""}, password="merged")
+    success, message = merge_pdfs(sources, output, pipeline=pipeline, profile=profile)
+    assert success, message
+    reader = PdfReader(io.BytesIO(output.getvalue()))
+    assert reader.decrypt("merged")
+    assert _widths(reader) == [101, 102, 103, 202, 301]
+    assert reader.metadata["/Title"] == "Report"
+    assert "/Author" not in reader.metadata
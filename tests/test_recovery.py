@@ -0,0 +1,66 @@
+import io
+import threading
+import time
+
+import pytest
+
+import recovery
+from recovery import build_keyspace, load_progress, parse_mask, recover_password, search_fingerprint
+from triage import triage_pdf
+
+def _candidates(mask, years=(2020, 2020)):
+    parsed = parse_mask(mask, years)
+    return [parsed.candidate(index) for index in range(parsed.size)]
+
+def test_literal_words_containing_date_letters_stay_literal():
+    candidates = _candidates("SUMMER?d")
+    assert candidates == [f"SUMMER{digit}" for digit in range(10)]
+    assert _candidates("ADDMM") == ["ADDMM"]
+
+def test_date_placeholders():
+    candidates = _candidates("?{DD}?{MM}?{YYYY}")
+    assert len(candidates) == 366
+    assert candidates[0] == "01012020"
+    assert "29022020" in candidates
+    assert _candidates("SUMMER?{YY}") == ["SUMMER20"]
+
+@pytest.mark.parametrize("mask", ["?{MONTH}", "?{DD", "?x"])
+def test_unknown_placeholders(mask):
+    with pytest.raises(ValueError):
+        parse_mask(mask)
+
+def _params(data: bytes):
+    return triage_pdf(io.BytesIO(data)).params
+
+def test_found_password_and_progress_file_removed(make_pdf, tmp_path):
+    state = tmp_path / "state.json"
+    result = recover_password(
+        _params(make_pdf(1, password="4711", algorithm="RC4-40")), build_keyspace(mask="?d?d?d?d"),
+        max_workers=2, state_path=str(state),
+    )
+    assert result.password == "4711"
+    assert not state.exists()
+
+def test_cancel_stops_chunks_already_running(make_pdf, tmp_path, monkeypatch):
+    # Chunks of several seconds' work: before the stop event a cancel only
+    # took effect once the running chunks had finished
+    monkeypatch.setattr(recovery, "CHUNK_SECONDS", 5.0)
+    cancel = threading.Event()
+    cancelled_at = []
+
+    def cancel_soon(progress):
+        if not cancelled_at:
+            cancelled_at.append(None)
+            threading.Timer(0.5, lambda: (cancelled_at.append(time.perf_counter()), cancel.set())).start()
+
+    state = tmp_path / "state.json"
+    keyspace = build_keyspace(mask="?d?d?d?d?d?d?d?d")
+    params = _params(make_pdf(1, password="not a digit", algorithm="RC4-40"))
+    result = recover_password(params, keyspace, max_workers=1, on_progress=cancel_soon, cancel=cancel,
+                              state_path=str(state))
+    assert time.perf_counter() - cancelled_at[-1] < 2.0
+    assert result.password is None and not result.exhausted
+    # The part of the running chunk checked before the cancel counts as done,
+    # and a resumed search continues from there
+    assert load_progress(str(state), search_fingerprint(params, keyspace)) == result.checked
+    assert result.checked > result.resumed_from
@@ -0,0 +1,100 @@
+import threading
+import time
+
+from jobs import DONE, Job, JobManager, JobOptions
+from scheduler import Scheduler
+
+class Waiter:
+    """
+    Calls scheduler.acquire() on a thread
+    """
+
+    def __init__(self, scheduler: Scheduler, ticket: str, cpus: int, memory: int, **kwargs):
+        self.ticket = ticket
+        self.granted = None
+        self.admitted = threading.Event()
+        self.cancel = threading.Event()
+
+        def run():
+            self.granted = scheduler.acquire(ticket, cpus, memory, cancel=self.cancel, **kwargs)
+            self.admitted.set()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+def test_admits_in_order_under_the_cpu_limit():
+    scheduler = Scheduler(cpu_slots=2, memory_bytes=1000)
+    assert scheduler.acquire("a", 2, 10) == 2
+    b = Waiter(scheduler, "b", 1, 10)
+    wait_for(lambda: scheduler.position("b") == 1)
+    c = Waiter(scheduler, "c", 1, 10)
+    wait_for(lambda: scheduler.position("c") == 2)
+    assert not b.admitted.is_set() and not c.admitted.is_set()
+
+    scheduler.release("a")
+    assert b.admitted.wait(5) and c.admitted.wait(5)
+    assert (b.granted, c.granted) == (1, 1)
+    assert scheduler.position("b") is None
+    assert scheduler.stats()["cpu_used"] == 2
+
+def test_small_job_does_not_overtake_the_head_waiting_for_memory():
+    scheduler = Scheduler(cpu_slots=4, memory_bytes=100)
+    assert scheduler.acquire("a", 1, 50) == 1
+    big = Waiter(scheduler, "big", 1, 80)
+    wait_for(lambda: scheduler.position("big") == 1)
+    small = Waiter(scheduler, "small", 1, 10)
+    wait_for(lambda: scheduler.position("small") == 2)
+    # small would fit, but it is behind big
+    assert not small.admitted.wait(0.5)
+
+    scheduler.release("a")
+    assert big.admitted.wait(5) and small.admitted.wait(5)
+    assert scheduler.stats()["memory_used"] == 90
+
+def test_cpus_are_capped_and_an_oversized_job_runs_alone():
+    scheduler = Scheduler(cpu_slots=2, memory_bytes=100)
+    assert scheduler.acquire("huge", 8, 500) == 2
+    waiting = Waiter(scheduler, "next", 1, 1)
+    assert not waiting.admitted.wait(0.3)
+    scheduler.release("huge")
+    assert waiting.admitted.wait(5)
+
+def test_max_jobs_and_cancel_while_queued():
+    scheduler = Scheduler(cpu_slots=4, memory_bytes=100, max_jobs=1)
+    assert scheduler.acquire("a", 1, 1) == 1
+    waiting = Waiter(scheduler, "b", 1, 1)
+    wait_for(lambda: scheduler.position("b") == 1)
+    waiting.cancel.set()
+    assert waiting.admitted.wait(5)
+    assert waiting.granted is None
+    assert scheduler.position("b") is None and scheduler.stats()["queued"] == 0
+
+def _finished_job(finished_at: float, size: int) -> Job:
+    job = Job([], {}, JobOptions({}), status=DONE, finished_at=finished_at)
+    job.unlocked_files = [(f"{finished_at}.pdf", b"x" * size)]
+    return job
+
+def test_make_room_spills_finished_results_oldest_first():
+    scheduler = Scheduler(cpu_slots=2, memory_bytes=100)
+    manager = JobManager(scheduler)
+    jobs = [_finished_job(finished_at, 30) for finished_at in (3.0, 1.0, 2.0)]
+    for job in jobs:
+        manager._jobs[job.id] = job
+    manager._update_retained()
+    assert scheduler.retained == 90
+    try:
+        # 40 more bytes only fit once the oldest job (finished at 1.0) is spilled
+        assert scheduler.acquire("new", 1, 40, make_room=manager._make_room) == 1
+        assert [job.memory_bytes for job in jobs] == [30, 0, 30]
+        assert isinstance(jobs[1].unlocked_files[0][1], str)
+        assert scheduler.retained == 60
+    finally:
+        for job in jobs:
+            job.cleanup()
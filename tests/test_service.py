@@ -0,0 +1,61 @@
+import http.client
+import io
+import json
+import os
+import threading
+import zipfile
+
+import pytest
+
+import service
+from service import UnlockService, make_server
+
+def _die(*args):
+    # Stands in for a worker killed mid-file, e.g. by the OOM killer
+    os._exit(1)
+
+@pytest.fixture
+def server():
+    unlock_service = UnlockService(workers=1, log_requests=False)
+    httpd = make_server("127.0.0.1", 0, unlock_service)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    unlock_service.close()
+
+def _post(httpd, path, body, headers):
+    connection = http.client.HTTPConnection(*httpd.server_address, timeout=30)
+    connection.request("POST", path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response, response.read()
+
+def test_single_file_worker_death_gives_503(server, make_pdf, monkeypatch):
+    monkeypatch.setattr(service, "_unlock_job", _die)
+    response, body = _post(server, "/unlock", make_pdf(1), {"X-PDF-Password": "secret"})
+    assert response.status == 503
+    assert int(response.getheader("Retry-After")) >= 1
+    assert "stopped unexpectedly" in json.loads(body)["error"]
+
+    # The next request gets a fresh pool
+    monkeypatch.undo()
+    response, body = _post(server, "/unlock", make_pdf(2), {"X-PDF-Password": "secret"})
+    assert response.status == 200
+    assert body.startswith(b"%PDF")
+
+def test_batch_worker_death_fails_that_file(server, make_pdf, monkeypatch):
+    monkeypatch.setattr(service, "_unlock_job", _die)
+    boundary = "testboundary"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"password\"\r\n\r\nsecret\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.pdf\"\r\n"
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode() + make_pdf(1) + f"\r\n--{boundary}--\r\n".encode()
+    response, data = _post(
+        server, "/unlock/batch", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    )
+    assert response.status == 200
+    results = json.loads(zipfile.ZipFile(io.BytesIO(data)).read("results.json"))
+    assert results[0]["status"] == "failed"
+    assert "stopped unexpectedly" in results[0]["message"]
@@ -0,0 +1,92 @@
+import io
+
+import pytest
+from pypdf import PdfWriter
+from pypdf.generic import DictionaryObject, NameObject
+
+from triage import (
+    NOT_ENCRYPTED, OWNER_ONLY, PASSWORD_REQUIRED, UNREADABLE, UNSUPPORTED, algorithm_name, triage_pdf,
+)
+
+def _triage(data: bytes):
+    return triage_pdf(io.BytesIO(data))
+
+@pytest.mark.parametrize("algorithm", ["RC4-40", "RC4-128", "AES-128", "AES-256"])
+def test_password_required(make_pdf, algorithm):
+    info = _triage(make_pdf(3, algorithm=algorithm))
+    assert (info.status, info.algorithm, info.page_count) == (PASSWORD_REQUIRED, algorithm, 3)
+
+@pytest.mark.parametrize("algorithm", ["RC4-40", "RC4-128", "AES-128", "AES-256"])
+def test_owner_password_only(make_pdf, algorithm):
+    info = _triage(make_pdf(2, password="", owner_password="owner", algorithm=algorithm))
+    assert (info.status, info.algorithm, info.page_count) == (OWNER_ONLY, algorithm, 2)
+
+def test_not_encrypted():
+    writer = PdfWriter()
+    for _ in range(4):
+        writer.add_blank_page(612, 792)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    info = _triage(buffer.getvalue())
+    assert (info.status, info.algorithm, info.page_count) == (NOT_ENCRYPTED, None, 4)
+
+@pytest.mark.parametrize("keep", [0.5, 0.05, 0])
+def test_truncated(make_pdf, keep):
+    data = make_pdf(3)
+    info = _triage(data[:int(len(data) * keep)])
+    assert info.status == UNREADABLE
+    assert info.page_count is None
+
+def _v4(stm_f="/StdCF", str_f="/StdCF", filters=None):
+    entries = {"/V": 4, "/CF": filters if filters is not None else {"/StdCF": {"/CFM": "/AESV2"}}}
+    if stm_f is not None:
+        entries["/StmF"] = stm_f
+    if str_f is not None:
+        entries["/StrF"] = str_f
+
+    def pdf(value):
+        if isinstance(value, dict):
+            return DictionaryObject({NameObject(k): pdf(v) for k, v in value.items()})
+        if isinstance(value, str):
+            return NameObject(value)
+        return value
+
+    return pdf(entries)
+
+@pytest.mark.parametrize("encrypt, expected", [
+    (_v4(), "AES-128"),
+    (_v4(filters={"/StdCF": {"/CFM": "/V2"}}), "RC4-128"),
+    (_v4(filters={"/StdCF": {"/CFM": "/AESV3"}}), "AES-256"),
+    # Streams left unencrypted: the strings' filter names the cipher
+    (_v4(stm_f="/Identity"), "AES-128"),
+    (_v4(stm_f=None), "AES-128"),
+    # A filter missing from /CF counts as Identity
+    (_v4(stm_f="/Missing"), "AES-128"),
+    (_v4(str_f="/Missing", filters={"/StdCF": {"/CFM": "/V2"}}), "RC4-128"),
+    (_v4(stm_f="/Identity", str_f="/Identity"), "Identity"),
+    # Really unknown methods
+    (_v4(filters={"/StdCF": {"/CFM": "/None"}}), None),
+    (_v4(filters={"/StdCF": {"/CFM": "/Custom"}}), None),
+])
+def test_v4_algorithm_names(encrypt, expected):
+    assert algorithm_name(encrypt) == expected
+
+def test_v4_with_unencrypted_streams_is_not_unsupported(make_pdf):
+    writer = PdfWriter()
+    for _ in range(2):
+        writer.add_blank_page(612, 792)
+    writer.encrypt("secret", algorithm="AES-128")
+    writer._encrypt_entry[NameObject("/StmF")] = NameObject("/Identity")
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    info = _triage(buffer.getvalue())
+    assert (info.status, info.algorithm, info.page_count) == (PASSWORD_REQUIRED, "AES-128", 2)
+
+def test_unknown_handler_is_unsupported(make_pdf):
+    writer = PdfWriter()
+    writer.add_blank_page(612, 792)
+    writer.encrypt("secret", algorithm="AES-128")
+    writer._encrypt_entry["/CF"]["/StdCF"][NameObject("/CFM")] = NameObject("/Custom")
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    assert _triage(buffer.getvalue()).status == UNSUPPORTED
@@ -0,0 +1,79 @@
+import io
+import os
+
+import pytest
+from pypdf import PdfReader
+from pypdf.errors import PdfReadError
+
+import unlocker
+from metrics import FileMetrics
+
+def test_read_error_falls_back_and_is_recorded(monkeypatch, make_pdf):
+    def malformed(reader, output, metrics=None, pipeline=None):
+        output.write(b"half written")
+        raise PdfReadError("Invalid object stream")
+
+    monkeypatch.setattr(unlocker, "write_decrypted", malformed)
+    metrics = FileMetrics()
+    output = io.BytesIO()
+    success, message = unlocker.unlock_to_stream(io.BytesIO(make_pdf(3)), "secret", output, metrics=metrics)
+    assert success, message
+    assert metrics.fallback == "PdfReadError: Invalid object stream"
+    assert metrics.row()["fallback"] == metrics.fallback
+    assert len(PdfReader(io.BytesIO(output.getvalue())).pages) == 3
+
+def test_programming_error_is_not_hidden_by_the_fallback(monkeypatch, make_pdf):
+    def broken(reader, output, metrics=None, pipeline=None):
+        raise AttributeError("'NoneType' object has no attribute 'idnum'")
+
+    monkeypatch.setattr(unlocker, "write_decrypted", broken)
+    metrics = FileMetrics()
+    success, message = unlocker.unlock_to_stream(io.BytesIO(make_pdf(3)), "secret", io.BytesIO(), metrics=metrics)
+    assert not success
+    assert "has no attribute 'idnum'" in message
+    assert metrics.fallback is None
+
+def test_fast_path_records_no_fallback(make_pdf):
+    metrics = FileMetrics()
+    success, message = unlocker.unlock_to_stream(io.BytesIO(make_pdf(3)), "secret", io.BytesIO(), metrics=metrics)
+    assert success, message
+    assert metrics.fallback is None
+
+def test_no_partial_file_left_when_unlocking_raises(tmp_path, make_pdf):
+    src = tmp_path / "locked.pdf"
+    src.write_bytes(make_pdf(2))
+    dst = tmp_path / "out" / "unlocked.pdf"
+    with pytest.raises(ValueError, match="Unknown unlock mode"):
+        unlocker.unlock_pdf_file(str(src), str(dst), "secret", mode="bogus")
+    assert os.listdir(dst.parent) == []
+
+def test_no_partial_file_left_when_interrupted(monkeypatch, tmp_path, make_pdf):
+    def interrupted(reader, output, metrics=None, pipeline=None):
+        output.write(b"half written")
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(unlocker, "write_decrypted", interrupted)
+    src = tmp_path / "locked.pdf"
+    src.write_bytes(make_pdf(2))
+    with pytest.raises(KeyboardInterrupt):
+        unlocker.unlock_pdf_file(str(src), str(tmp_path / "unlocked.pdf"), "secret")
+    assert os.listdir(tmp_path) == ["locked.pdf"]
+
+def test_no_partial_file_left_when_merging_raises(tmp_path, make_pdf):
+    from pipeline import merge_pdf_files
+
+    src = tmp_path / "locked.pdf"
+    src.write_bytes(make_pdf(2))
+    with pytest.raises(ValueError, match="Unknown output profile"):
+        merge_pdf_files([("locked.pdf", str(src), "secret", None)], str(tmp_path / "merged.pdf"), profile="bogus")
+    assert os.listdir(tmp_path) == ["locked.pdf"]
+
+def test_result_discarded_when_keep_says_no(tmp_path, make_pdf):
+    src = tmp_path / "locked.pdf"
+    src.write_bytes(make_pdf(2))
+    dst = tmp_path / "unlocked.pdf"
+    dst.write_bytes(b"another writer's result")
+    success, message = unlocker.unlock_pdf_file(str(src), str(dst), "secret", keep=lambda: False)
+    assert (success, message) == (False, "Result discarded")
+    assert dst.read_bytes() == b"another writer's result"
+    assert sorted(os.listdir(tmp_path)) == ["locked.pdf", "unlocked.pdf"]
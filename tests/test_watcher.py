@@ -0,0 +1,100 @@
+import os
+
+from pypdf import PdfReader
+
+import watcher
+from watcher import DONE, Manifest, Watcher
+
+def _watch(tmp_path, results):
+    manifest = Manifest(str(tmp_path / "manifest.sqlite"))
+    return Watcher(
+        str(tmp_path / "in"), str(tmp_path / "out"), manifest, lambda rel_path: "secret",
+        max_workers=1, settle=0, on_result=lambda *result: results.append(result),
+    )
+
+def _age(path, seconds=10):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - seconds * 10**9))
+
+def test_file_overwritten_in_place_is_unlocked_again(tmp_path, make_pdf):
+    (tmp_path / "in").mkdir()
+    src = tmp_path / "in" / "a.pdf"
+    src.write_bytes(make_pdf(1))
+    results = []
+    w = _watch(tmp_path, results)
+    w.scan()
+    assert len(PdfReader(str(tmp_path / "out" / "a.pdf")).pages) == 1
+
+    # Rewriting the same name leaves the directory's mtime alone
+    dir_mtime = os.stat(tmp_path / "in").st_mtime_ns
+    with open(src, "r+b") as f:
+        f.truncate(0)
+        f.write(make_pdf(10))
+    _age(src)
+    os.utime(tmp_path / "in", ns=(dir_mtime, dir_mtime))
+    w.manifest.close()
+
+    results.clear()
+    w = _watch(tmp_path, results)
+    w.scan()
+    assert results == [("a.pdf", DONE, "Success")]
+    assert len(PdfReader(str(tmp_path / "out" / "a.pdf")).pages) == 10
+
+def test_file_gone_before_it_is_hashed_or_triaged(tmp_path, make_pdf, monkeypatch):
+    (tmp_path / "in").mkdir()
+    src = tmp_path / "in" / "a.pdf"
+    src.write_bytes(make_pdf(1))
+    results = []
+    w = _watch(tmp_path, results)
+
+    def vanish(path):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(watcher, "file_sha256", vanish)
+    w.check_path(str(src))
+    assert results == []
+
+    src.write_bytes(make_pdf(1))
+    monkeypatch.setattr(watcher, "file_sha256", lambda path: "digest")
+    monkeypatch.setattr(watcher, "triage_pdf_path", vanish)
+    w.check_path(str(src))
+    w.process()
+    assert results == []
+
+def test_removed_files_are_forgotten_and_the_rest_kept(tmp_path, make_pdf):
+    (tmp_path / "in" / "sub").mkdir(parents=True)
+    for name in ("a.pdf", "b.pdf", "sub/c.pdf"):
+        (tmp_path / "in" / name).write_bytes(make_pdf(1))
+    results = []
+    w = _watch(tmp_path, results)
+    w.scan()
+    assert w.manifest.counts() == {DONE: 3}
+
+    os.remove(tmp_path / "in" / "a.pdf")
+    results.clear()
+    w.scan()
+    assert results == []
+    assert w.manifest.get("", "a.pdf") is None
+    assert w.manifest.get("", "b.pdf")[3] == DONE
+    assert w.manifest.get("sub", "c.pdf")[3] == DONE
+
+def test_manifest_without_scan_generations_is_upgraded(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "manifest.sqlite")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE files (dir TEXT NOT NULL, name TEXT NOT NULL, size INTEGER NOT NULL, "
+        "mtime_ns INTEGER NOT NULL, sha256 TEXT, status TEXT NOT NULL, message TEXT, updated REAL NOT NULL, "
+        "PRIMARY KEY (dir, name)) WITHOUT ROWID"
+    )
+    db.execute("INSERT INTO files VALUES ('', 'old.pdf', 1, 1, 'digest', 'done', '', 0)")
+    db.commit()
+    db.close()
+
+    manifest = Manifest(path)
+    manifest.mark_seen("", "old.pdf")
+    assert manifest.forget_unseen("") == 0
+    manifest.begin_scan()
+    assert manifest.forget_unseen("") == 1
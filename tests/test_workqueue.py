@@ -0,0 +1,115 @@
+import glob
+import json
+import os
+
+import pytest
+
+import workqueue
+from workqueue import QueueJob, SpoolQueue, run_worker, run_workers
+
+# Fast polling so the worker processes exit soon after the queue drains
+WORKERS = dict(exit_when_empty=True, poll_seconds=0.05)
+
+@pytest.fixture
+def spool(tmp_path, make_pdf, monkeypatch):
+    monkeypatch.setenv("QUEUE_TEST_PASSWORD", "secret")
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+
+    def make_jobs(count: int, password_ref: str = "env:QUEUE_TEST_PASSWORD"):
+        jobs = []
+        for index in range(count):
+            src = inputs / f"doc{index}.pdf"
+            src.write_bytes(make_pdf(1))
+            jobs.append(QueueJob(str(src), str(tmp_path / "out" / f"doc{index}.pdf"), password_ref, src.name))
+        queue.enqueue(jobs)
+        return jobs
+
+    queue = SpoolQueue(str(tmp_path / "queue"))
+    return queue, make_jobs
+
+def _jobs(queue: SpoolQueue, state: str):
+    paths = glob.glob(os.path.join(queue.root, state, "*", "*.json"))
+    return [QueueJob(**json.load(open(path))) for path in paths]
+
+def _expire(queue: SpoolQueue) -> None:
+    for path in glob.glob(os.path.join(queue.root, "claimed", "*.json")):
+        os.utime(path, (0, 0))
+
+def test_every_job_completes_exactly_once_across_workers(spool):
+    queue, make_jobs = spool
+    jobs = make_jobs(24)
+    run_workers(queue.root, 3, **WORKERS)
+
+    stats = queue.stats()
+    assert (stats["pending"], stats["claimed"], stats["done"], stats["failed"]) == (0, 0, 24, 0)
+    assert sorted(job.id for job in _jobs(queue, "done")) == sorted(job.id for job in jobs)
+    assert len(stats["workers"]) == 3
+    assert sum(worker["done"] for worker in stats["workers"]) == 24
+    assert sorted(os.listdir(os.path.dirname(jobs[0].output))) == sorted(f"doc{i}.pdf" for i in range(24))
+
+def test_expired_lease_is_requeued_and_finished_by_another_worker(spool):
+    queue, make_jobs = spool
+    (job,) = make_jobs(1)
+    # A worker claims the job and dies without renewing the lease
+    assert queue.claim("dead").job.id == job.id
+    _expire(queue)
+    run_workers(queue.root, 2, lease_seconds=1.0, **WORKERS)
+
+    (done,) = _jobs(queue, "done")
+    assert done.attempts == 1
+    assert done.error == "lease expired (worker dead)"
+    assert done.result["worker"] != "dead"
+    assert os.path.exists(job.output)
+
+def test_jobs_out_of_attempts_move_to_failed(spool):
+    queue, make_jobs = spool
+    # The password reference cannot be resolved, a retryable error
+    jobs = make_jobs(2, password_ref="env:QUEUE_TEST_MISSING")
+    run_workers(queue.root, 2, max_attempts=3, **WORKERS)
+
+    failed = _jobs(queue, "failed")
+    assert sorted(job.id for job in failed) == sorted(job.id for job in jobs)
+    assert all(job.attempts == 3 for job in failed)
+    assert all("QUEUE_TEST_MISSING" in job.error for job in failed)
+    assert queue.stats()["pending"] == 0
+
+def test_expired_lease_at_max_attempts_moves_to_failed(spool):
+    queue, make_jobs = spool
+    make_jobs(1)
+    for attempt in range(2):
+        queue.claim(f"dead{attempt}")
+        _expire(queue)
+        assert queue.reap(lease_seconds=1.0, max_attempts=2) == 1
+    (failed,) = _jobs(queue, "failed")
+    assert failed.attempts == 2
+    assert failed.error == "lease expired (worker dead1)"
+    assert queue.stats()["pending"] == 0
+
+def test_stale_worker_finishing_late_does_not_publish(spool, monkeypatch):
+    queue, make_jobs = spool
+    (job,) = make_jobs(1)
+    unlock = workqueue.unlock_pdf_file
+
+    def slow_unlock(*args, **kwargs):
+        # While this worker is still busy its lease runs out and other
+        # worker processes take and finish the job
+        monkeypatch.setattr(workqueue, "unlock_pdf_file", unlock)
+        _expire(queue)
+        assert queue.reap(lease_seconds=1.0) == 1
+        run_workers(queue.root, 2, **WORKERS)
+        published["inode"] = os.stat(job.output).st_ino
+        return unlock(*args, **kwargs)
+
+    published = {}
+    monkeypatch.setattr(workqueue, "unlock_pdf_file", slow_unlock)
+    stats = run_worker(queue, worker="stale", exit_when_empty=True, poll_seconds=0.05,
+                       on_result=lambda job, success, message: published.update(message=message))
+
+    assert stats["lost"] == 1 and stats["done"] == 0
+    assert published["message"] == "lease expired, result discarded"
+    (done,) = _jobs(queue, "done")
+    assert done.attempts == 1 and done.result["worker"] != "stale"
+    # The other worker's output was neither replaced nor removed
+    assert os.listdir(os.path.dirname(job.output)) == ["doc0.pdf"]
+    assert os.stat(job.output).st_ino == published["inode"]
@@ -0,0 +1,332 @@
+"""
+Pre-flight encryption check for uploaded PDFs.
+
+Reads only the end of the file (startxref, the xref section and trailer)
+and the objects it points at - the /Encrypt dictionary and, when cheap,
+the page tree root - instead of running a full PdfReader parse. Files that
+cannot be read that way fall back to a lazy PdfReader, which parses the
+xref but still does not touch any pages.
+"""
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject, read_object
+
+# How much of the end of the file to search for "startxref"
+TAIL_SIZE = 4096
+# How much to read when looking at a single object or xref section header
+CHUNK_SIZE = 8192
+
+NOT_ENCRYPTED = "not_encrypted"
+OWNER_ONLY = "owner_only"          # empty user password; only restrictions
+PASSWORD_REQUIRED = "password_required"
+UNSUPPORTED = "unsupported"
+UNREADABLE = "unreadable"
+
+@dataclass
+class EncryptParams:
+    """
+    Raw values of a standard security handler's /Encrypt dictionary
+    """
+    V: int
+    R: int
+    length: int
+    P: int
+    O: bytes
+    U: bytes
+    OE: bytes
+    UE: bytes
+    perms: bytes
+    encrypt_metadata: bool
+    id0: bytes
+
+@dataclass
+class Triage:
+    status: str
+    algorithm: Optional[str] = None
+    page_count: Optional[int] = None
+    message: str = ""
+    params: Optional[EncryptParams] = None
+
+    @property
+    def needs_password(self) -> bool:
+        return self.status == PASSWORD_REQUIRED
+
+    @property
+    def label(self) -> str:
+        if self.status == NOT_ENCRYPTED:
+            return "Not encrypted"
+        if self.status == OWNER_ONLY:
+            return f"{self.algorithm}, no open password (restrictions only)"
+        if self.status == PASSWORD_REQUIRED:
+            return f"{self.algorithm}, password required"
+        return self.message
+
+class _TailReader:
+    """
+    Resolves objects through the xref sections named by startxref, reading
+    only the bytes it needs.
+    """
+
+    # Passed to pypdf's object parsers in place of a PdfReader
+    strict = False
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.xref = {}
+        self.sections = []  # newest first: ("table", {num: offset}) or ("stream", {num: offset})
+        self.trailer = DictionaryObject()
+
+    def _read_at(self, offset: int, size: int = CHUNK_SIZE) -> bytes:
+        self.stream.seek(offset)
+        return self.stream.read(size)
+
+    def load(self) -> None:
+        self.stream.seek(0, 2)
+        file_size = self.stream.tell()
+        tail = self._read_at(max(0, file_size - TAIL_SIZE), TAIL_SIZE)
+        m = re.search(rb"startxref\s+(\d+)", tail[tail.rfind(b"startxref"):])
+        if m is None:
+            raise ValueError("startxref not found")
+
+        offset = int(m.group(1))
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            trailer = self._read_section(offset)
+            # The newest trailer's entries win
+            for key in trailer:
+                if key not in self.trailer:
+                    self.trailer[key] = trailer.raw_get(key)
+            xref_stm = trailer.get("/XRefStm")
+            if xref_stm is not None and int(xref_stm) not in seen:
+                seen.add(int(xref_stm))
+                self._read_section(int(xref_stm))
+            prev = trailer.get("/Prev")
+            offset = int(prev) if prev is not None else None
+
+    def _read_section(self, offset: int) -> DictionaryObject:
+        self.stream.seek(offset)
+        head = self.stream.read(4)
+        if head == b"xref":
+            return self._read_table(offset + 4)
+        return self._read_xref_stream(offset)
+
+    def _read_table(self, pos: int) -> DictionaryObject:
+        # Subsection headers are "first count", followed by 20-byte entries.
+        # Entries are read on demand, so only the headers are touched here.
+        entries = {}
+        while True:
+            chunk = self._read_at(pos, 64)
+            m = re.match(rb"\s*(\d+)\s+(\d+)[ \t]*\r?\n?", chunk)
+            if m is None:
+                break
+            first, count = int(m.group(1)), int(m.group(2))
+            entries[(first, count)] = pos + m.end()
+            pos += m.end() + 20 * count
+        m = re.match(rb"\s*trailer\s*", self._read_at(pos, 64))
+        if m is None:
+            raise ValueError("trailer not found")
+        self.stream.seek(pos + m.end())
+        trailer = DictionaryObject.read_from_stream(self.stream, self)
+        self.sections.append(("table", entries))
+        return trailer
+
+    def _read_xref_stream(self, offset: int) -> DictionaryObject:
+        self.stream.seek(offset)
+        obj = self._read_indirect_object()
+        if not isinstance(obj, StreamObject) or obj.get("/Type") != "/XRef":
+            raise ValueError("xref stream not found")
+        widths = [int(w) for w in obj["/W"]]
+        index = [int(i) for i in obj.get("/Index", [0, obj["/Size"]])]
+        data = obj.get_data()
+        if sum(widths) * sum(index[1::2]) > len(data):
+            raise ValueError("truncated xref stream")
+        offsets = {}
+        pos = 0
+        for first, count in zip(index[0::2], index[1::2]):
+            for num in range(first, first + count):
+                fields = []
+                for w in widths:
+                    fields.append(int.from_bytes(data[pos:pos + w], "big") if w else None)
+                    pos += w
+                kind = 1 if fields[0] is None else fields[0]
+                if kind == 1 and num not in offsets:
+                    offsets[num] = fields[1]
+                elif kind == 2:
+                    offsets.setdefault(num, None)  # inside an object stream
+        self.sections.append(("stream", offsets))
+        return obj
+
+    def _read_indirect_object(self):
+        header = self.stream.read(32)
+        m = re.match(rb"\s*(\d+)\s+(\d+)\s+obj\s*", header)
+        if m is None:
+            raise ValueError("object header not found")
+        self.stream.seek(self.stream.tell() - len(header) + m.end())
+        return read_object(self.stream, self)
+
+    def _offset(self, num: int) -> Optional[int]:
+        for kind, entries in self.sections:
+            if kind == "stream":
+                if num in entries:
+                    return entries[num]
+                continue
+            for (first, count), start in entries.items():
+                if first <= num < first + count:
+                    entry = self._read_at(start + 20 * (num - first), 20)
+                    if entry[17:18] == b"n":
+                        return int(entry[:10])
+                    if entry[17:18] == b"f":
+                        return None
+                    raise ValueError("malformed xref entry")
+        return None
+
+    def resolve(self, value):
+        if not isinstance(value, IndirectObject):
+            return value
+        offset = self._offset(value.idnum)
+        if offset is None:
+            return None
+        self.stream.seek(offset)
+        return self._read_indirect_object()
+
+    def get_object(self, value):
+        # Called by pypdf's parser, e.g. for a stream with an indirect /Length;
+        # it restores the stream position itself
+        return self.resolve(value)
+
+# Crypt filter methods (/CFM) of V4 handlers
+_CRYPT_METHODS = {"/V2": "RC4-128", "/AESV2": "AES-128", "/AESV3": "AES-256"}
+
+def _crypt_filter_method(encrypt: DictionaryObject, key: str) -> Optional[str]:
+    # The /CFM of the crypt filter that key (/StmF or /StrF) names; None if
+    # it is /Identity or not defined in /CF
+    name = encrypt.get(key, "/Identity")
+    filters = encrypt.get("/CF")
+    if name == "/Identity" or not isinstance(filters, DictionaryObject) or name not in filters:
+        return None
+    crypt_filter = filters[name]
+    return crypt_filter.get("/CFM", "/None") if isinstance(crypt_filter, DictionaryObject) else "/None"
+
+def algorithm_name(encrypt: DictionaryObject) -> Optional[str]:
+    """
+    Short name (e.g. "AES-256") for a standard /Encrypt dictionary's cipher.
+    A V4 handler is named after whichever of its stream and string filters
+    actually encrypts; "Identity" if neither does.
+    Returns: the name, or None for a handler that is not understood
+    """
+    V = int(encrypt.get("/V", 0))
+    if V == 5:
+        return "AES-256"
+    if V == 4:
+        methods = [
+            method for method in (_crypt_filter_method(encrypt, "/StmF"), _crypt_filter_method(encrypt, "/StrF"))
+            if method is not None
+        ]
+        if not methods:
+            return "Identity"
+        if any(method not in _CRYPT_METHODS for method in methods):
+            return None
+        return _CRYPT_METHODS[methods[0]]
+    if V in (1, 2):
+        return "RC4-40" if int(encrypt.get("/Length", 40)) <= 40 else "RC4-128"
+    return None
+
+def _bytes(value) -> bytes:
+    if value is None:
+        return b""
+    if hasattr(value, "original_bytes"):
+        return value.original_bytes
+    return bytes(value)
+
+def read_encrypt_params(encrypt: DictionaryObject, trailer_id) -> EncryptParams:
+    id0 = b""
+    if isinstance(trailer_id, ArrayObject) and len(trailer_id) > 0:
+        id0 = _bytes(trailer_id[0])
+    encrypt_metadata = encrypt.get("/EncryptMetadata")
+    return EncryptParams(
+        V=int(encrypt.get("/V", 0)),
+        R=int(encrypt["/R"]),
+        length=int(encrypt.get("/Length", 40)),
+        P=int(encrypt["/P"]),
+        O=_bytes(encrypt["/O"]),
+        U=_bytes(encrypt["/U"]),
+        OE=_bytes(encrypt.get("/OE")),
+        UE=_bytes(encrypt.get("/UE")),
+        perms=_bytes(encrypt.get("/Perms")),
+        encrypt_metadata=True if encrypt_metadata is None else bool(encrypt_metadata),
+        id0=id0,
+    )
+
+def empty_password_opens(params: EncryptParams) -> bool:
+    """
+    True if the file opens with an empty user password (key derivation only)
+    """
+    from pypdf._encryption import AlgV4, AlgV5
+
+    if params.V == 5:
+        return bool(AlgV5.verify_user_password(params.R, b"", params.U, params.UE))
+    return bool(AlgV4.verify_user_password(
+        b"", params.R, params.length, params.O, params.U,
+        params.P & 0xFFFFFFFF, params.id0, params.encrypt_metadata,
+    ))
+
+def _classify(encrypt, trailer_id, page_count: Optional[int]) -> Triage:
+    if encrypt is None:
+        return Triage(NOT_ENCRYPTED, page_count=page_count, message="PDF is not password protected")
+    if encrypt.get("/Filter") != "/Standard" or "/SubFilter" in encrypt:
+        return Triage(UNSUPPORTED, page_count=page_count,
+                      message=f"Unsupported security handler {encrypt.get('/Filter')}")
+    algorithm = algorithm_name(encrypt)
+    if algorithm is None:
+        return Triage(UNSUPPORTED, page_count=page_count,
+                      message=f"Unsupported encryption (V={encrypt.get('/V')})")
+    params = read_encrypt_params(encrypt, trailer_id)
+    status = OWNER_ONLY if empty_password_opens(params) else PASSWORD_REQUIRED
+    return Triage(status, algorithm, page_count, params=params)
+
+def _scan_tail(stream) -> Triage:
+    tail = _TailReader(stream)
+    tail.load()
+    encrypt = tail.resolve(tail.trailer.raw_get("/Encrypt") if "/Encrypt" in tail.trailer else None)
+
+    # /Count is a plain number, so it is readable even in encrypted files -
+    # unless the page tree sits inside an (encrypted) object stream
+    page_count = None
+    try:
+        root = tail.resolve(tail.trailer.raw_get("/Root"))
+        if isinstance(root, DictionaryObject):
+            pages = tail.resolve(root.raw_get("/Pages"))
+            if isinstance(pages, DictionaryObject):
+                page_count = int(tail.resolve(pages.raw_get("/Count")))
+    except Exception:
+        pass
+
+    return _classify(encrypt, tail.trailer.get("/ID"), page_count)
+
+def _scan_with_reader(stream) -> Triage:
+    from pypdf import PdfReader
+
+    stream.seek(0)
+    reader = PdfReader(stream, strict=False)
+    if not reader.is_encrypted:
+        return _classify(None, None, len(reader.pages))
+    encrypt = reader.trailer["/Encrypt"].get_object()
+    return _classify(encrypt, reader.trailer.get("/ID"), None)
+
+def triage_pdf(stream) -> Triage:
+    """
+    Classify a PDF's encryption from a seekable binary stream.
+    The stream is left positioned at the start.
+    """
+    try:
+        try:
+            return _scan_tail(stream)
+        except Exception:
+            return _scan_with_reader(stream)
+    except Exception as e:
+        return Triage(UNREADABLE, message=f"Could not read PDF: {str(e)}")
+    finally:
+        stream.seek(0)
@@ -0,0 +1,637 @@
+import io
+import os
+import uuid
+import zipfile
+from time import perf_counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from threading import Event
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+from metrics import FileMetrics
+
+# pypdf takes a noticeable part of a second to import; it is imported where
+# it is used so that importing this module (e.g. for the app's first render)
+# doesn't wait for it
+if TYPE_CHECKING:
+    from pypdf import PdfReader
+
+    from pipeline import Pipeline
+
+# (unlocked_pdf_bytes, success, message) - the shape returned by unlock_pdf
+UnlockResult = Tuple[bytes, bool, str]
+
+# Unlock modes: "fast" rewrites the decrypted objects directly, keeping the
+# original object numbers and document catalog (outlines, forms, metadata);
+# "rebuild" copies pages into a fresh PdfWriter. Fast falls back to rebuild
+# if it cannot handle a file.
+UNLOCK_MODES = ("fast", "rebuild")
+
+# Output profiles: "fast" writes streams as decrypted; "compact" merges
+# duplicate objects, packs object streams and recompresses streams (see
+# optimize.py)
+OUTPUT_PROFILES = ("fast", "compact")
+
+# zlib level used by "compact" unless another is given (1 = fastest, 9 = smallest)
+DEFAULT_LEVEL = 6
+
+# Object types that only describe the file layout; decrypted_objects() skips
+# them and the writers lay the file out afresh, with their contents as
+# plain objects.
+_LAYOUT_TYPES = ("/ObjStm", "/XRef")
+
+# How often process pool loops check for cancellation while files are running
+CANCEL_POLL_SECONDS = 0.2
+
+# Trailer entries that belong to the encrypted file's layout, not the document
+_DROPPED_TRAILER_KEYS = (
+    "/Encrypt", "/Prev", "/XRefStm", "/Size", "/Type", "/W", "/Index",
+    "/Filter", "/DecodeParms", "/Length",
+)
+
+def object_generations(reader: "PdfReader") -> Dict[int, int]:
+    """
+    Returns: the generation of every object number in a reader's
+    cross-reference sections, including objects stored in object streams
+    """
+    # Highest generation wins if an object number appears more than once
+    generations = {}
+    for generation in sorted(reader.xref):
+        for idnum in reader.xref[generation]:
+            generations[idnum] = generation
+    for idnum in reader.xref_objStm:
+        generations.setdefault(idnum, 0)
+    return generations
+
+def decrypted_objects(
+    reader: "PdfReader", generations: Optional[Dict[int, int]] = None
+) -> Iterator[Tuple[int, int, object]]:
+    """
+    Load, and so decrypt, the objects of a decrypted reader one at a time,
+    lowest number first. The /Encrypt dictionary, null objects and the
+    object and cross-reference streams of the file layout are skipped.
+    generations is object_generations(reader), if already known.
+    Yields: (object number, generation, object)
+    """
+    from pypdf.generic import IndirectObject, NullObject, StreamObject
+
+    encrypt_ref = reader.trailer.raw_get("/Encrypt")
+    encrypt_id = encrypt_ref.idnum if isinstance(encrypt_ref, IndirectObject) else None
+    if generations is None:
+        generations = object_generations(reader)
+    for idnum in sorted(generations):
+        if idnum == encrypt_id or idnum == 0:
+            continue
+        generation = generations[idnum]
+        obj = reader.get_object(IndirectObject(idnum, generation, reader))
+        if obj is None or isinstance(obj, NullObject):
+            continue
+        if isinstance(obj, StreamObject) and obj.get("/Type") in _LAYOUT_TYPES:
+            continue
+        yield idnum, generation, obj
+
+class ObjectWriter:
+    """
+    Writes numbered objects as the body of a PDF; every output profile
+    writes through one (write_decrypted() here, pages.write_objects() and
+    optimize.write_compact()).
+
+    The header line is written straight away. trailer holds the trailer
+    entries to write and next_id the first object number the caller leaves
+    free; pipeline's stages, if given, start on both and every object
+    written goes through them. finish() ends the file with a classic
+    cross-reference table. Writers of cross-reference streams finish it
+    themselves from offsets and trailer.
+    """
+
+    def __init__(self, stream, header: str, trailer: dict, next_id: int, pipeline: Optional["Pipeline"] = None):
+        self.stream = stream
+        self.trailer = dict(trailer)
+        # Objects the stages add (such as /Encrypt), by number; see write_added()
+        self.added: Dict[int, object] = {}
+        # Object number -> (offset, generation) of every object written
+        self.offsets: Dict[int, Tuple[int, int]] = {}
+        self._document = None
+        if pipeline is not None:
+            self._document = pipeline.begin(trailer, next_id)
+            self.added = self._document.objects
+            self.trailer = self._document.trailer
+        stream.write(header.encode("latin-1", "replace") + b"\n%\xe2\xe3\xcf\xd3\n")
+
+    def transform(self, idnum: int, generation: int, obj, packed: bool = False):
+        """
+        Run one object through the stages without writing it; see
+        pipeline.DocumentTransform.transform
+        """
+        if self._document is None:
+            return obj
+        return self._document.transform(idnum, generation, obj, packed)
+
+    def write(self, idnum: int, generation: int, obj) -> None:
+        obj = self.transform(idnum, generation, obj)
+        self.offsets[idnum] = (self.stream.tell(), generation)
+        self.stream.write(f"{idnum} {generation} obj\n".encode())
+        obj.write_to_stream(self.stream)
+        self.stream.write(b"\nendobj\n")
+
+    def write_added(self) -> None:
+        for idnum in sorted(self.added):
+            self.write(idnum, 0, self.added[idnum])
+
+    def finish(self) -> None:
+        """
+        Write the cross-reference table and trailer
+        """
+        from pypdf.generic import DictionaryObject, NameObject, NumberObject
+
+        stream = self.stream
+        size = max(self.offsets, default=0) + 1
+        xref_offset = stream.tell()
+        stream.write(f"xref\n0 {size}\n".encode())
+        stream.write(b"0000000000 65535 f \n")
+        for idnum in range(1, size):
+            if idnum in self.offsets:
+                offset, generation = self.offsets[idnum]
+                stream.write(f"{offset:010d} {generation:05d} n \n".encode())
+            else:
+                stream.write(b"0000000000 00000 f \n")
+
+        trailer_dict = DictionaryObject({NameObject(key): value for key, value in self.trailer.items()})
+        trailer_dict[NameObject("/Size")] = NumberObject(size)
+        stream.write(b"trailer\n")
+        trailer_dict.write_to_stream(stream)
+        stream.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+def write_decrypted(
+    reader: "PdfReader", stream, metrics: Optional[FileMetrics] = None, pipeline: Optional["Pipeline"] = None
+) -> None:
+    """
+    Write every object of a decrypted reader to stream in one pass.
+    Objects keep their original numbers; objects stored in object streams
+    are written out as plain objects, and the /Encrypt dictionary is dropped.
+    Each object runs through pipeline's stages, if given, as it is written.
+    Loading (and decrypting) objects and writing them are timed separately
+    into metrics as the "decrypt" and "serialize" stages.
+    """
+    generations = object_generations(reader)
+    trailer = {
+        key: reader.trailer.raw_get(key) for key in reader.trailer if key not in _DROPPED_TRAILER_KEYS
+    }
+    writer = ObjectWriter(stream, reader.pdf_header, trailer, max(generations, default=0) + 1, pipeline)
+    decrypt_seconds = serialize_seconds = 0.0
+    # Time spent in the generator between two writes is loading
+    loaded = perf_counter()
+    for idnum, generation, obj in decrypted_objects(reader, generations):
+        started = perf_counter()
+        decrypt_seconds += started - loaded
+        writer.write(idnum, generation, obj)
+        # Written objects are not needed again; dropping them from the
+        # reader's cache keeps memory flat on very large documents
+        reader.resolved_objects.pop((generation, idnum), None)
+        loaded = perf_counter()
+        serialize_seconds += loaded - started
+    decrypt_seconds += perf_counter() - loaded
+    started = perf_counter()
+    writer.write_added()
+    writer.finish()
+    if metrics is not None:
+        metrics.add("decrypt", decrypt_seconds)
+        metrics.add("serialize", serialize_seconds + perf_counter() - started)
+
+def _rebuild_decrypted(
+    reader: "PdfReader", stream, metrics: FileMetrics, indices: Optional[List[int]] = None,
+    pipeline: Optional["Pipeline"] = None,
+) -> None:
+    from pypdf import PdfWriter
+
+    with metrics.stage("decrypt"):
+        # Create a new PDF writer
+        writer = PdfWriter()
+
+        # Copy all (or the selected) pages to the writer
+        pages = reader.pages if indices is None else [reader.pages[index] for index in indices]
+        for page in pages:
+            writer.add_page(page)
+        if pipeline is not None:
+            pipeline.configure(writer, reader.metadata)
+
+    # pypdf loads most objects lazily while writing, so decryption time is
+    # partly counted here
+    with metrics.stage("serialize"):
+        writer.write(stream)
+
+def _input_size(pdf_file) -> int:
+    if isinstance(pdf_file, (str, os.PathLike)):
+        return os.path.getsize(pdf_file)
+    position = pdf_file.tell()
+    pdf_file.seek(0, os.SEEK_END)
+    size = pdf_file.tell()
+    pdf_file.seek(position)
+    return size
+
+def _page_count(reader: "PdfReader") -> Optional[int]:
+    # The page tree's /Count, without loading the pages themselves
+    try:
+        return int(reader.trailer["/Root"]["/Pages"]["/Count"])
+    except Exception:
+        return None
+
+def unlock_to_stream(
+    pdf_file,
+    password: str,
+    output,
+    mode: str = "fast",
+    metrics: Optional[FileMetrics] = None,
+    profile: str = "fast",
+    level: int = DEFAULT_LEVEL,
+    workers: int = 1,
+    pages: Optional[str] = None,
+    pipeline: Optional["Pipeline"] = None,
+) -> Tuple[bool, str]:
+    """
+    Unlock pdf_file (a path or seekable binary stream) and write the
+    decrypted PDF to the writable, seekable stream output.
+    profile is one of OUTPUT_PROFILES; "compact" recompresses
+    streams at zlib level using up to workers processes.
+    pages, if given, is a page selection such as "1-10, 15" (see
+    pages.parse_page_ranges); only those pages, and the objects they use,
+    are decrypted and written.
+    pipeline, if given, holds further stages (metadata rewrite,
+    re-encryption; see pipeline.py) applied in the same pass.
+    Stage timings, sizes, page count and algorithm go into metrics if given,
+    as does the reason when a malformed file needs the slower page-by-page
+    copy.
+    Returns: (success, error_message)
+    """
+    if mode not in UNLOCK_MODES:
+        raise ValueError(f"Unknown unlock mode: {mode}")
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile: {profile}")
+    from pypdf import PdfReader
+    from pypdf.errors import PyPdfError
+
+    from optimize import compact_decrypted
+    from pages import parse_page_ranges, write_pages
+    from triage import algorithm_name
+
+    if metrics is None:
+        metrics = FileMetrics()
+    try:
+        metrics.input_bytes = _input_size(pdf_file)
+
+        # Read the PDF
+        with metrics.stage("parse"):
+            reader = PdfReader(pdf_file)
+
+        # Check if PDF is encrypted
+        if not reader.is_encrypted:
+            return False, "PDF is not password protected"
+
+        metrics.algorithm = algorithm_name(reader.trailer["/Encrypt"].get_object())
+
+        # Try to decrypt with the provided password
+        with metrics.stage("key"):
+            if not reader.decrypt(password):
+                return False, "Incorrect password"
+        metrics.pages = _page_count(reader)
+        indices = None
+        if pages is not None:
+            try:
+                indices = parse_page_ranges(pages, metrics.pages or len(reader.pages))
+            except ValueError as e:
+                return False, f"Invalid page selection: {str(e)}"
+            if indices is not None:
+                metrics.pages = len(indices)
+
+        start = output.tell()
+        if profile == "compact" or mode == "fast":
+            try:
+                if indices is not None:
+                    write_pages(
+                        reader, output, indices, profile=profile, level=level, workers=workers, metrics=metrics,
+                        pipeline=pipeline
+                    )
+                elif profile == "compact":
+                    compact_decrypted(reader, output, level=level, workers=workers, metrics=metrics, pipeline=pipeline)
+                else:
+                    write_decrypted(reader, output, metrics, pipeline)
+            except PyPdfError as e:
+                # Malformed files: fall back to copying page by page with a
+                # fresh reader, since the failed pass may have left the
+                # first one half-populated. Anything other than a pypdf
+                # read error is a bug and is reported as a failure.
+                metrics.fallback = f"{type(e).__name__}: {str(e)}"
+                output.seek(start)
+                output.truncate()
+                if hasattr(pdf_file, "seek"):
+                    pdf_file.seek(0)
+                reader = PdfReader(pdf_file)
+                reader.decrypt(password)
+                _rebuild_decrypted(reader, output, metrics, indices, pipeline)
+        else:
+            _rebuild_decrypted(reader, output, metrics, indices, pipeline)
+
+        metrics.output_bytes = output.tell() - start
+        metrics.success = True
+        return True, "Success"
+
+    except Exception as e:
+        return False, f"Error processing PDF: {str(e)}"
+
+def unlock_pdf(
+    pdf_file,
+    password: str,
+    mode: str = "fast",
+    metrics: Optional[FileMetrics] = None,
+    profile: str = "fast",
+    level: int = DEFAULT_LEVEL,
+    workers: int = 1,
+    pages: Optional[str] = None,
+    pipeline: Optional["Pipeline"] = None,
+) -> UnlockResult:
+    """
+    Unlock a PDF file with the given password
+    mode is one of UNLOCK_MODES and profile one of OUTPUT_PROFILES;
+    pages optionally selects pages and pipeline adds stages as in unlock_to_stream;
+    metrics, if given, collects stage timings
+    Returns: (unlocked_pdf_bytes, success, error_message)
+    """
+    # Write to bytes buffer
+    output_buffer = io.BytesIO()
+    success, message = unlock_to_stream(
+        pdf_file, password, output_buffer, mode=mode, metrics=metrics, profile=profile, level=level, workers=workers,
+        pages=pages, pipeline=pipeline
+    )
+    if not success:
+        return None, False, message
+    return output_buffer.getvalue(), True, message
+
+def create_zip_file(unlocked_files: List[Tuple[str, bytes]]) -> bytes:
+    """
+    Create a ZIP file containing multiple unlocked PDFs
+    """
+    zip_buffer = io.BytesIO()
+
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for filename, pdf_bytes in unlocked_files:
+            zip_file.writestr(filename, pdf_bytes)
+
+    zip_buffer.seek(0)
+    return zip_buffer.getvalue()
+
+def unlocked_filename(filename: str) -> str:
+    """
+    Name used for the unlocked copy of an uploaded file
+    """
+    name_without_ext = os.path.splitext(os.path.basename(filename))[0]
+    return f"unlocked_{name_without_ext}.pdf"
+
+def part_filename(filename: str, indices: List[int]) -> str:
+    """
+    Name used for the part of a split copy of filename that holds the given
+    0-based pages, e.g. report_p0001-0010.pdf
+    """
+    name_without_ext = os.path.splitext(os.path.basename(filename))[0]
+    return f"{name_without_ext}_p{indices[0] + 1:04d}-{indices[-1] + 1:04d}.pdf"
+
+def split_parts(src_path: str, password: str, every: int, pages: Optional[str] = None) -> List[List[int]]:
+    """
+    Cut the PDF at src_path (or the pages selected by pages) into parts of
+    at most every pages. Only the trailer and page tree root are read.
+    Returns: the 0-based page indices of each part
+    Raises: ValueError for a wrong password or an invalid page selection
+    """
+    from pypdf import PdfReader
+
+    from pages import parse_page_ranges, split_pages
+
+    with open(src_path, "rb") as f:
+        reader = PdfReader(f)
+        if reader.is_encrypted and not reader.decrypt(password):
+            raise ValueError("Incorrect password")
+        page_count = _page_count(reader) or len(reader.pages)
+    try:
+        indices = parse_page_ranges(pages or "", page_count)
+    except ValueError as e:
+        raise ValueError(f"Invalid page selection: {str(e)}") from None
+    if indices is None:
+        indices = list(range(page_count))
+    return split_pages(indices, every)
+
+def unlock_pdf_file(
+    src_path: str,
+    dst_path: str,
+    password: str,
+    mode: str = "fast",
+    metrics: Optional[FileMetrics] = None,
+    profile: str = "fast",
+    level: int = DEFAULT_LEVEL,
+    workers: int = 1,
+    pages: Optional[str] = None,
+    pipeline: Optional["Pipeline"] = None,
+    keep: Optional[Callable[[], bool]] = None,
+) -> Tuple[bool, str]:
+    """
+    Unlock the PDF at src_path (or the pages selected by pages) and write
+    the result, after pipeline's stages if given, to dst_path.
+    The input is read lazily through a file handle and the output is
+    written straight to disk, so neither document is ever held as a whole
+    in memory. Nothing is written when unlocking fails.
+    keep, if given, is called once the result is complete; if it returns
+    False the result is thrown away instead of replacing dst_path (e.g. a
+    queue worker that lost its lease to another worker).
+    Returns: (success, message)
+    """
+    os.makedirs(os.path.dirname(dst_path) or ".", exist_ok=True)
+    # Write next to the target and rename so readers never see a partial
+    # file. The name is unique so that two writers of the same target never
+    # share, or remove, each other's partial file.
+    tmp_path = f"{dst_path}.{uuid.uuid4().hex[:8]}.part"
+    # A plain file handle rather than mmap: mapped pages count towards RSS
+    # for the whole file, while pypdf only needs one object at a time
+    with open(src_path, "rb") as src, open(tmp_path, "xb") as dst:
+        try:
+            success, message = unlock_to_stream(
+                src, password, dst, mode=mode, metrics=metrics, profile=profile, level=level, workers=workers,
+                pages=pages, pipeline=pipeline
+            )
+        except BaseException:
+            # A bad mode or profile, an error raised by a pipeline stage, or
+            # an interrupt: don't leave the partial file next to the target
+            dst.close()
+            os.remove(tmp_path)
+            raise
+    if success and keep is not None and not keep():
+        success, message = False, "Result discarded"
+    if success:
+        os.replace(tmp_path, dst_path)
+    else:
+        os.remove(tmp_path)
+    return success, message
+
+def default_workers() -> int:
+    """
+    Number of worker processes to use when none is configured
+    """
+    return os.cpu_count() or 1
+
+def _recompress_workers(max_workers: int, files: int) -> int:
+    # Workers left over once every file has one, e.g. all of them for a
+    # single large file, go to recompressing that file's streams
+    return max(1, max_workers // max(1, files))
+
+def _unlock_job(
+    index: int, pdf_bytes: bytes, password: str, mode: str, profile: str, level: int, workers: int,
+    pages: Optional[str], pipeline: Optional["Pipeline"],
+) -> Tuple[int, UnlockResult, FileMetrics]:
+    # Runs inside a worker process; only plain bytes cross the process boundary
+    metrics = FileMetrics()
+    result = unlock_pdf(
+        io.BytesIO(pdf_bytes), password, mode=mode, metrics=metrics, profile=profile, level=level, workers=workers,
+        pages=pages, pipeline=pipeline
+    )
+    return index, result, metrics
+
+def unlock_batch(
+    jobs: List[Tuple[bytes, str]],
+    max_workers: Optional[int] = None,
+    on_result: Optional[Callable[[int, UnlockResult], None]] = None,
+    mode: str = "fast",
+    on_metrics: Optional[Callable[[int, FileMetrics], None]] = None,
+    cancel: Optional[Event] = None,
+    profile: str = "fast",
+    level: int = DEFAULT_LEVEL,
+    pages: Optional[List[Optional[str]]] = None,
+    pipeline: Optional["Pipeline"] = None,
+) -> List[UnlockResult]:
+    """
+    Unlock many PDFs in parallel using a process pool.
+    jobs is a list of (pdf_bytes, password) pairs. on_result(index, result)
+    is called in the parent process as each file finishes, in completion order,
+    just after on_metrics(index, metrics) with the worker's stage timings.
+    Once cancel is set, files not yet started are dropped and files already
+    being unlocked are allowed to finish.
+    profile and level select the output profile as in unlock_pdf, and
+    pages, if given, holds a page selection (or None for every page) per job.
+    pipeline's stages, if given, run on every file inside its worker.
+    Returns: results in the same order as jobs (None for dropped jobs)
+    """
+    results: List[Optional[UnlockResult]] = [None] * len(jobs)
+    if not jobs:
+        return results
+    if pages is None:
+        pages = [None] * len(jobs)
+
+    workers = max(1, min(max_workers or default_workers(), len(jobs)))
+    recompress_workers = _recompress_workers(max_workers or default_workers(), len(jobs))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                _unlock_job, index, pdf_bytes, password, mode, profile, level, recompress_workers, pages[index],
+                pipeline
+            )
+            for index, (pdf_bytes, password) in enumerate(jobs)
+        ]
+        not_done = set(futures)
+        while not_done:
+            finished, not_done = wait(not_done, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in finished:
+                try:
+                    index, result, metrics = future.result()
+                except Exception as e:
+                    # The worker itself died (e.g. killed by the OS); unlock_pdf
+                    # already turns ordinary PDF errors into a failed result.
+                    index = futures.index(future)
+                    result = (None, False, f"Error processing PDF: {str(e)}")
+                    metrics = FileMetrics()
+                results[index] = result
+                if on_metrics is not None:
+                    on_metrics(index, metrics)
+                if on_result is not None:
+                    on_result(index, result)
+            if cancel is not None and cancel.is_set():
+                # cancel() fails for, and so keeps, futures already running
+                not_done = {future for future in not_done if not future.cancel()}
+
+    return results
+
+def _unlock_file_job(
+    index: int, src_path: str, dst_path: str, password: str, mode: str, profile: str, level: int, workers: int,
+    pages: Optional[str], pipeline: Optional["Pipeline"],
+) -> Tuple[int, Tuple[bool, str], FileMetrics]:
+    metrics = FileMetrics()
+    try:
+        result = unlock_pdf_file(
+            src_path, dst_path, password, mode=mode, metrics=metrics, profile=profile, level=level, workers=workers,
+            pages=pages, pipeline=pipeline
+        )
+        return index, result, metrics
+    except OSError as e:
+        return index, (False, f"Error processing PDF: {str(e)}"), metrics
+
+def unlock_files(
+    jobs: List[Tuple[str, str, str]],
+    max_workers: Optional[int] = None,
+    on_result: Optional[Callable[[int, Tuple[bool, str]], None]] = None,
+    mode: str = "fast",
+    on_metrics: Optional[Callable[[int, FileMetrics], None]] = None,
+    cancel: Optional[Event] = None,
+    profile: str = "fast",
+    level: int = DEFAULT_LEVEL,
+    pages: Optional[List[Optional[str]]] = None,
+    pipeline: Optional["Pipeline"] = None,
+) -> List[Tuple[bool, str]]:
+    """
+    Unlock many PDFs on disk in parallel.
+    jobs is a list of (src_path, dst_path, password). Workers read and write
+    the files themselves, so only paths, status messages and metrics cross
+    process boundaries and at most a few files per worker are in flight at once.
+    on_metrics, on_result, cancel, profile, level, pages and pipeline work
+    as in unlock_batch; several jobs may read the same src_path, e.g. the parts
+    of a split document.
+    Returns: (success, message) per job, in the same order as jobs
+    """
+    results: List[Optional[Tuple[bool, str]]] = [None] * len(jobs)
+    if not jobs:
+        return results
+    if pages is None:
+        pages = [None] * len(jobs)
+
+    workers = max(1, min(max_workers or default_workers(), len(jobs)))
+    recompress_workers = _recompress_workers(max_workers or default_workers(), len(jobs))
+    pending = iter(enumerate(jobs))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+
+        def submit_next() -> None:
+            if cancel is not None and cancel.is_set():
+                return
+            for index, (src_path, dst_path, password) in pending:
+                in_flight[pool.submit(
+                    _unlock_file_job, index, src_path, dst_path, password, mode, profile, level, recompress_workers,
+                    pages[index], pipeline
+                )] = index
+                return
+
+        for _ in range(workers * 2):
+            submit_next()
+        while in_flight:
+            done, _ = wait(in_flight, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                for future in list(in_flight):
+                    if future not in done and future.cancel():
+                        del in_flight[future]
+            for future in done:
+                index = in_flight.pop(future)
+                try:
+                    _, result, metrics = future.result()
+                except Exception as e:
+                    result = (False, f"Error processing PDF: {str(e)}")
+                    metrics = FileMetrics()
+                results[index] = result
+                if on_metrics is not None:
+                    on_metrics(index, metrics)
+                if on_result is not None:
+                    on_result(index, result)
+                submit_next()
+
+    return results
@@ -0,0 +1,453 @@
+"""
+Watched-folder daemon.
+
+Unlocks PDFs as they are dropped into a directory tree, writing each one
+atomically to the same relative path under an output directory. A SQLite
+manifest records every file seen (size, mtime, content hash, status), so
+a restarted watcher only looks at files that are new or changed:
+
+* rows are looked up one file at a time as a directory is listed, and
+  files that went away are found by stamping the rows of the files listed
+  with the scan's generation and deleting the rest in SQL, so memory stays
+  flat even for a single directory of a million files (a few hundred MB on
+  disk, not in RAM);
+* a directory whose mtime has not changed since the last scan has no
+  added or removed files, since adding, removing or renaming files changes
+  it, so the manifest's rows for it are not checked for files that went
+  away; its files are still compared with their rows, because a file
+  overwritten in place does not change its directory's mtime;
+* a file is only hashed when its size or mtime changed, and is only
+  unlocked again if its content did.
+
+Files deleted or renamed while they are being looked at are dropped; they
+are picked up again under their new name, or if they come back.
+
+New files are noticed with inotify on Linux (through libc, no extra
+dependency). Elsewhere, or when the inotify watch limit is reached, the
+tree is polled instead.
+"""
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import select
+import sqlite3
+import struct
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from triage import NOT_ENCRYPTED, OWNER_ONLY, UNREADABLE, UNSUPPORTED, triage_pdf
+from unlocker import unlock_files
+
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+# Rows written between commits during a scan
+COMMIT_EVERY = 1000
+# Files handed to the worker pool at once
+BATCH_SIZE = 256
+
+class Manifest:
+    """
+    Persistent index of the files a watcher has seen, in SQLite
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                dir TEXT NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT,
+                status TEXT NOT NULL,
+                message TEXT,
+                updated REAL NOT NULL,
+                scan INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (dir, name)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS files_status ON files (status);
+        """)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(files)")]
+        if "scan" not in columns:
+            # Manifests written before scan generations existed
+            self.db.execute("ALTER TABLE files ADD COLUMN scan INTEGER NOT NULL DEFAULT 0")
+        self._pending = 0
+        self.begin_scan()
+
+    def begin_scan(self) -> int:
+        """
+        Start a new scan generation; rows recorded or marked seen from now
+        on carry it. Returns: the generation
+        """
+        # Only ever compared for equality, so clock steps do no harm
+        self.generation = time.time_ns()
+        return self.generation
+
+    def get(self, directory: str, name: str) -> Optional[tuple]:
+        return self.db.execute(
+            "SELECT size, mtime_ns, sha256, status FROM files WHERE dir = ? AND name = ?", (directory, name)
+        ).fetchone()
+
+    def record(self, directory: str, name: str, size: int, mtime_ns: int,
+               sha256: Optional[str], status: str, message: str = "") -> None:
+        self.db.execute(
+            "INSERT OR REPLACE INTO files (dir, name, size, mtime_ns, sha256, status, message, updated, scan) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (directory, name, size, mtime_ns, sha256, status, message, time.time(), self.generation),
+        )
+        self._maybe_commit()
+
+    def mark_seen(self, directory: str, name: str) -> None:
+        """
+        Stamp a file's row, if it has one, with the current generation
+        """
+        self.db.execute(
+            "UPDATE files SET scan = ? WHERE dir = ? AND name = ?", (self.generation, directory, name)
+        )
+        self._maybe_commit()
+
+    def forget_unseen(self, directory: str) -> int:
+        """
+        Delete the rows of one directory not stamped with the current
+        generation, i.e. files that were not listed in this scan.
+        Returns: how many were deleted
+        """
+        deleted = self.db.execute(
+            "DELETE FROM files WHERE dir = ? AND scan != ?", (directory, self.generation)
+        ).rowcount
+        self._maybe_commit()
+        return deleted
+
+    def dir_mtime(self, directory: str) -> Optional[int]:
+        row = self.db.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (directory,)).fetchone()
+        return row[0] if row else None
+
+    def set_dir_mtime(self, directory: str, mtime_ns: int) -> None:
+        self.db.execute("INSERT OR REPLACE INTO dirs (path, mtime_ns) VALUES (?, ?)", (directory, mtime_ns))
+        self._maybe_commit()
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM files GROUP BY status"))
+
+    def _maybe_commit(self) -> None:
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self) -> None:
+        self.db.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.db.close()
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class Inotify:
+    """
+    Minimal recursive inotify watcher over libc
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths: Dict[int, str] = {}
+
+    def add_watch(self, path: str) -> None:
+        """
+        Raises OSError (e.g. ENOSPC when fs.inotify.max_user_watches is reached)
+        """
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch({path}): {os.strerror(errno)}")
+        self.paths[wd] = path
+
+    def read(self, timeout: float) -> List[Tuple[str, int]]:
+        """
+        Returns: (path, mask) per event, waiting up to timeout seconds.
+        A path of None with IN_Q_OVERFLOW means events were lost.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, pos)
+            pos += self._EVENT.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+            pos += length
+            directory = self.paths.get(wd)
+            if mask & self.IN_Q_OVERFLOW or directory is None:
+                events.append((None, self.IN_Q_OVERFLOW))
+            else:
+                events.append((os.path.join(directory, name), mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class Watcher:
+    """
+    Unlocks new and changed PDFs under root into output_dir.
+    password_for(rel_path) returns the password for a file, or None to skip it.
+    on_result(rel_path, status, message) is called for every file processed.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        output_dir: str,
+        manifest: Manifest,
+        password_for: Callable[[str], Optional[str]],
+        max_workers: Optional[int] = None,
+        mode: str = "fast",
+        settle: float = 2.0,
+        retry_failed: bool = False,
+        on_result: Optional[Callable[[str, str, str], None]] = None,
+        on_metrics=None,
+    ):
+        self.root = os.path.abspath(root)
+        self.output_dir = os.path.abspath(output_dir)
+        self.manifest = manifest
+        self.password_for = password_for
+        self.max_workers = max_workers
+        self.mode = mode
+        self.settle = settle
+        self.retry_failed = retry_failed
+        self.on_result = on_result
+        self.on_metrics = on_metrics
+        self._excluded = {self.output_dir, os.path.abspath(manifest.path)}
+        self._queue: Dict[str, tuple] = {}
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def _dir_key(self, directory: str) -> str:
+        rel = self._rel(directory)
+        return "" if rel == "." else rel
+
+    def _wanted(self, name: str) -> bool:
+        return name.lower().endswith(".pdf") and not name.startswith(".")
+
+    def check(self, directory: str, name: str, stat: os.stat_result, known: Optional[tuple]) -> bool:
+        """
+        Queue a file if it is new or its content changed since it was last
+        processed. Returns False if it is still being written.
+        """
+        if time.time() - stat.st_mtime < self.settle:
+            return False
+        if known is not None:
+            size, mtime_ns, sha256, status = known
+            if size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+                if status != FAILED or not self.retry_failed:
+                    return True
+        path = os.path.join(directory, name)
+        try:
+            digest = file_sha256(path)
+        except OSError:
+            # Deleted or renamed since it was listed
+            return True
+        dir_key = self._dir_key(directory)
+        if known is not None and known[2] == digest and (known[3] != FAILED or not self.retry_failed):
+            # Touched but not changed
+            self.manifest.record(dir_key, name, stat.st_size, stat.st_mtime_ns, digest, known[3])
+            return True
+        self._queue[path] = (dir_key, name, stat.st_size, stat.st_mtime_ns, digest)
+        return True
+
+    def scan(self, full: bool = False) -> bool:
+        """
+        Walk the tree, queueing new and changed files and processing them.
+        Unless full, directories whose mtime is unchanged are not checked
+        for files that went away.
+        Returns: True if every file had settled
+        """
+        settled = True
+        self.manifest.begin_scan()
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                dir_stat = os.stat(directory)
+            except OSError:
+                continue
+            dir_key = self._dir_key(directory)
+            unchanged = not full and self.manifest.dir_mtime(dir_key) == dir_stat.st_mtime_ns
+            dir_settled = True
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if os.path.abspath(entry.path) in self._excluded:
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file() and self._wanted(entry.name):
+                            if not unchanged:
+                                self.manifest.mark_seen(dir_key, entry.name)
+                            try:
+                                stat = entry.stat()
+                            except OSError:
+                                continue
+                            known = self.manifest.get(dir_key, entry.name)
+                            if not self.check(directory, entry.name, stat, known):
+                                dir_settled = False
+            except OSError:
+                continue
+            if not unchanged:
+                self.manifest.forget_unseen(dir_key)
+                if dir_settled:
+                    # Only skip this directory next time once nothing in it is pending
+                    self.manifest.set_dir_mtime(dir_key, dir_stat.st_mtime_ns)
+            settled = settled and dir_settled
+            if len(self._queue) >= BATCH_SIZE:
+                self.process()
+        self.process()
+        return settled
+
+    def check_path(self, path: str) -> None:
+        """
+        Queue a single file reported by inotify
+        """
+        directory, name = os.path.split(path)
+        if not self._wanted(name):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        # Closed after writing, so it does not need to settle
+        settle, self.settle = self.settle, 0
+        try:
+            self.check(directory, name, stat, self.manifest.get(self._dir_key(directory), name))
+        finally:
+            self.settle = settle
+
+    def process(self) -> None:
+        """
+        Unlock everything queued
+        """
+        queued, self._queue = self._queue, {}
+        jobs = []
+        entries = []
+        for path, (dir_key, name, size, mtime_ns, digest) in queued.items():
+            rel_path = f"{dir_key}/{name}" if dir_key else name
+            try:
+                info = triage_pdf_path(path)
+            except OSError:
+                # Gone since it was queued; a later scan picks it up if it comes back
+                continue
+            password = self.password_for(rel_path)
+            if info.status in (NOT_ENCRYPTED, UNSUPPORTED, UNREADABLE):
+                self._finish(rel_path, (dir_key, name, size, mtime_ns, digest), SKIPPED, info.message)
+            elif password is None and info.status != OWNER_ONLY:
+                self._finish(rel_path, (dir_key, name, size, mtime_ns, digest), SKIPPED, "No password provided")
+            else:
+                output = os.path.join(self.output_dir, rel_path)
+                jobs.append((path, output, password or ""))
+                entries.append((rel_path, (dir_key, name, size, mtime_ns, digest)))
+
+        def on_result(index, result):
+            success, message = result
+            rel_path, row = entries[index]
+            self._finish(rel_path, row, DONE if success else FAILED, message)
+
+        def on_metrics(index, metrics):
+            metrics.filename = entries[index][0]
+            if self.on_metrics is not None:
+                self.on_metrics(metrics)
+
+        unlock_files(jobs, max_workers=self.max_workers, on_result=on_result, on_metrics=on_metrics, mode=self.mode)
+        self.manifest.commit()
+
+    def _finish(self, rel_path: str, row: tuple, status: str, message: str) -> None:
+        dir_key, name, size, mtime_ns, digest = row
+        self.manifest.record(dir_key, name, size, mtime_ns, digest, status, message)
+        if self.on_result is not None:
+            self.on_result(rel_path, status, message)
+
+    def run(self, poll_interval: float = 5.0, use_inotify: bool = True, full_scan: bool = False,
+            should_stop: Callable[[], bool] = lambda: False) -> None:
+        """
+        Scan once, then keep unlocking new files until should_stop() is true
+        """
+        inotify = None
+        if use_inotify:
+            try:
+                inotify = Inotify()
+                self._watch_tree(inotify, self.root)
+            except OSError as e:
+                print(f"inotify unavailable ({e}); polling every {poll_interval}s", file=sys.stderr)
+                if inotify is not None:
+                    inotify.close()
+                inotify = None
+
+        settled = self.scan(full=full_scan)
+        # Failed files are retried once per start, not on every scan
+        self.retry_failed = False
+        try:
+            while not should_stop():
+                if inotify is None:
+                    time.sleep(poll_interval)
+                    settled = self.scan()
+                    continue
+                events = inotify.read(poll_interval)
+                rescan = not settled
+                for path, mask in events:
+                    if path is None:
+                        rescan = True
+                    elif mask & Inotify.IN_ISDIR:
+                        if os.path.abspath(path) not in self._excluded:
+                            # Files may have landed before the watch existed
+                            self._watch_tree(inotify, path)
+                            rescan = True
+                    elif mask & (Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO):
+                        self.check_path(path)
+                if rescan:
+                    settled = self.scan()
+                else:
+                    self.process()
+        finally:
+            if inotify is not None:
+                inotify.close()
+            self.manifest.commit()
+
+    def _watch_tree(self, inotify: Inotify, top: str) -> None:
+        for directory, dirs, _ in os.walk(top):
+            dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(directory, d)) not in self._excluded]
+            inotify.add_watch(directory)
+
+def triage_pdf_path(path: str):
+    with open(path, "rb") as f:
+        return triage_pdf(f)
@@ -0,0 +1,399 @@
+"""
+Spool-directory work queue for unlocking across many processes and hosts.
+
+Jobs (an input path, an output path and a password reference) are small
+JSON files under a queue directory that every worker can reach, e.g. on a
+shared filesystem. Workers claim a job by renaming it, which only one of
+them can do, and hold it under a lease they renew while unlocking. A job
+whose lease runs out (its worker died or lost the filesystem) is put back
+and retried, up to a maximum number of attempts. A worker that finds its
+lease gone when it finishes throws its result away rather than publishing
+it over the new holder's output.
+
+    QUEUE_DIR/
+      pending/<shard>/<id>.json     waiting, spread over shards
+      claimed/<id>@<worker>.json    being unlocked; mtime is the lease start
+      done/<shard>/<id>.json        finished, with the result
+      failed/<shard>/<id>.json      gave up, with the last error
+      workers/<worker>.json         per-worker counters for `stats`
+
+Passwords are never written to the queue. A job carries a reference that
+each worker resolves: "env:NAME" (an environment variable), "file:PATH"
+(first line of a file) or "map:PATH" (a password mapping file, see
+passwords.load_password_map, looked up by the job's relative path).
+"""
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from unlocker import unlock_pdf_file
+
+# Default lease; workers renew it every LEASE_SECONDS / 3 while unlocking
+LEASE_SECONDS = 60.0
+MAX_ATTEMPTS = 3
+# Hex digits of the job ID used as the shard directory name
+SHARD_DIGITS = 1
+
+@dataclass
+class QueueJob:
+    input: str
+    output: str
+    password_ref: str
+    rel_path: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    attempts: int = 0
+    enqueued: float = field(default_factory=time.time)
+    error: str = ""
+    result: Optional[dict] = None
+
+    @property
+    def shard(self) -> str:
+        return self.id[:SHARD_DIGITS]
+
+@dataclass
+class Claim:
+    job: QueueJob
+    path: str
+    worker: str
+
+def _write_json(path: str, data: dict) -> None:
+    # Write then rename, so readers on other hosts never see half a file
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _read_json(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def resolve_password(job: QueueJob, cache: Optional[dict] = None) -> str:
+    """
+    Turn a job's password reference into the password.
+    cache keeps loaded mapping files between jobs.
+    """
+    kind, _, value = job.password_ref.partition(":")
+    if kind == "env":
+        if value not in os.environ:
+            raise ValueError(f"environment variable {value} is not set")
+        return os.environ[value]
+    if kind == "file":
+        with open(value, "r", encoding="utf-8") as f:
+            return f.readline().rstrip("\r\n")
+    if kind == "map":
+        from passwords import load_password_map, password_for
+
+        cache = cache if cache is not None else {}
+        if value not in cache:
+            cache[value] = load_password_map(value)
+        password = password_for(job.rel_path, cache[value])
+        if password is None:
+            raise ValueError(f"no password for {job.rel_path} in {value}")
+        return password
+    raise ValueError(f"Unknown password reference: {job.password_ref}")
+
+class SpoolQueue:
+    def __init__(self, root: str):
+        self.root = root
+        for name in ("pending", "claimed", "done", "failed", "workers"):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    def _dir(self, state: str, shard: str = "") -> str:
+        path = os.path.join(self.root, state, shard)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def enqueue(self, jobs: Iterable[QueueJob]) -> int:
+        count = 0
+        for job in jobs:
+            _write_json(os.path.join(self._dir("pending", job.shard), f"{job.id}.json"), asdict(job))
+            count += 1
+        return count
+
+    def _shards(self, state: str) -> List[str]:
+        try:
+            return sorted(entry.name for entry in os.scandir(os.path.join(self.root, state)) if entry.is_dir())
+        except FileNotFoundError:
+            return []
+
+    def claim(self, worker: str) -> Optional[Claim]:
+        """
+        Take the next pending job, or None if there is none.
+        Workers start at different shards so they rarely race for the same file.
+        """
+        shards = self._shards("pending")
+        if not shards:
+            return None
+        start = hash(worker) % len(shards)
+        for shard in shards[start:] + shards[:start]:
+            with os.scandir(os.path.join(self.root, "pending", shard)) as it:
+                names = [entry.name for entry in it if entry.name.endswith(".json")]
+            for name in names:
+                job_id = name[:-len(".json")]
+                claimed = os.path.join(self.root, "claimed", f"{job_id}@{worker}.json")
+                try:
+                    os.rename(os.path.join(self.root, "pending", shard, name), claimed)
+                except FileNotFoundError:
+                    continue  # another worker got it first
+                # The rename keeps the old mtime; the lease starts now
+                os.utime(claimed)
+                return Claim(QueueJob(**_read_json(claimed)), claimed, worker)
+        return None
+
+    def renew(self, claim: Claim) -> bool:
+        """
+        Extend the lease. Returns False if the job was taken back.
+        """
+        try:
+            os.utime(claim.path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, claim: Claim, result: dict) -> None:
+        claim.job.result = result
+        self._finish(claim, "done")
+
+    def fail(self, claim: Claim, error: str, max_attempts: int = MAX_ATTEMPTS, retry: bool = True) -> None:
+        """
+        Record an error; the job goes back to pending unless it is out of
+        attempts or retry is False.
+        """
+        claim.job.attempts += 1
+        claim.job.error = error
+        if retry and claim.job.attempts < max_attempts:
+            self._finish(claim, "pending")
+        else:
+            self._finish(claim, "failed")
+
+    def _finish(self, claim: Claim, state: str) -> None:
+        if not os.path.exists(claim.path):
+            # Lease expired and another worker has the job now
+            return
+        _write_json(os.path.join(self._dir(state, claim.job.shard), f"{claim.job.id}.json"), asdict(claim.job))
+        try:
+            os.remove(claim.path)
+        except FileNotFoundError:
+            pass
+
+    def reap(self, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS) -> int:
+        """
+        Put back jobs whose lease ran out.
+        Returns: how many were put back (or failed for good)
+        """
+        now = time.time()
+        reaped = 0
+        claimed_dir = os.path.join(self.root, "claimed")
+        expired = []
+        with os.scandir(claimed_dir) as it:
+            for entry in it:
+                try:
+                    if entry.name.endswith(".json") and now - entry.stat().st_mtime > lease_seconds:
+                        expired.append(entry.path)
+                except FileNotFoundError:
+                    continue  # finished meanwhile
+        for path in expired:
+            # Renaming first makes sure only one worker reaps each job
+            reaping = f"{path}.reaping-{uuid.uuid4().hex[:8]}"
+            try:
+                os.rename(path, reaping)
+            except FileNotFoundError:
+                continue
+            job = QueueJob(**_read_json(reaping))
+            job.attempts += 1
+            job.error = f"lease expired (worker {os.path.basename(path)[len(job.id) + 1:-len('.json')]})"
+            state = "pending" if job.attempts < max_attempts else "failed"
+            _write_json(os.path.join(self._dir(state, job.shard), f"{job.id}.json"), asdict(job))
+            os.remove(reaping)
+            reaped += 1
+        return reaped
+
+    def _count(self, state: str) -> int:
+        total = 0
+        for shard in self._shards(state):
+            with os.scandir(os.path.join(self.root, state, shard)) as it:
+                total += sum(1 for entry in it if entry.name.endswith(".json"))
+        return total
+
+    def failures(self, limit: int = 20) -> List[QueueJob]:
+        jobs = []
+        for shard in self._shards("failed"):
+            with os.scandir(os.path.join(self.root, "failed", shard)) as it:
+                for entry in it:
+                    if entry.name.endswith(".json") and len(jobs) < limit:
+                        jobs.append(QueueJob(**_read_json(entry.path)))
+        return jobs
+
+    def write_worker_stats(self, worker: str, stats: dict) -> None:
+        _write_json(os.path.join(self.root, "workers", f"{worker}.json"), stats)
+
+    def in_flight(self) -> int:
+        with os.scandir(os.path.join(self.root, "claimed")) as it:
+            return sum(1 for entry in it if entry.name.endswith(".json"))
+
+    def stats(self) -> dict:
+        workers = []
+        with os.scandir(os.path.join(self.root, "workers")) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    try:
+                        workers.append(_read_json(entry.path))
+                    except (OSError, ValueError):
+                        continue
+        return {
+            "pending": self._count("pending"),
+            "claimed": self.in_flight(),
+            "done": self._count("done"),
+            "failed": self._count("failed"),
+            "workers": sorted(workers, key=lambda w: w["worker"]),
+        }
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def run_worker(
+    queue: SpoolQueue,
+    worker: Optional[str] = None,
+    lease_seconds: float = LEASE_SECONDS,
+    max_attempts: int = MAX_ATTEMPTS,
+    mode: str = "fast",
+    poll_seconds: float = 1.0,
+    exit_when_empty: bool = False,
+    on_result: Optional[Callable[[QueueJob, bool, str], None]] = None,
+    should_stop: Callable[[], bool] = lambda: False,
+) -> Dict[str, float]:
+    """
+    Claim and unlock jobs until should_stop() is true (or, with
+    exit_when_empty, until nothing is pending or claimed).
+    Returns: this worker's counters
+    """
+    worker = worker or default_worker_id()
+    passwords = {}
+    stats = {
+        "worker": worker,
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "started": time.time(),
+        "last_seen": time.time(),
+        "done": 0,
+        "failed": 0,
+        "errors": 0,
+        "lost": 0,
+        "bytes_in": 0,
+        "busy_seconds": 0.0,
+    }
+    queue.write_worker_stats(worker, stats)
+    last_reap = 0.0
+    while not should_stop():
+        if time.time() - last_reap > lease_seconds / 3:
+            queue.reap(lease_seconds, max_attempts)
+            last_reap = time.time()
+        claim = queue.claim(worker)
+        if claim is None:
+            if exit_when_empty and queue.in_flight() == 0:
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        # Keep the lease while this job runs
+        running = threading.Event()
+        lost = threading.Event()
+        def heartbeat():
+            while not running.wait(lease_seconds / 3):
+                if not queue.renew(claim):
+                    lost.set()
+                    return
+
+        def keep() -> bool:
+            # Renewing also restarts the lease, so the job cannot be reaped
+            # between this check and the rename that publishes the output
+            if lost.is_set() or not queue.renew(claim):
+                lost.set()
+                return False
+            return True
+        renewer = threading.Thread(target=heartbeat, daemon=True)
+        renewer.start()
+
+        started = time.perf_counter()
+        job = claim.job
+        try:
+            password = resolve_password(job, passwords)
+            os.makedirs(os.path.dirname(job.output) or ".", exist_ok=True)
+            success, message = unlock_pdf_file(job.input, job.output, password, mode=mode, keep=keep)
+        except (OSError, ValueError) as e:
+            success, message = None, str(e)
+        finally:
+            running.set()
+            renewer.join()
+        elapsed = time.perf_counter() - started
+
+        stats["busy_seconds"] += elapsed
+        if lost.is_set() or not queue.renew(claim):
+            # The lease ran out and the job was put back; whoever has it now
+            # reports it, and this worker's output (if any) was not kept
+            stats["lost"] += 1
+            success, message = False, "lease expired, result discarded"
+        elif success:
+            stats["done"] += 1
+            try:
+                stats["bytes_in"] += os.path.getsize(job.input)
+            except OSError:
+                pass
+            queue.complete(claim, {"worker": worker, "seconds": round(elapsed, 4), "message": message})
+        elif success is None:
+            # Could not read the input or password; maybe a transient error
+            stats["errors"] += 1
+            queue.fail(claim, message, max_attempts)
+        else:
+            # A wrong password or damaged PDF fails the same way every time
+            stats["failed"] += 1
+            queue.fail(claim, message, retry=False)
+        stats["last_seen"] = time.time()
+        queue.write_worker_stats(worker, stats)
+        if on_result is not None:
+            on_result(job, bool(success), message)
+    stats["last_seen"] = time.time()
+    queue.write_worker_stats(worker, stats)
+    return stats
+
+def _worker_process(root: str, kwargs: dict) -> None:
+    stop = threading.Event()
+    # Finish the current job, then exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    run_worker(SpoolQueue(root), should_stop=stop.is_set, **kwargs)
+
+def run_workers(root: str, processes: int, **kwargs) -> None:
+    """
+    Run several workers on this host, each in its own process, until they
+    exit (see run_worker's exit_when_empty) or this process is told to stop
+    """
+    children = [
+        multiprocessing.Process(target=_worker_process, args=(root, kwargs), daemon=False)
+        for _ in range(max(1, processes))
+    ]
+    for child in children:
+        child.start()
+
+    def forward(signum, frame):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+
+    previous = signal.signal(signal.SIGTERM, forward)
+    try:
+        for child in children:
+            while child.is_alive():
+                try:
+                    child.join()
+                except KeyboardInterrupt:
+                    forward(signal.SIGINT, None)
+    finally:
+        signal.signal(signal.SIGTERM, previous)